@@ -1,19 +1,48 @@
 import streamlit as st
 import pandas as pd
 import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
 
 from core.table_loader import load_uploaded_tables
+from core.llm_cache import clear_llm_cache, llm_cache_info
+from core.table_cache import clear_table_cache, table_cache_info
+from core.table_store import share_table, table_store_info
 from core.join_key_detector import suggest_join_keys_for_pair
+from core.join_graph import discover_join_graph, profile_tables
 from core.merger import merge_tables_with_rules
-from core.ai_mapping_engine import build_initial_mapping_df
-from core.llm_transform import generate_transform_code_with_llm
-from core.transformer_runner import apply_transform_code
+from core.join_planner import JoinTooLargeError
+from core.ai_mapping_engine import build_mapping_candidates
+from core.llm_transform import build_prompt_samples, generate_transform_code_with_llm
+from core.candidate_search import search_transform_candidates
+from core.transformer_runner import (
+    apply_transform_code,
+    apply_transform_df_code,
+    check_transform_equivalence,
+    code_hash,
+    load_transform,
+)
+from core.mapping_compiler import compile_mapping, apply_mapping_vectorized
+from core.mapping_editor import (
+    MAPPING_FILTERS,
+    apply_mapping_edits,
+    filter_mapping_rows,
+    page_bounds,
+    record_mapping_edit,
+)
+from core.pipeline import Pipeline
+from core.chunked_runner import run_transform_chunked
+from core.template_matcher import rank_templates
 from core.template_manager import (
     list_templates,
     save_template,
     load_template,
+    check_template_compatibility,
 )
-from utils.data_preview import df_to_sample_csv
+from utils.instrumentation import bind_run, clear_records, profiled, records_jsonl, run_report, start_run
 from utils.logger import log
 
 
@@ -29,42 +58,143 @@ if "join_rules" not in st.session_state:
 if "merged_df" not in st.session_state:
     st.session_state.merged_df = None
 if "mapping_df" not in st.session_state:
-    st.session_state.mapping_df = None
+    st.session_state.mapping_df = None  # effective mapping: mapping_base with mapping_edits applied
+if "mapping_base" not in st.session_state:
+    st.session_state.mapping_base = None  # auto-guessed (or template) mapping
+if "mapping_edits" not in st.session_state:
+    st.session_state.mapping_edits = {}  # target_column -> {source_column, expression}
+if "mapping_version" not in st.session_state:
+    st.session_state.mapping_version = 0  # bumped with every new base, so editor widgets start fresh
 if "transform_code" not in st.session_state:
     st.session_state.transform_code = ""
+if "transform_df_code" not in st.session_state:
+    st.session_state.transform_df_code = ""
+if "transform_df_check" not in st.session_state:
+    st.session_state.transform_df_check = None  # (row code hash, df code hash, equivalent, message)
 if "template_loaded" not in st.session_state:
     st.session_state.template_loaded = None
 if "skip_merge" not in st.session_state:
     st.session_state.skip_merge = False
 if "d_sample_df" not in st.session_state:
     st.session_state.d_sample_df = None
+if "pipeline" not in st.session_state:
+    st.session_state.pipeline = Pipeline()  # memoized stages, see core/pipeline.py
+
+pipeline = st.session_state.pipeline
+
+# Stages recorded on this session's script thread are tagged with its run id.
+if "run_id" not in st.session_state:
+    st.session_state.run_id = start_run()
+start_run(st.session_state.run_id)
+if "last_profile" not in st.session_state:
+    st.session_state.last_profile = {}  # {"profile": text report of the last profiled action}
+
+
+def _set_mapping_base(mapping_df: pd.DataFrame):
+    """Start editing from a new mapping (auto-guess or template); earlier edits are dropped."""
+    st.session_state.mapping_base = mapping_df
+    st.session_state.mapping_edits = {}
+    st.session_state.mapping_version += 1
+    st.session_state.mapping_df = mapping_df
+
+
+def _run_stoppable(on_tick, fn, *args, **kwargs):
+    """
+    fn(*args, cancel_event=..., **kwargs) on a worker thread, while this
+    script thread calls on_tick(elapsed_seconds) a few times per second.
+    Pressing "Stop generation" reruns the script, which interrupts on_tick;
+    the event is then set so the model calls stop and drop their connections.
+    """
+    cancel_event = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=1)
+    future = pool.submit(bind_run(fn), *args, cancel_event=cancel_event, **kwargs)
+    started = time.perf_counter()
+    try:
+        while True:
+            try:
+                return future.result(timeout=0.25)
+            except FutureTimeout:
+                on_tick(time.perf_counter() - started)
+    finally:
+        if not future.done():
+            cancel_event.set()
+        pool.shutdown(wait=False)
+
+
+def _record_df_check():
+    """Compare transform_df(df) with transform(row) on a sample and remember the verdict per code version."""
+    row_code = st.session_state.transform_code
+    df_code = st.session_state.transform_df_code
+    equivalent, message = check_transform_equivalence(row_code, df_code, st.session_state.merged_df)
+    st.session_state.transform_df_check = (code_hash(row_code), code_hash(df_code), equivalent, message)
+
+
+def _df_code_verified() -> bool:
+    check = st.session_state.transform_df_check
+    return bool(
+        check
+        and st.session_state.transform_df_code
+        and check[0] == code_hash(st.session_state.transform_code)
+        and check[1] == code_hash(st.session_state.transform_df_code)
+        and check[2]
+    )
 
 
 # ---------- Step 0: Template load / save ----------
 st.sidebar.header("Templates")
 
+def _load_template_into_session(tpl_name: str):
+    """Load a saved template into the session and check it against the uploaded tables."""
+    (
+        join_rules,
+        mapping_df,
+        transform_code,
+        metadata,
+    ) = load_template(tpl_name)
+    st.session_state.join_rules = join_rules
+    _set_mapping_base(mapping_df)
+    st.session_state.transform_code = transform_code
+    st.session_state.transform_df_code = metadata.get("transform_df_code", "")
+    st.session_state.transform_df_check = (
+        (
+            code_hash(transform_code),
+            code_hash(st.session_state.transform_df_code),
+            True,
+            "Verified when the template was saved.",
+        )
+        if metadata.get("transform_df_verified")
+        else None
+    )
+    st.session_state.template_loaded = tpl_name
+    st.success(f"Template '{tpl_name}' loaded (join rules & mapping & code).")
+    if st.session_state.tables:
+        compat = check_template_compatibility(tpl_name, st.session_state.tables)
+        if not compat["compatible"]:
+            problems = [f"table '{t}' is not uploaded" for t in compat["missing_tables"]]
+            problems += [f"'{t}' lacks {', '.join(cols)}" for t, cols in compat["missing_columns"].items()]
+            st.warning("Template does not fit the uploaded tables: " + "; ".join(problems))
+        elif compat["checked"] and compat["exact"]:
+            st.caption("Uploaded tables match the template's schema exactly.")
+    # Compile once now; later runs reuse the cached transform.
+    if transform_code.strip():
+        _, code_error = load_transform(transform_code)
+        if code_error:
+            st.warning(f"Template transform code does not load: {code_error}")
+
+
 with st.sidebar.expander("Load Template", expanded=True):
+    template_suggestions_box = st.container()
     templates = list_templates()
     if templates:
         tpl_name = st.selectbox("Available templates", ["<None>"] + templates)
         if tpl_name != "<None>":
             if st.button("Load Selected Template"):
-                (
-                    join_rules,
-                    mapping_df,
-                    transform_code,
-                    metadata,
-                ) = load_template(tpl_name)
-                st.session_state.join_rules = join_rules
-                st.session_state.mapping_df = mapping_df
-                st.session_state.transform_code = transform_code
-                st.session_state.template_loaded = tpl_name
-                st.success(f"Template '{tpl_name}' loaded (join rules & mapping & code).")
+                _load_template_into_session(tpl_name)
     else:
         st.caption("No templates yet. Save one after you finish configuration.")
 
 with st.sidebar.expander("Save Template"):
-    tpl_save_name = st.text_input("Template name (folder name under /templates)")
+    tpl_save_name = st.text_input("Template name (saved as /templates/<name>.tpl.json)")
     if st.button("Save current configuration as template"):
         if not tpl_save_name.strip():
             st.error("Please enter a template name.")
@@ -75,15 +205,79 @@ with st.sidebar.expander("Save Template"):
         elif not st.session_state.transform_code.strip():
             st.error("Please generate transform code before saving a template.")
         else:
+            tpl_metadata = {"note": "Auto-saved by AI Table Merger & Transformer"}
+            if st.session_state.transform_df_code.strip():
+                tpl_metadata["transform_df_code"] = st.session_state.transform_df_code
+                tpl_metadata["transform_df_verified"] = _df_code_verified()
             save_template(
                 tpl_save_name.strip(),
                 join_rules=st.session_state.join_rules,
                 mapping_df=st.session_state.mapping_df,
                 transform_code=st.session_state.transform_code,
-                metadata={"note": "Auto-saved by AI Table Merger & Transformer"},
+                metadata=tpl_metadata,
+                tables=st.session_state.tables,
             )
             st.success(f"Template '{tpl_save_name.strip()}' saved.")
 
+with st.sidebar.expander("Table cache"):
+    cache_info = table_cache_info()
+    st.caption(
+        f"{cache_info['entries']} parsed table(s), "
+        f"{cache_info['bytes'] / 1e6:,.1f} / {cache_info['max_bytes'] / 1e6:,.0f} MB on disk"
+    )
+    store_info = table_store_info()
+    st.caption(
+        f"Shared across sessions: {store_info['resident']} of {store_info['entries']} table(s) in memory, "
+        f"{store_info['bytes'] / 1e6:,.1f} / {store_info['max_bytes'] / 1e6:,.0f} MB, "
+        f"{store_info['refs']} handle(s) in use"
+    )
+    if st.button("Clear table cache"):
+        clear_table_cache()
+        st.success("Table cache cleared.")
+
+with st.sidebar.expander("LLM response cache"):
+    llm_info = llm_cache_info()
+    st.caption(f"{llm_info['entries']} cached response(s), {llm_info['bytes'] / 1e3:,.1f} KB on disk")
+    if st.button("Clear LLM cache"):
+        clear_llm_cache()
+        st.success("LLM response cache cleared.")
+
+with st.sidebar.expander("Run report"):
+    st.caption("Per-stage wall time, rows and memory in this session (as of the previous rerun).")
+    report_df = run_report(st.session_state.run_id)
+    if report_df.empty:
+        st.caption("Nothing recorded yet.")
+    else:
+        st.dataframe(report_df.round(3))
+        st.download_button(
+            "Download stage records (JSON lines)",
+            data=records_jsonl(st.session_state.run_id),
+            file_name="run_report.jsonl",
+            mime="application/x-ndjson",
+        )
+        if st.button("Clear run report"):
+            clear_records(st.session_state.run_id)
+    st.checkbox(
+        "Trace memory peaks (tracemalloc; process-wide, slows every session)",
+        key="instr_trace_memory",
+        on_change=lambda: start_run(st.session_state.run_id, trace_memory=st.session_state.instr_trace_memory),
+    )
+    profile_kind = st.selectbox(
+        "Profile the next merge / Step 5 run",
+        ["off", "cprofile", "pyinstrument"],
+        help="pyinstrument needs `pip install pyinstrument`.",
+    )
+    profile_kind = None if profile_kind == "off" else profile_kind
+    if st.session_state.last_profile.get("profile"):
+        st.code(st.session_state.last_profile["profile"][:20_000], language="text")
+
+with st.sidebar.expander("Pipeline cache"):
+    st.caption("Per-stage cache hits / misses in this session (as of the previous rerun).")
+    st.dataframe(pd.DataFrame(pipeline.stats()).set_index("stage"))
+    if st.button("Clear pipeline cache"):
+        pipeline.clear()
+        st.success("Pipeline cache cleared.")
+
 
 st.markdown("---")
 
@@ -96,9 +290,38 @@ uploaded_files = st.file_uploader(
     accept_multiple_files=True,
 )
 
+with st.expander("Loading options (large files)"):
+    compact_load = st.checkbox(
+        "Memory-compact loading (infer dtypes from a sample, downcast numbers, category / Arrow strings)",
+        value=False,
+    )
+    load_chunksize = st.number_input(
+        "Read CSVs in chunks of N rows (0 = read at once)", min_value=0, value=0, step=50_000
+    )
+
+def _load_tables(files, compact, chunksize):
+    load_stats = {}
+    tables = load_uploaded_tables(files, compact=compact, chunksize=chunksize, stats=load_stats, use_cache=True)
+    return tables, load_stats
+
+
 if uploaded_files:
-    tables = load_uploaded_tables(uploaded_files)
+    tables, load_stats = pipeline.run(
+        "upload", _load_tables, uploaded_files, compact_load, int(load_chunksize) or None
+    )
     st.session_state.tables = tables
+    st.session_state.load_stats = load_stats
+
+if st.session_state.tables:
+    # Filled here, after the uploads are parsed, so suggestions are never a rerun behind.
+    suggestions = rank_templates(st.session_state.tables)
+    if suggestions:
+        with template_suggestions_box:
+            st.markdown("**Suggested for the uploaded tables**")
+            for sug in suggestions:
+                label = f"{sug['name']} — {sug['score']:.0%} match" + ("" if sug["compatible"] else " (columns missing)")
+                if st.button(label, key=f"suggested_tpl_{sug['name']}"):
+                    _load_template_into_session(sug["name"])
 
 if not st.session_state.tables:
     st.info("Please upload at least one table to continue.")
@@ -107,6 +330,12 @@ if not st.session_state.tables:
 st.subheader("Preview Uploaded Tables")
 for name, df in st.session_state.tables.items():
     st.markdown(f"**Table: {name}** — Columns: {list(df.columns)}")
+    tbl_stats = st.session_state.get("load_stats", {}).get(name)
+    if tbl_stats:
+        st.caption(
+            f"{tbl_stats['rows']:,} rows — {tbl_stats['bytes_after'] / 1e6:,.1f} MB in memory"
+            f" (saved {tbl_stats['bytes_saved'] / 1e6:,.1f} MB)"
+        )
     st.dataframe(df.head())
 
 table_names = list(st.session_state.tables.keys())
@@ -156,7 +385,7 @@ if skip_merge_checkbox:
         else:
             merged_direct_df = pd.read_csv(merged_direct_file)
 
-        st.session_state.merged_df = merged_direct_df
+        st.session_state.merged_df = share_table(merged_direct_df)
         st.success("Merged table uploaded and will be used as the base table.")
         st.subheader("Uploaded Merged Table Preview")
         st.dataframe(merged_direct_df.head())
@@ -175,6 +404,36 @@ if not st.session_state.skip_merge:
     if "join_rules" not in st.session_state or st.session_state.join_rules is None:
         st.session_state.join_rules = []
 
+    if len(table_names) > 2:
+        with st.expander("Discover joins across all uploaded tables"):
+            st.caption(
+                "Profiles every table once, scores all table pairs and proposes a spanning join order "
+                "starting from the largest table."
+            )
+            if st.button("Discover join graph"):
+                profiles = pipeline.run("profile", profile_tables, st.session_state.tables)
+                st.session_state.join_graph = pipeline.run(
+                    "join_suggest", discover_join_graph, st.session_state.tables, profiles=profiles
+                )
+
+            join_graph = st.session_state.get("join_graph")
+            if join_graph:
+                if join_graph["edges"]:
+                    st.markdown("**Ranked table links (best key pair per table pair):**")
+                    st.dataframe(pd.DataFrame(join_graph["edges"]))
+                else:
+                    st.caption("No confident links found between the uploaded tables.")
+                if join_graph["join_rules"]:
+                    st.markdown("**Suggested join order:**")
+                    for idx, jr in enumerate(join_graph["join_rules"]):
+                        st.write(
+                            f"{idx+1}. {jr['left_table']}.{jr['left_key']} LEFT JOIN "
+                            f"{jr['right_table']}.{jr['right_key']}"
+                        )
+                    if st.button("Use suggested join order as join rules"):
+                        st.session_state.join_rules = [dict(jr) for jr in join_graph["join_rules"]]
+                        st.success("Join rules replaced with the suggested join order.")
+
     # UI to add/edit join rules
     new_join_expander = st.expander("Add / Edit Join Rules", expanded=True)
 
@@ -208,7 +467,9 @@ if not st.session_state.skip_merge:
         left_df = st.session_state.tables[left_table_sel]
         right_df = st.session_state.tables[right_table_sel]
 
-        suggestions = suggest_join_keys_for_pair(left_df, left_table_sel, right_df, right_table_sel)
+        suggestions = pipeline.run(
+            "join_suggest", suggest_join_keys_for_pair, left_df, left_table_sel, right_df, right_table_sel
+        )
         suggestion_text = (
             ", ".join(
                 [
@@ -245,11 +506,62 @@ if not st.session_state.skip_merge:
             st.success("All join rules cleared.")
 
     # Perform merge preview
+    max_merge_rows = st.number_input(
+        "Abort merge if a join is estimated above N rows (0 = no limit)",
+        min_value=0,
+        value=20_000_000,
+        step=1_000_000,
+    )
+    merge_engine = st.selectbox(
+        "Merge engine",
+        ["pandas", "duckdb"],
+        help="duckdb runs all join rules as one parallel SQL query that can spill to disk "
+        "(requires `pip install duckdb`). It does not keep the pandas row order.",
+    )
+    def _merge_tables(tables, join_rules, max_output_rows, engine):
+        merge_plan = {}
+        merged = merge_tables_with_rules(
+            tables,
+            join_rules,
+            optimize=True,
+            max_output_rows=max_output_rows,
+            report=merge_plan,
+            engine=engine,
+            use_memo=True,
+        )
+        # Sessions merging the same tables the same way share one copy.
+        return share_table(merged), merge_plan
+
     if st.button("Merge Tables with Current Join Rules"):
         if not st.session_state.join_rules:
             st.error("No join rules defined. Please define at least one.")
         else:
-            merged_df = merge_tables_with_rules(st.session_state.tables, st.session_state.join_rules)
+            merge_plan = {}
+            try:
+                with profiled(profile_kind, report=st.session_state.last_profile):
+                    merged_df, merge_plan = pipeline.run(
+                        "merge",
+                        _merge_tables,
+                        st.session_state.tables,
+                        st.session_state.join_rules,
+                        int(max_merge_rows) or None,
+                        merge_engine,
+                    )
+            except JoinTooLargeError as e:
+                merged_df = None
+                st.error(f"Merge aborted: {e}")
+            except RuntimeError as e:
+                merged_df = None
+                st.error(str(e))
+            for warning in merge_plan.get("warnings", []):
+                st.warning(warning)
+            if merge_plan.get("steps"):
+                st.caption(
+                    "Join plan: "
+                    + " → ".join(
+                        f"{s['rule']['right_table']} (~{s['estimated_rows']:,} rows)" for s in merge_plan["steps"]
+                    )
+                )
             if merged_df is None:
                 st.error("Merge failed. Please check join rules.")
             else:
@@ -290,8 +602,9 @@ if d_sample_file:
 
     if st.button("Auto-Guess Mapping (no LLM, heuristic)"):
         merged_df = st.session_state.merged_df
-        mapping_df = build_initial_mapping_df(merged_df, d_sample_df)
-        st.session_state.mapping_df = mapping_df
+        mapping_df, mapping_alternatives = pipeline.run("mapping", build_mapping_candidates, merged_df, d_sample_df)
+        _set_mapping_base(mapping_df)
+        st.session_state.mapping_alternatives = mapping_alternatives
         st.success("Initial mapping guessed. You can adjust it below.")
 
 # ---- guard: ensure mapping_df is ready ----
@@ -330,52 +643,116 @@ if selected_expr != "(Select a template)":
 
 st.subheader("Edit Column Mapping")
 st.caption(
-    "For each target column, choose a source column from merged table or leave empty and/or add an expression."
+    "For each target column, choose a source column from merged table or leave empty and/or add an expression. "
+    "Edits are kept as changes to the auto-guessed mapping; search and page through wide targets."
 )
 
-merged_columns = list(st.session_state.merged_df.columns)
-mapping_df = mapping_df_state.copy()
+if st.session_state.mapping_base is None:
+    _set_mapping_base(mapping_df_state)
 
+# Widget changes inside a fragment rerun only the fragment, not the whole app.
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda fn: fn)
 
-editable_rows = []
-for idx, row in mapping_df.iterrows():
-    st.markdown(f"**Target column: `{row['target_column']}`**")
-    c1, c2 = st.columns([2, 3])
-    with c1:
-        source_choice = st.selectbox(
-            "Source column (optional)",
-            ["<None>"] + merged_columns,
-            index=(merged_columns.index(row["source_column"]) + 1) if row["source_column"] in merged_columns else 0,
-            key=f"map_source_{idx}",
-        )
-    with c2:
-        expr = st.text_input(
-            "Custom expression (optional, Python using row[...] )",
-            value=row.get("expression", "") or "",
-            key=f"map_expr_{idx}",
-        )
-    editable_rows.append(
-        {
-            "target_column": row["target_column"],
-            "source_column": None if source_choice == "<None>" else source_choice,
-            "expression": expr.strip() or None,
-        }
+
+def _on_mapping_edit(target: str, source_key: str, expr_key: str):
+    source = st.session_state[source_key]
+    record_mapping_edit(
+        st.session_state.mapping_base,
+        st.session_state.mapping_edits,
+        target,
+        None if source == "<None>" else source,
+        st.session_state[expr_key],
     )
+    st.session_state.mapping_df = apply_mapping_edits(st.session_state.mapping_base, st.session_state.mapping_edits)
+
+
+@_fragment
+def _mapping_editor():
+    edits = st.session_state.mapping_edits
+    merged_columns = list(st.session_state.merged_df.columns)
+    mapping_alternatives = st.session_state.get("mapping_alternatives", {})
+
+    f1, f2, f3 = st.columns([3, 3, 1])
+    with f1:
+        query = st.text_input("Search target / source columns", key="map_query")
+    with f2:
+        row_filter = st.radio("Show", MAPPING_FILTERS, horizontal=True, key="map_filter")
+    with f3:
+        page_size = st.selectbox("Rows per page", [10, 25, 50, 100], index=1, key="map_page_size")
+
+    if st.button(f"Reset {len(edits)} edit(s) to the auto-guessed mapping", disabled=not edits):
+        _set_mapping_base(st.session_state.mapping_base)
+        edits = st.session_state.mapping_edits
+
+    current = st.session_state.mapping_df
+    positions = filter_mapping_rows(current, query, row_filter, edits)
+    n_pages = page_bounds(len(positions), 1, page_size)[2]
+    if st.session_state.get("map_page", 1) > n_pages:
+        st.session_state.map_page = n_pages
+    page = st.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, value=1, step=1, key="map_page")
+    start, stop, _ = page_bounds(len(positions), int(page), page_size)
+    st.caption(
+        f"{len(positions)} of {len(current)} target columns match — showing {start + 1 if positions else 0}–{stop}; "
+        f"{len(edits)} edited"
+    )
+
+    version = st.session_state.mapping_version
+    for pos in positions[start:stop]:
+        row = current.iloc[pos]
+        target = row["target_column"]
+        source_key = f"map_source_{version}_{target}"
+        expr_key = f"map_expr_{version}_{target}"
+        st.markdown(f"**Target column: `{target}`**" + (" (edited)" if target in edits else ""))
+        # best-scoring candidates first, then every other merged column
+        suggested = [c for c, _ in mapping_alternatives.get(target, []) if c in merged_columns]
+        source_options = ["<None>"] + suggested + [c for c in merged_columns if c not in suggested]
+        c1, c2 = st.columns([2, 3])
+        with c1:
+            st.selectbox(
+                "Source column (optional)",
+                source_options,
+                index=source_options.index(row["source_column"]) if row["source_column"] in merged_columns else 0,
+                key=source_key,
+                on_change=_on_mapping_edit,
+                args=(target, source_key, expr_key),
+            )
+        with c2:
+            st.text_input(
+                "Custom expression (optional, Python using row[...] )",
+                value=row.get("expression", "") or "",
+                key=expr_key,
+                on_change=_on_mapping_edit,
+                args=(target, source_key, expr_key),
+            )
+
+    with st.expander("Preview of mapping"):
+        if edits:
+            st.markdown("Edited rows:")
+            st.dataframe(pd.DataFrame.from_dict(edits, orient="index"))
+        st.dataframe(st.session_state.mapping_df)
 
-mapping_df = pd.DataFrame(editable_rows)
-st.session_state.mapping_df = mapping_df
 
-st.markdown("Preview of mapping:")
-st.dataframe(mapping_df)
+_mapping_editor()
+mapping_df = st.session_state.mapping_df
 
 st.markdown("---")
 
 # ---------- Step 4: Generate transform(row) code via deepseek-coder ----------
 st.header("Step 4: Generate transform(row) Code via Local deepseek-coder (Ollama)")
 
-if st.button("Generate transform(row) with DeepSeek (based on mapping & samples)"):
-    merged_sample_csv = df_to_sample_csv(st.session_state.merged_df, n_rows=10)
+if st.button(
+    "Stop generation",
+    help="Stops a running transform(row) generation or candidate search; the model requests are cancelled.",
+):
+    st.info("Generation stopped.")
+
+
+also_generate_df = st.checkbox(
+    "Also generate a vectorized transform_df(df) version (used in Step 5 when its output matches transform(row))",
+    value=True,
+)
 
+if st.button("Generate transform(row) with DeepSeek (based on mapping & samples)"):
     # ⭐ 优先使用在 Step 3 已经读好的 d_sample_df
     d_sample_df_state = st.session_state.get("d_sample_df", None)
 
@@ -385,19 +762,109 @@ if st.button("Generate transform(row) with DeepSeek (based on mapping & samples)
     else:
         d_sample_df = d_sample_df_state
 
-    d_sample_csv = df_to_sample_csv(d_sample_df, n_rows=10)
+    # Only the mapped columns go into the prompt, trimmed to a token budget.
+    merged_sample_csv, d_sample_csv = build_prompt_samples(
+        st.session_state.merged_df, d_sample_df, mapping_df
+    )
+
+    stream_box = st.empty()
+    streamed = []
+
+    def _on_tick(elapsed):
+        # Tokens arrive on the worker thread; draw them from the script thread.
+        if streamed:
+            stream_box.code("".join(streamed), language="python")
+        else:
+            stream_box.caption(f"Waiting for the model... {elapsed:.0f}s")
 
     try:
         with st.spinner("Calling local deepseek-coder via Ollama to generate transform(row)..."):
-            code = generate_transform_code_with_llm(
+            code = _run_stoppable(
+                _on_tick,
+                generate_transform_code_with_llm,
                 merged_sample_csv=merged_sample_csv,
                 target_sample_csv=d_sample_csv,
                 mapping_df=mapping_df,
+                on_token=streamed.append,
             )
+        stream_box.empty()
         st.session_state.transform_code = code
         st.success("Transform code generated.")
     except Exception as e:
         st.error(f"Failed to generate transform code: {e}")
+    else:
+        if also_generate_df:
+            try:
+                with st.spinner("Generating vectorized transform_df(df) and checking it against transform(row)..."):
+                    st.session_state.transform_df_code = _run_stoppable(
+                        lambda elapsed: stream_box.caption(f"Generating transform_df(df)... {elapsed:.0f}s"),
+                        generate_transform_code_with_llm,
+                        merged_sample_csv=merged_sample_csv,
+                        target_sample_csv=d_sample_csv,
+                        mapping_df=mapping_df,
+                        vectorized=True,
+                    )
+                    stream_box.empty()
+                    _record_df_check()
+            except Exception as e:
+                st.warning(f"Could not generate transform_df(df): {e}")
+
+with st.expander("Generate several candidates and pick the best automatically"):
+    st.caption(
+        "Asks the model for several transform(row) programs in parallel, runs each one in a "
+        "sandboxed process on the merged sample and scores its output against the D sample. "
+        "The fastest of the best-scoring candidates is offered."
+    )
+    n_candidates = st.number_input("Number of candidates", min_value=2, max_value=8, value=4, step=1)
+    if st.button("Generate & score candidates"):
+        d_sample_df_state = st.session_state.get("d_sample_df", None)
+        if d_sample_df_state is None or not isinstance(d_sample_df_state, pd.DataFrame) or d_sample_df_state.empty:
+            st.warning("Candidates are scored against the D sample; please upload one in Step 3 first.")
+        else:
+            search_status = st.empty()
+            try:
+                with st.spinner(f"Generating and testing {int(n_candidates)} candidates..."):
+                    st.session_state.transform_candidates = _run_stoppable(
+                        lambda elapsed: search_status.caption(f"Running for {elapsed:.0f}s..."),
+                        search_transform_candidates,
+                        st.session_state.merged_df,
+                        d_sample_df_state,
+                        mapping_df,
+                        n_candidates=int(n_candidates),
+                    )
+                search_status.empty()
+            except Exception as e:
+                st.error(f"Candidate search failed: {e}")
+
+    candidates = st.session_state.get("transform_candidates")
+    if candidates:
+        st.dataframe(
+            pd.DataFrame(
+                [
+                    {
+                        "candidate": c["candidate"],
+                        "ok": c["ok"],
+                        "score": round(c["score"], 3),
+                        "columns": round(c["column_score"], 3),
+                        "values": round(c["value_score"], 3),
+                        "rows/sec": None if c["rows_per_sec"] is None else round(c["rows_per_sec"]),
+                        "error": c["error"],
+                    }
+                    for c in candidates
+                ]
+            )
+        )
+        pick = st.selectbox(
+            "Candidate to use (best first)",
+            list(range(len(candidates))),
+            format_func=lambda i: f"#{candidates[i]['candidate']} (score {candidates[i]['score']:.2f})",
+        )
+        if st.button("Use selected candidate"):
+            if not candidates[pick]["code"]:
+                st.error(f"Candidate #{candidates[pick]['candidate']} has no code: {candidates[pick]['error']}")
+            else:
+                st.session_state.transform_code = candidates[pick]["code"]
+                st.success(f"Candidate #{candidates[pick]['candidate']} loaded into the editor.")
 
 
 if not st.session_state.transform_code:
@@ -411,33 +878,146 @@ else:
     )
     st.session_state.transform_code = edited_code
 
+if st.session_state.transform_df_code:
+    st.subheader("Vectorized transform_df(df) Code (editable)")
+    edited_df_code = st.text_area(
+        "Edit transform_df(df) Python code if needed",
+        value=st.session_state.transform_df_code,
+        height=250,
+    )
+    st.session_state.transform_df_code = edited_df_code
+    if st.button("Check transform_df(df) against transform(row)"):
+        _record_df_check()
+    check = st.session_state.transform_df_check
+    if _df_code_verified():
+        st.success(f"Equivalent to transform(row): {check[3]} Step 5 uses it by default.")
+    elif check and check[1] == code_hash(st.session_state.transform_df_code):
+        st.warning(f"Not equivalent to transform(row): {check[3]}")
+    else:
+        st.info("transform_df(df) has not been checked against the current transform(row) code.")
+
 st.markdown("---")
 
 # ---------- Step 5: Run transform & download result ----------
 st.header("Step 5: Run transform(row) & Download Final Table D")
 
+run_modes = [
+    "transform(row) code",
+    "Vectorized mapping (fast, uses Step 3 mapping)",
+    "transform_df(df) code (vectorized LLM code)",
+]
+run_mode = st.radio(
+    "Execution mode",
+    run_modes,
+    index=2 if _df_code_verified() else 0,
+    horizontal=True,
+    help="Vectorized mode compiles the column mapping into column-level pandas operations; "
+    "expressions it cannot compile fall back to per-row evaluation. "
+    "transform_df(df) runs the LLM's column-operation code once over the whole table.",
+)
+
 if st.button("Run transform(row) on merged table"):
-    try:
-        df_result, error = apply_transform_code(
+    with profiled(profile_kind, report=st.session_state.last_profile):
+        try:
+            if run_mode.startswith("Vectorized"):
+                try:
+                    compiled = compile_mapping(st.session_state.mapping_df)
+                except SyntaxError as e:
+                    compiled = None
+                    df_result, error = None, f"Invalid expression: {e}"
+                if compiled is not None:
+                    n_fallback = sum(1 for p in compiled if p["mode"] == "row")
+                    st.caption(
+                        f"{len(compiled) - n_fallback} of {len(compiled)} columns vectorized"
+                        + (f", {n_fallback} evaluated per row." if n_fallback else ".")
+                    )
+                    df_result, error = pipeline.run(
+                        "transform",
+                        apply_mapping_vectorized,
+                        st.session_state.mapping_df,
+                        st.session_state.merged_df,
+                        compiled=compiled,
+                    )
+            elif run_mode.startswith("transform_df"):
+                if not st.session_state.transform_df_code.strip():
+                    df_result, error = None, "No transform_df(df) code yet; generate it in Step 4."
+                else:
+                    df_result, error = pipeline.run(
+                        "transform",
+                        apply_transform_df_code,
+                        st.session_state.transform_df_code,
+                        st.session_state.merged_df,
+                    )
+            else:
+                df_result, error = pipeline.run(
+                    "transform",
+                    apply_transform_code,
+                    st.session_state.transform_code,
+                    st.session_state.merged_df,
+                )
+            if error:
+                st.error(f"Error while applying transform: {error}")
+            else:
+                st.success("Transform applied successfully.")
+                st.subheader("Result Preview (final table D)")
+                st.dataframe(df_result.head())
+                st.download_button(
+                    "Download Table D as CSV",
+                    data=df_result.to_csv(index=False),
+                    file_name="table_D.csv",
+                    mime="text/csv",
+                )
+        except Exception as e:
+            st.error(f"Unexpected error: {e}")
+
+with st.expander("Large tables: chunked parallel run (streams output to disk)"):
+    st.caption(
+        "Splits the merged table into chunks, runs transform(row) in a process pool "
+        "and writes finished chunks to the output file incrementally."
+    )
+    cc1, cc2, cc3 = st.columns(3)
+    with cc1:
+        chunk_workers = st.number_input(
+            "Worker processes", min_value=1, max_value=64, value=os.cpu_count() or 1, step=1
+        )
+    with cc2:
+        chunk_rows = st.number_input(
+            "Rows per chunk", min_value=1000, max_value=5_000_000, value=50_000, step=10_000
+        )
+    with cc3:
+        chunk_fmt = st.selectbox("Output format", ["csv", "parquet"], key="chunk_fmt")
+
+    if st.button("Run chunked transform(row)"):
+        out_path = os.path.join(tempfile.gettempdir(), f"table_D.{chunk_fmt}")
+        progress_bar = st.progress(0.0)
+        progress_text = st.empty()
+
+        def _on_progress(rows_done, total_rows, rows_per_sec):
+            if total_rows:
+                progress_bar.progress(min(rows_done / total_rows, 1.0))
+            total_text = f"{total_rows:,}" if total_rows else "?"
+            progress_text.caption(f"{rows_done:,} / {total_text} rows — {rows_per_sec:,.0f} rows/s")
+
+        stats, error = run_transform_chunked(
             st.session_state.transform_code,
             st.session_state.merged_df,
+            out_path,
+            fmt=chunk_fmt,
+            chunk_size=int(chunk_rows),
+            n_workers=int(chunk_workers),
+            progress_callback=_on_progress,
         )
         if error:
             st.error(f"Error while applying transform: {error}")
         else:
-            st.success("Transform applied successfully.")
-            st.subheader("Result Preview (final table D)")
-            st.dataframe(df_result.head())
-            st.download_button(
-                "Download Table D as CSV",
-                data=df_result.to_csv(index=False),
-                file_name="table_D.csv",
-                mime="text/csv",
+            st.success(
+                f"Wrote {stats['rows_out']:,} rows to {stats['output_path']} "
+                f"in {stats['seconds']:.1f}s ({stats['rows_per_sec']:,.0f} rows/s)."
             )
-    except Exception as e:
-        st.error(f"Unexpected error: {e}")
-
-
-
-
-
+            with open(out_path, "rb") as f:
+                st.download_button(
+                    f"Download Table D as {chunk_fmt.upper()}",
+                    data=f,
+                    file_name=f"table_D.{chunk_fmt}",
+                    mime="text/csv" if chunk_fmt == "csv" else "application/octet-stream",
+                )
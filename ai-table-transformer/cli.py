@@ -0,0 +1,150 @@
+"""
+Headless runner for saved templates.
+
+    python cli.py list
+    python cli.py run TEMPLATE orders.csv customers.csv -o table_D.csv
+    python cli.py run TEMPLATE --batches "exports/2024-*" --output-dir out/ --format parquet
+    python cli.py run TEMPLATE orders.csv -o table_D.csv --metrics runs.jsonl --profile cprofile
+"""
+import argparse
+import json
+import sys
+
+from core.template_manager import list_templates
+from core.template_runner import RUN_MODES, load_template_bundle, run_template, run_template_batches
+from utils.instrumentation import export_jsonl, profiled, start_run
+
+
+def _print_json(obj):
+    print(json.dumps(obj, ensure_ascii=False, default=str), flush=True)
+
+
+def _cmd_list(args) -> int:
+    for name in list_templates():
+        print(name)
+    return 0
+
+
+def _cmd_run(args) -> int:
+    try:
+        template = load_template_bundle(args.template)
+    except FileNotFoundError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    options = {
+        "mode": args.mode,
+        "engine": args.engine,
+        "chunk_size": args.chunk_rows,
+        "compact": not args.no_compact,
+        "use_cache": args.cache,
+        "project": not args.no_projection,
+    }
+
+    if args.batches:
+        failed = 0
+
+        def _on_batch_done(batch_dir, stats, error):
+            nonlocal failed
+            failed += error is not None
+            _print_json({"batch": batch_dir, "stats": stats, "error": error})
+
+        results = run_template_batches(
+            template,
+            args.batches,
+            args.output_dir,
+            fmt=args.format,
+            n_workers=args.workers,
+            on_batch_done=_on_batch_done,
+            **options,
+        )
+        if not results:
+            print(f"No batch directories match {args.batches!r}.", file=sys.stderr)
+            return 2
+        return 1 if failed else 0
+
+    if not args.inputs or not args.output:
+        print("run needs input files and -o/--output (or --batches).", file=sys.stderr)
+        return 2
+
+    def _on_progress(rows_done, total_rows, rows_per_sec):
+        if not args.quiet:
+            total_text = f"{total_rows:,}" if total_rows else "?"
+            print(f"{rows_done:,} / {total_text} rows ({rows_per_sec:,.0f} rows/s)", file=sys.stderr)
+
+    run_id = start_run(trace_memory=args.trace_memory)
+    profile_report = {}
+    with profiled(args.profile, path=args.profile_out, report=profile_report):
+        stats, error = run_template(
+            template,
+            args.inputs,
+            args.output,
+            n_workers=args.workers,
+            progress_callback=_on_progress,
+            **options,
+        )
+    if args.metrics:
+        export_jsonl(args.metrics, run_id)
+    if profile_report:
+        print(profile_report["profile"], file=sys.stderr)
+    if error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+    _print_json(stats)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Run saved AI Table Transformer templates without Streamlit.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_list = sub.add_parser("list", help="List saved templates.")
+    p_list.set_defaults(func=_cmd_list)
+
+    p_run = sub.add_parser("run", help="Apply a template to input files.")
+    p_run.add_argument("template", help="Template name (see `list`).")
+    p_run.add_argument("inputs", nargs="*", help="Input CSV / Excel files; table name = file name without extension.")
+    p_run.add_argument("-o", "--output", help="Output file (.csv or .parquet).")
+    p_run.add_argument("--batches", help="Glob of batch directories, each holding one set of input files.")
+    p_run.add_argument("--output-dir", default="output", help="Output directory for --batches (default: output).")
+    p_run.add_argument("--format", choices=["csv", "parquet"], default="csv", help="Output format for --batches.")
+    p_run.add_argument("--mode", choices=RUN_MODES, default="auto", help="Transform to run (default: auto).")
+    p_run.add_argument("--engine", choices=["pandas", "duckdb"], default="pandas", help="Merge engine.")
+    p_run.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Worker processes: per chunk for a single run, per batch with --batches (default: CPU count).",
+    )
+    p_run.add_argument("--chunk-rows", type=int, default=50_000, help="Rows per chunk in row mode.")
+    p_run.add_argument("--no-compact", action="store_true", help="Load inputs without dtype compaction.")
+    p_run.add_argument("--cache", action="store_true", help="Reuse parsed inputs from the on-disk table cache.")
+    p_run.add_argument(
+        "--no-projection",
+        action="store_true",
+        help="Load every input column instead of only the ones the transform reads.",
+    )
+    p_run.add_argument("-q", "--quiet", action="store_true", help="No progress output.")
+    p_run.add_argument(
+        "--metrics", help="Append per-stage timings, rows and memory as JSON lines to this file (single runs)."
+    )
+    p_run.add_argument(
+        "--trace-memory", action="store_true", help="Record each stage's tracemalloc peak (slower)."
+    )
+    p_run.add_argument(
+        "--profile",
+        choices=["cprofile", "pyinstrument"],
+        help="Profile the run and print the report to stderr (single runs).",
+    )
+    p_run.add_argument("--profile-out", help="Also write the raw profile (.prof / .html) here.")
+    p_run.set_defaults(func=_cmd_run)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,47 +1,195 @@
+import numpy as np
 import pandas as pd
-from core.type_detector import detect_column_type
-from utils.similarity import name_similarity
+from typing import Dict, List, Tuple
+from core.type_detector import profile_table
+from utils.instrumentation import frame_rows, instrumented
+from utils.similarity import similarity_matrix
 
 
-def build_initial_mapping_df(merged_df: pd.DataFrame, d_sample_df: pd.DataFrame) -> pd.DataFrame:
+# Weights of the combined score and the minimum score to keep a mapping.
+NAME_WEIGHT = 0.7
+TYPE_WEIGHT = 0.15
+VALUE_WEIGHT = 0.15
+MIN_MAPPING_SCORE = 0.45
+
+
+def _value_features(df: pd.DataFrame, cols: List[str], sample_size: int = 200) -> np.ndarray:
     """
-    Build an initial mapping DataFrame with heuristic "AI-like" guesses:
-    columns: target_column, source_column, expression
+    Per-column value-distribution features in [0, 1]:
+    numeric share, digit / letter / space share of characters, scaled length.
+    The samples of all columns are concatenated so every string operation
+    runs once over all columns.
+    """
+    feats = np.zeros((len(cols), 5), dtype=np.float64)
+    rng = np.random.default_rng(0)
+    values, owners = [], []
+    for i, col in enumerate(cols):
+        s = df[col]
+        if len(s) > sample_size:
+            s = s.iloc[np.sort(rng.choice(len(s), sample_size, replace=False))]
+        s = s.dropna()
+        values.append(s.astype(str).to_numpy(dtype=object))
+        owners.append(np.full(len(s), i))
+    if not values or not sum(len(v) for v in values):
+        return feats
+
+    allv = pd.Series(np.concatenate(values), dtype=object)
+    stats = pd.DataFrame(
+        {
+            "owner": np.concatenate(owners),
+            "numeric": allv.str.fullmatch(r"-?\d+(\.\d+)?").astype(float),
+            "digits": allv.str.count(r"\d"),
+            "letters": allv.str.count(r"[^\W\d_]"),
+            "spaces": allv.str.count(r"\s"),
+            "length": allv.str.len(),
+        }
+    ).groupby("owner").agg(["sum", "mean"])
+
+    owner = stats.index.to_numpy()
+    total_chars = np.maximum(stats[("length", "sum")].to_numpy(), 1)
+    feats[owner, 0] = stats[("numeric", "mean")].to_numpy()
+    feats[owner, 1] = stats[("digits", "sum")].to_numpy() / total_chars
+    feats[owner, 2] = stats[("letters", "sum")].to_numpy() / total_chars
+    feats[owner, 3] = stats[("spaces", "sum")].to_numpy() / total_chars
+    feats[owner, 4] = np.minimum(np.log1p(stats[("length", "mean")].to_numpy()) / np.log1p(100), 1.0)
+    return feats
+
+
+def _type_matrix(target_types: List[str], merged_types: List[str]) -> np.ndarray:
+    t = np.array(target_types, dtype=object)[:, None]
+    m = np.array(merged_types, dtype=object)[None, :]
+    loose = np.isin(t, ["text", "unknown"]) | np.isin(m, ["text", "unknown"])
+    return np.where(t == m, 1.0, np.where(loose, 0.5, 0.0))
+
+
+def score_matrix(merged_df: pd.DataFrame, d_sample_df: pd.DataFrame) -> np.ndarray:
+    """
+    Score every (target column, merged column) pair in one vectorized pass,
+    combining name similarity, type compatibility and value-distribution
+    similarity. Shape: (len(target columns), len(merged columns)).
     """
     target_cols = list(d_sample_df.columns)
     merged_cols = list(merged_df.columns)
 
-    rows = []
+    name_scores = similarity_matrix(target_cols, merged_cols)
+
+    target_profiles = profile_table(d_sample_df, "target")
+    merged_profiles = profile_table(merged_df, "merged")
+    target_types = [target_profiles[c]["type"] for c in target_cols]
+    merged_types = [merged_profiles[c]["type"] for c in merged_cols]
+    type_scores = _type_matrix(target_types, merged_types)
+
+    tf = _value_features(d_sample_df, target_cols)
+    mf = _value_features(merged_df, merged_cols)
+    value_scores = 1.0 - np.abs(tf[:, None, :] - mf[None, :, :]).mean(axis=2)
+
+    return NAME_WEIGHT * name_scores + TYPE_WEIGHT * type_scores + VALUE_WEIGHT * value_scores
 
-    # Precompute column types for merged table
-    merged_types = {
-        col: detect_column_type(merged_df[col], col) for col in merged_cols
-    }
 
-    for tcol in target_cols:
-        # try to guess best matching merged column
-        best_col = None
-        best_score = 0.0
-        t_type = None  # no strong type for target, we only use name similarity + type hint
+def _hungarian(cost: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Minimum-cost assignment for a (n x m) matrix with n <= m (O(n^2 m),
+    inner loop vectorized). Used when scipy is not installed.
+    """
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=np.intp)  # p[j]: row (1-based) assigned to column j
+    way = np.zeros(m + 1, dtype=np.intp)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used[1:]
+            cur = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (cur < minv[1:])
+            minv[1:][better] = cur[better]
+            way[1:][better] = j0
+            masked = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(masked)) + 1
+            delta = masked[j1 - 1]
+            used_cols = np.flatnonzero(used)
+            u[p[used_cols]] += delta
+            v[used_cols] -= delta
+            minv[1:][free] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    cols = np.flatnonzero(p[1:])
+    rows = p[1:][cols] - 1
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+
+def assign_columns(scores: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Best one-to-one assignment maximizing the total score."""
+    if scores.size == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    try:
+        from scipy.optimize import linear_sum_assignment
+    except ImportError:
+        linear_sum_assignment = None
+
+    if linear_sum_assignment is not None:
+        return linear_sum_assignment(scores, maximize=True)
+    if scores.shape[0] <= scores.shape[1]:
+        return _hungarian(-scores)
+    cols, rows = _hungarian(-scores.T)
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+
+@instrumented("mapping", rows_in=lambda a: len(a["merged_df"]), rows_out=frame_rows)
+def build_mapping_candidates(
+    merged_df: pd.DataFrame,
+    d_sample_df: pd.DataFrame,
+    top_k: int = 5,
+) -> Tuple[pd.DataFrame, Dict[str, List[Tuple[str, float]]]]:
+    """
+    Build the initial mapping with a global one-to-one assignment over the
+    score matrix (each merged column feeds at most one target column), plus
+    the top_k scored merged columns per target column as alternatives.
+    Returns (mapping_df, {target_column: [(merged_column, score), ...]}).
+    """
+    target_cols = list(d_sample_df.columns)
+    merged_cols = list(merged_df.columns)
+    scores = score_matrix(merged_df, d_sample_df)
 
-        for mcol in merged_cols:
-            ns = name_similarity(tcol, mcol)
-            m_type = merged_types[mcol]
+    best = {}
+    for ti, mi in zip(*assign_columns(scores)):
+        if scores[ti, mi] >= MIN_MAPPING_SCORE:
+            best[ti] = merged_cols[mi]
 
-            # Give small bonus for compatible type (very rough)
-            type_bonus = 0.1 if (("id" in tcol.lower() and m_type == "id") or (m_type != "id")) else 0.0
-            score = ns + type_bonus
+    alternatives = {}
+    if merged_cols:
+        k = min(top_k, len(merged_cols))
+        top = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        for ti, tcol in enumerate(target_cols):
+            alternatives[tcol] = [(merged_cols[mi], float(scores[ti, mi])) for mi in top[ti]]
 
-            if score > best_score:
-                best_score = score
-                best_col = mcol
+    rows = [
+        {
+            "target_column": tcol,
+            "source_column": best.get(ti),
+            "expression": None,
+        }
+        for ti, tcol in enumerate(target_cols)
+    ]
+    return pd.DataFrame(rows), alternatives
 
-        rows.append(
-            {
-                "target_column": tcol,
-                "source_column": best_col if best_score >= 0.3 else None,
-                "expression": None,
-            }
-        )
 
-    return pd.DataFrame(rows)
+def build_initial_mapping_df(merged_df: pd.DataFrame, d_sample_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Build an initial mapping DataFrame with heuristic "AI-like" guesses:
+    columns: target_column, source_column, expression
+    """
+    mapping_df, _ = build_mapping_candidates(merged_df, d_sample_df)
+    return mapping_df
@@ -0,0 +1,246 @@
+import multiprocessing
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import pandas as pd
+
+from core.llm_transform import build_prompt_samples, generate_transform_code_with_llm
+from core.ollama_client import GenerationCancelled
+from core.transformer_runner import load_transform, transform_rows
+from utils.instrumentation import bind_run
+
+
+# Candidates within this quality of the best one are considered equally
+# correct; the fastest of them is offered.
+QUALITY_TOLERANCE = 0.02
+
+# Sandbox limits for running one candidate on the sample.
+SANDBOX_TIMEOUT = 20.0
+SANDBOX_MEMORY_BYTES = 2 * 1024 ** 3
+
+
+def _limit_memory(max_bytes: Optional[int]):
+    if not max_bytes:
+        return
+    try:
+        import resource
+    except ImportError:  # not available on Windows
+        return
+    try:
+        resource.setrlimit(resource.RLIMIT_AS, (max_bytes, max_bytes))
+    except (ValueError, OSError):
+        pass
+
+
+def _sandbox_main(conn, code: str, sample_df: pd.DataFrame, max_bytes: Optional[int]):
+    """Child process: run the candidate on the sample and send back (df, error, seconds)."""
+    _limit_memory(max_bytes)
+    try:
+        transform, error = load_transform(code, use_cache=False)
+        if error:
+            conn.send((None, error, 0.0))
+            return
+        started = time.perf_counter()
+        out_rows, error = transform_rows(transform, sample_df)
+        seconds = time.perf_counter() - started
+        if error:
+            conn.send((None, error, seconds))
+            return
+        conn.send((pd.DataFrame(out_rows), None, seconds))
+    except BaseException as e:
+        conn.send((None, f"{type(e).__name__}: {e}", 0.0))
+    finally:
+        conn.close()
+
+
+def run_in_sandbox(
+    code: str,
+    sample_df: pd.DataFrame,
+    timeout: float = SANDBOX_TIMEOUT,
+    max_bytes: Optional[int] = SANDBOX_MEMORY_BYTES,
+) -> Tuple[Optional[pd.DataFrame], Optional[str], float]:
+    """
+    Run transform(row) code on sample_df in a separate process with a
+    timeout and an address-space limit. Returns (result_df, error, seconds).
+    """
+    parent_conn, child_conn = multiprocessing.Pipe(duplex=False)
+    proc = multiprocessing.Process(target=_sandbox_main, args=(child_conn, code, sample_df, max_bytes), daemon=True)
+    proc.start()
+    child_conn.close()
+    try:
+        if not parent_conn.poll(timeout):
+            return None, f"Timed out after {timeout:.0f}s.", timeout
+        return parent_conn.recv()
+    except EOFError:
+        return None, f"Sandbox process exited with code {proc.exitcode}.", 0.0
+    finally:
+        if proc.is_alive():
+            proc.terminate()
+        proc.join(1)
+        parent_conn.close()
+
+
+def _value_shape(v: str) -> str:
+    return re.sub(r"[^\W\d_]+", "a", re.sub(r"\d+", "9", v))
+
+
+def _containment(values: pd.Series, reference: pd.Series) -> float:
+    values = values.dropna().astype(str).str.strip()
+    reference = set(reference.dropna().astype(str).str.strip())
+    if values.empty or not reference:
+        return 0.0
+    return float(values.isin(reference).mean())
+
+
+def score_candidate_output(result_df: pd.DataFrame, target_df: pd.DataFrame) -> dict:
+    """
+    Compare a candidate's output on the merged sample with the D sample:
+    column_score = share of D columns produced; value_score = average over
+    D columns of exact-value containment and value-shape containment (the
+    samples need not describe the same rows).
+    """
+    target_cols = list(target_df.columns)
+    if not target_cols:
+        return {"column_score": 0.0, "value_score": 0.0}
+    present = [c for c in target_cols if c in result_df.columns]
+    column_score = len(present) / len(target_cols)
+
+    value_scores = []
+    for col in present:
+        produced, expected = result_df[col], target_df[col]
+        exact = _containment(produced, expected)
+        shape = _containment(
+            produced.dropna().astype(str).map(_value_shape),
+            expected.dropna().astype(str).map(_value_shape),
+        )
+        value_scores.append(0.5 * exact + 0.5 * shape)
+    value_score = sum(value_scores) / len(target_cols)
+    return {"column_score": column_score, "value_score": value_score}
+
+
+def generate_candidates(
+    merged_sample_csv: str,
+    target_sample_csv: str,
+    mapping_df: pd.DataFrame,
+    n_candidates: int = 4,
+    model_name: str = "deepseek-coder:1.3b",
+    max_workers: Optional[int] = None,
+    cancel_event: Optional[threading.Event] = None,
+) -> List[Tuple[str, Optional[str]]]:
+    """
+    Ask the model for n_candidates programs in parallel. Candidate 0 uses the
+    default (cached) settings; the others sample with increasing temperature.
+    Returns (code, error) per candidate; failed generations have empty code.
+    Setting cancel_event stops every generation still running.
+    """
+    def _one(i: int) -> Tuple[str, Optional[str]]:
+        options = None if i == 0 else {"temperature": min(0.3 + 0.2 * i, 1.2), "seed": i}
+        try:
+            code = generate_transform_code_with_llm(
+                merged_sample_csv,
+                target_sample_csv,
+                mapping_df,
+                model_name=model_name,
+                options=options,
+                cancel_event=cancel_event,
+            )
+        except Exception as e:
+            # One failed generation should not sink the other candidates.
+            return "", f"Generation failed: {type(e).__name__}: {e}"
+        if not code:
+            return "", "Generation failed: the model returned no code."
+        return code, None
+
+    with ThreadPoolExecutor(max_workers=max_workers or n_candidates) as pool:
+        return list(pool.map(bind_run(_one), range(n_candidates)))
+
+
+def search_transform_candidates(
+    merged_df: pd.DataFrame,
+    target_df: pd.DataFrame,
+    mapping_df: pd.DataFrame,
+    n_candidates: int = 4,
+    model_name: str = "deepseek-coder:1.3b",
+    sample_rows: int = 200,
+    timeout: float = SANDBOX_TIMEOUT,
+    max_workers: Optional[int] = None,
+    cancel_event: Optional[threading.Event] = None,
+) -> List[dict]:
+    """
+    Generate n_candidates transform(row) programs, run each in a sandbox on
+    the first sample_rows merged rows and score it against the D sample.
+    Returns one dict per distinct program, best first:
+    {candidate, code, ok, error, column_score, value_score, score, rows_per_sec};
+    failed generations are listed last with empty code and their error.
+    The best is the fastest among the error-free candidates whose score is
+    within QUALITY_TOLERANCE of the top score.
+    Setting cancel_event stops the search (GenerationCancelled is raised).
+    """
+    merged_sample_csv, target_sample_csv = build_prompt_samples(merged_df, target_df, mapping_df)
+    generated = generate_candidates(
+        merged_sample_csv,
+        target_sample_csv,
+        mapping_df,
+        n_candidates=n_candidates,
+        model_name=model_name,
+        max_workers=max_workers,
+        cancel_event=cancel_event,
+    )
+    if cancel_event is not None and cancel_event.is_set():
+        raise GenerationCancelled("Candidate search cancelled.")
+
+    distinct, failed = [], []
+    for i, (code, error) in enumerate(generated):
+        if error is not None:
+            failed.append((i, error))
+        elif code not in (d[1] for d in distinct):
+            distinct.append((i, code))
+    if not distinct:
+        reasons = "; ".join(f"#{i}: {error}" for i, error in failed)
+        raise RuntimeError(f"The model did not return any candidate code ({reasons}).")
+
+    sample = merged_df.head(sample_rows)
+    with ThreadPoolExecutor(max_workers=max_workers or max(len(distinct), 1)) as pool:
+        runs = list(pool.map(bind_run(lambda ic: run_in_sandbox(ic[1], sample, timeout=timeout)), distinct))
+
+    results = []
+    for (i, code), (result_df, error, seconds) in zip(distinct, runs):
+        entry = {
+            "candidate": i,
+            "code": code,
+            "ok": error is None,
+            "error": error,
+            "column_score": 0.0,
+            "value_score": 0.0,
+            "score": 0.0,
+            "rows_per_sec": None,
+        }
+        if error is None:
+            entry.update(score_candidate_output(result_df, target_df))
+            entry["score"] = 0.5 * entry["column_score"] + 0.5 * entry["value_score"]
+            entry["rows_per_sec"] = len(sample) / seconds if seconds > 0 else float("inf")
+        results.append(entry)
+    for i, error in failed:
+        results.append(
+            {
+                "candidate": i,
+                "code": "",
+                "ok": False,
+                "error": error,
+                "column_score": 0.0,
+                "value_score": 0.0,
+                "score": 0.0,
+                "rows_per_sec": None,
+            }
+        )
+
+    top = max((r["score"] for r in results if r["ok"]), default=0.0)
+
+    def _rank(r: dict):
+        best_tier = r["ok"] and r["score"] >= top - QUALITY_TOLERANCE
+        return (not best_tier, -(r["rows_per_sec"] or 0.0), -r["score"])
+
+    return sorted(results, key=_rank)
@@ -0,0 +1,257 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, Optional, Tuple, Union
+
+import pandas as pd
+
+from core.transformer_runner import dry_run_transform, load_transform, transform_rows
+from utils.instrumentation import instrumented
+
+
+# Per-worker state: the transform code is exec'd once when a worker starts,
+# not once per chunk.
+_WORKER_TRANSFORM = None
+_WORKER_ERROR = None
+
+
+def _init_worker(code: str):
+    global _WORKER_TRANSFORM, _WORKER_ERROR
+    _WORKER_TRANSFORM, _WORKER_ERROR = load_transform(code)
+
+
+def _run_chunk(chunk: pd.DataFrame) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+    if _WORKER_ERROR:
+        return None, _WORKER_ERROR
+    out_rows, error = transform_rows(_WORKER_TRANSFORM, chunk)
+    if error:
+        return None, error
+    try:
+        return pd.DataFrame(out_rows), None
+    except Exception as e:
+        return None, f"Error building result DataFrame: {e}"
+
+
+def iter_chunks(
+    source: Union[pd.DataFrame, str, Iterable[pd.DataFrame]],
+    chunk_size: int,
+) -> Iterator[pd.DataFrame]:
+    """
+    Yield DataFrame chunks of at most chunk_size rows from a DataFrame,
+    a CSV file path (read lazily with chunksize) or an iterable of DataFrames.
+    """
+    if isinstance(source, pd.DataFrame):
+        for start in range(0, len(source), chunk_size):
+            yield source.iloc[start:start + chunk_size]
+    elif isinstance(source, str):
+        yield from pd.read_csv(source, chunksize=chunk_size)
+    else:
+        yield from source
+
+
+# Parquet output: chunks held back (at most this many) while an output column
+# is still all-null, so its type comes from a later chunk instead of null.
+SCHEMA_BUFFER_CHUNKS = 8
+
+
+def _resolve_schema(schemas: list):
+    """One schema for the buffered chunks: each column takes its first non-null type (text if none)."""
+    import pyarrow as pa
+
+    fields = []
+    for field in schemas[0]:
+        types = [s.field(field.name).type for s in schemas]
+        known = [t for t in types if not pa.types.is_null(t)]
+        fields.append(pa.field(field.name, known[0] if known else pa.large_string()))
+    return pa.schema(fields)
+
+
+def _cast_table(table, schema):
+    import pyarrow as pa
+
+    try:
+        return table.cast(schema)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+        drift = [
+            f"{f.name} ({table.schema.field(f.name).type} vs {f.type})"
+            for f in schema
+            if table.schema.field(f.name).type != f.type
+        ]
+        raise ValueError(f"Output column types changed between chunks: {', '.join(drift)} ({e})") from e
+
+
+class _ChunkWriter:
+    """
+    Append result chunks to a CSV or Parquet file as they finish. The first
+    chunk fixes the columns; a later chunk with new columns (transform(row)
+    returning other keys) is an error rather than silently losing them.
+    """
+
+    def __init__(self, path: str, fmt: str):
+        self.path = path
+        self.fmt = fmt
+        self.columns = None
+        self._parquet_writer = None
+        self._schema = None
+        self._pending = []
+
+    def write(self, df: pd.DataFrame):
+        if self.columns is None:
+            self.columns = list(df.columns)
+        else:
+            new = [c for c in df.columns if c not in self.columns]
+            if new:
+                raise ValueError(
+                    f"Output columns changed between chunks: {new} are not in the first chunk's {self.columns}; "
+                    "transform(row) must return the same keys for every row."
+                )
+            df = df.reindex(columns=self.columns)
+
+        if self.fmt == "parquet":
+            import pyarrow as pa
+
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._parquet_writer is not None:
+                self._parquet_writer.write_table(_cast_table(table, self._schema))
+                return
+            self._pending.append(table)
+            has_null = any(pa.types.is_null(f.type) for f in table.schema)
+            if not has_null or len(self._pending) >= SCHEMA_BUFFER_CHUNKS:
+                self._flush_parquet()
+        else:
+            first = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            df.to_csv(self.path, mode="w" if first else "a", header=first, index=False)
+
+    def _flush_parquet(self):
+        import pyarrow.parquet as pq
+
+        self._schema = _resolve_schema([t.schema for t in self._pending])
+        self._parquet_writer = pq.ParquetWriter(self.path, self._schema)
+        for table in self._pending:
+            self._parquet_writer.write_table(_cast_table(table, self._schema))
+        self._pending = []
+
+    def finish(self):
+        """Write chunks still held back for their schema."""
+        if self._pending:
+            self._flush_parquet()
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+
+
+def _source_rows(args: dict) -> Optional[int]:
+    source = args["source"]
+    return len(source) if isinstance(source, pd.DataFrame) else args["total_rows"]
+
+
+@instrumented(
+    "transform",
+    rows_in=_source_rows,
+    rows_out=lambda result: result[0]["rows_out"] if result[0] else None,
+)
+def run_transform_chunked(
+    code: str,
+    source: Union[pd.DataFrame, str, Iterable[pd.DataFrame]],
+    output_path: str,
+    fmt: str = "csv",
+    chunk_size: int = 50_000,
+    n_workers: Optional[int] = None,
+    total_rows: Optional[int] = None,
+    progress_callback: Optional[Callable[[int, Optional[int], float], None]] = None,
+) -> Tuple[Optional[dict], Optional[str]]:
+    """
+    Apply transform(row) to source chunk by chunk in a process pool and
+    stream finished chunks to output_path (CSV or Parquet) in input order.
+    At most 2 * n_workers chunks are in flight, so memory use stays flat.
+    progress_callback(rows_done, total_rows, rows_per_sec) is called after
+    every written chunk. The first chunk fixes the output columns: a chunk
+    with new keys, or with Parquet types that do not cast to the file's, is
+    an error (columns null so far take their type from a later chunk).
+    Returns (stats, error_message).
+    """
+    if fmt not in ("csv", "parquet"):
+        return None, f"Unsupported output format: {fmt}"
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return None, "Parquet output requires pyarrow (pip install pyarrow)."
+
+    # Validate the code up front so we fail before starting any workers.
+    _, error = load_transform(code)
+    if error:
+        return None, error
+    if isinstance(source, pd.DataFrame):
+        _, error = dry_run_transform(code, source)
+        if error:
+            return None, f"Dry run failed: {error}"
+
+    if total_rows is None and isinstance(source, pd.DataFrame):
+        total_rows = len(source)
+    n_workers = n_workers or os.cpu_count() or 1
+
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    writer = _ChunkWriter(output_path, fmt)
+
+    stats = {"rows_in": 0, "rows_out": 0, "chunks": 0}
+    started = time.perf_counter()
+
+    def _on_result(n_in: int, result: Tuple[Optional[pd.DataFrame], Optional[str]]):
+        out_df, err = result
+        if err:
+            return err
+        writer.write(out_df)
+        stats["rows_in"] += n_in
+        stats["rows_out"] += len(out_df)
+        stats["chunks"] += 1
+        if progress_callback is not None:
+            elapsed = max(time.perf_counter() - started, 1e-9)
+            progress_callback(stats["rows_in"], total_rows, stats["rows_in"] / elapsed)
+        return None
+
+    error = None
+    try:
+        if n_workers == 1:
+            _init_worker(code)
+            for chunk in iter_chunks(source, chunk_size):
+                error = _on_result(len(chunk), _run_chunk(chunk))
+                if error:
+                    break
+        else:
+            with ProcessPoolExecutor(
+                max_workers=n_workers,
+                initializer=_init_worker,
+                initargs=(code,),
+            ) as pool:
+                pending = deque()
+                for chunk in iter_chunks(source, chunk_size):
+                    pending.append((len(chunk), pool.submit(_run_chunk, chunk)))
+                    if len(pending) >= 2 * n_workers:
+                        n_in, fut = pending.popleft()
+                        error = _on_result(n_in, fut.result())
+                        if error:
+                            break
+                while pending and not error:
+                    n_in, fut = pending.popleft()
+                    error = _on_result(n_in, fut.result())
+                if error:
+                    pool.shutdown(cancel_futures=True)
+        if not error:
+            writer.finish()
+    except Exception as e:
+        error = f"Chunked run failed: {e}"
+    finally:
+        writer.close()
+
+    if error:
+        return None, error
+
+    elapsed = time.perf_counter() - started
+    stats["seconds"] = elapsed
+    stats["rows_per_sec"] = stats["rows_in"] / elapsed if elapsed > 0 else 0.0
+    stats["output_path"] = output_path
+    return stats, None
@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, Hashable, Optional, Tuple
+
+from core.type_detector import detect_column_type, profile_table
+
+
+# Bottom-k (KMV) sketch: the SKETCH_SIZE smallest distinct value hashes of a
+# column. Hashes are consistent across columns, so two sketches hold the
+# *same* values wherever both are below their thresholds; that gives an
+# unbiased containment estimate even for a small column inside a large one
+# (MinHash/Jaccard cannot see 100 ids inside 10k).
+SKETCH_SIZE = 2048
+_MAX_HASH = np.uint64(np.iinfo(np.uint64).max)
+
+
+# Text that is exactly an integer (no sign tricks, no leading zeros) is
+# hashed as that integer, so "42" in a text column meets 42 in an int one.
+_INT_TEXT = r"-?(?:0|[1-9][0-9]{0,17})"
+
+
+def _hash_values(s: pd.Series) -> np.ndarray:
+    """uint64 hashes of distinct non-null values, canonical across dtypes."""
+    if pd.api.types.is_bool_dtype(s):
+        return pd.util.hash_pandas_object(s.astype(str), index=False).to_numpy()
+    if pd.api.types.is_integer_dtype(s):
+        return pd.util.hash_pandas_object(s.astype("int64"), index=False).to_numpy()
+    if pd.api.types.is_float_dtype(s) and bool((s == np.floor(s)).all()) and bool((s.abs() < 2 ** 63).all()):
+        return pd.util.hash_pandas_object(s.astype("int64"), index=False).to_numpy()
+    text = s.astype(str)
+    is_int = text.str.fullmatch(_INT_TEXT).fillna(False).to_numpy(dtype=bool)
+    if not is_int.any():
+        return pd.util.hash_pandas_object(text, index=False).to_numpy()
+    hashes = np.empty(len(text), dtype=np.uint64)
+    hashes[is_int] = pd.util.hash_pandas_object(text[is_int].astype("int64"), index=False).to_numpy()
+    hashes[~is_int] = pd.util.hash_pandas_object(text[~is_int], index=False).to_numpy()
+    return hashes
+
+
+def hash_column_values(series: pd.Series, max_rows: Optional[int] = None, random_state: int = 0) -> np.ndarray:
+    """
+    Hash the distinct non-null values of a column to uint64. Values are
+    compared as text, except that integers, integral floats and integer
+    text all hash as the integer, so 1, 1.0 and "1" collide. With max_rows,
+    a random row sample is hashed instead of the whole column.
+    """
+    s = series.dropna()
+    if max_rows is not None and len(s) > max_rows:
+        s = s.sample(max_rows, random_state=random_state)
+    if len(s) == 0:
+        return np.empty(0, dtype=np.uint64)
+    s = pd.Series(pd.unique(s), dtype=s.dtype)
+    return pd.unique(_hash_values(s))
+
+
+def bottom_k_sketch(hashes: np.ndarray, k: int = SKETCH_SIZE) -> Tuple[np.ndarray, np.uint64]:
+    """
+    (sorted k smallest of the distinct hashes, threshold). The threshold is
+    the largest kept hash, or the maximum hash when the whole set was kept.
+    """
+    if len(hashes) <= k:
+        return np.sort(hashes), _MAX_HASH
+    sample = np.sort(np.partition(hashes, k - 1)[:k])
+    return sample, sample[-1]
+
+
+def profile_column_sketch(series: pd.Series, col_name: str, max_rows: Optional[int] = None) -> dict:
+    """Column signature: detected type, distinct count and bottom-k sketch."""
+    hashes = hash_column_values(series, max_rows=max_rows)
+    sample, threshold = bottom_k_sketch(hashes)
+    return {
+        "type": detect_column_type(series, col_name),
+        "cardinality": int(len(hashes)),
+        "sketch": sample,
+        "sketch_threshold": threshold,
+    }
+
+
+def profile_table_sketches(
+    df: pd.DataFrame,
+    max_rows: Optional[int] = None,
+    table_name: Optional[str] = None,
+) -> Dict[str, dict]:
+    """
+    Profile every column of df once: {column: profile}. Types come from the
+    cached type profile, which also contributes null_ratio, min/max and
+    date_format.
+    """
+    types = profile_table(df, table_name)
+    profiles = {}
+    for col in df.columns:
+        hashes = hash_column_values(df[col], max_rows=max_rows)
+        prof = {k: v for k, v in types[col].items() if k != "cardinality"}
+        prof["cardinality"] = int(len(hashes))
+        prof["sketch"], prof["sketch_threshold"] = bottom_k_sketch(hashes)
+        profiles[col] = prof
+    return profiles
+
+
+def estimate_containment(profile_a: dict, profile_b: dict) -> float:
+    """
+    Estimated share of A's distinct values that also appear in B: among A's
+    sketched values below both thresholds, the share found in B's sketch
+    (B's sketch holds every B value below its threshold, so this is exact
+    membership on a uniform sample of A). 0.0 when no such value exists.
+    """
+    threshold = min(profile_a["sketch_threshold"], profile_b["sketch_threshold"])
+    a = profile_a["sketch"]
+    a = a[: np.searchsorted(a, threshold, side="right")]
+    if len(a) == 0:
+        return 0.0
+    return float(np.isin(a, profile_b["sketch"], assume_unique=True).mean())
+
+
+def build_value_index(sketches: Dict[Hashable, np.ndarray]) -> dict:
+    """Sorted inverted index over sketched hashes: {"keys", "hashes", "owners"}."""
+    keys = [k for k, sk in sketches.items() if len(sk)]
+    if not keys:
+        return {"keys": [], "hashes": np.empty(0, dtype=np.uint64), "owners": np.empty(0, dtype=np.intp)}
+    hashes = np.concatenate([sketches[k] for k in keys])
+    owners = np.repeat(np.arange(len(keys)), [len(sketches[k]) for k in keys])
+    order = np.argsort(hashes, kind="stable")
+    return {"keys": keys, "hashes": hashes[order], "owners": owners[order]}
+
+
+def query_value_index(index: dict, sketch: np.ndarray) -> set:
+    """Keys whose sketch shares at least one value with sketch."""
+    if len(sketch) == 0 or len(index["hashes"]) == 0:
+        return set()
+    lo = np.searchsorted(index["hashes"], sketch, side="left")
+    hi = np.searchsorted(index["hashes"], sketch, side="right")
+    counts = hi - lo
+    total = int(counts.sum())
+    if total == 0:
+        return set()
+    # positions lo[i] .. hi[i]-1 for every sketched value, flattened
+    starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+    positions = starts + np.arange(total)
+    return {index["keys"][o] for o in np.unique(index["owners"][positions])}
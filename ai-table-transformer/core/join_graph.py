@@ -0,0 +1,149 @@
+import re
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from core.column_sketch import build_value_index, profile_table_sketches, query_value_index
+from core.join_key_detector import score_column_pair
+
+
+def _name_key(col: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", str(col).lower())
+
+
+def profile_tables(tables: Dict[str, pd.DataFrame], max_workers: Optional[int] = None) -> Dict[str, dict]:
+    """Profile every table once, in parallel: {table: {column: profile}}."""
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {name: pool.submit(profile_table_sketches, df, None, name) for name, df in tables.items()}
+        return {name: fut.result() for name, fut in futures.items()}
+
+
+def _candidate_pairs(profiles: Dict[str, dict]) -> set:
+    """
+    Column pairs across different tables whose value sketches share a value,
+    or with the same normalized name. Lookup cost is linear in the total
+    sketch size.
+    """
+    sketches = {}
+    by_name = defaultdict(list)
+    for table, cols in profiles.items():
+        for col, prof in cols.items():
+            sketches[(table, col)] = prof["sketch"]
+            by_name[_name_key(col)].append((table, col))
+
+    index = build_value_index(sketches)
+    pairs = set()
+    for key, sketch in sketches.items():
+        for other in query_value_index(index, sketch):
+            if other[0] != key[0]:
+                pairs.add((key, other, True))
+    for cols in by_name.values():
+        for a in cols:
+            for b in cols:
+                if a[0] != b[0] and (a, b, True) not in pairs:
+                    pairs.add((a, b, False))
+    return pairs
+
+
+def _spanning_join_order(
+    tables: Dict[str, pd.DataFrame],
+    best_edges: Dict[tuple, dict],
+    root: Optional[str],
+) -> List[dict]:
+    """
+    Maximum spanning tree (Prim) over the best edge per table pair, grown
+    from root, returned as join_rules. Key names are tracked through the
+    `_<table>` suffixes merge_tables_with_rules applies.
+    """
+    if not tables:
+        return []
+    if root is None:
+        root = max(tables, key=lambda t: len(tables[t]))
+
+    merged_names = {(root, c): c for c in tables[root].columns}
+    taken = set(merged_names.values())
+    in_tree = {root}
+    rules = []
+
+    while True:
+        frontier = [
+            e for e in best_edges.values()
+            if (e["left_table"] in in_tree) != (e["right_table"] in in_tree)
+        ]
+        if not frontier:
+            break
+        edge = max(frontier, key=lambda e: e["score"])
+        if edge["left_table"] not in in_tree:
+            edge = {
+                "left_table": edge["right_table"],
+                "left_col": edge["right_col"],
+                "right_table": edge["left_table"],
+                "right_col": edge["left_col"],
+                "score": edge["score"],
+            }
+        lt, rt = edge["left_table"], edge["right_table"]
+        left_key = merged_names[(lt, edge["left_col"])]
+        rules.append(
+            {
+                "left_table": lt,
+                "right_table": rt,
+                "left_key": left_key,
+                "right_key": edge["right_col"],
+                "how": "left",
+            }
+        )
+        for c in tables[rt].columns:
+            if c == edge["right_col"] and c == left_key:
+                merged_names[(rt, c)] = c
+                continue
+            name = c if c not in taken else f"{c}_{rt}"
+            merged_names[(rt, c)] = name
+            taken.add(name)
+        in_tree.add(rt)
+    return rules
+
+
+def discover_join_graph(
+    tables: Dict[str, pd.DataFrame],
+    min_score: float = 0.45,
+    root: Optional[str] = None,
+    max_workers: Optional[int] = None,
+    profiles: Optional[Dict[str, dict]] = None,
+) -> dict:
+    """
+    Discover likely joins across all tables in one pass.
+    Every table is profiled once, candidate column pairs come from a single
+    index over all columns' value sketches (plus exact normalized-name
+    matches), and only
+    those pairs are scored, so the cost grows roughly linearly with the total
+    number of columns.
+    Returns {"edges": [...ranked best edge per table pair...],
+             "join_rules": [...spanning join order starting at root...]}.
+    root defaults to the table with the most rows.
+    """
+    if profiles is None:
+        profiles = profile_tables(tables, max_workers=max_workers)
+
+    best_edges = {}
+    for (lt, lc), (rt, rc), value_candidate in _candidate_pairs(profiles):
+        score = score_column_pair(lc, rc, profiles[lt][lc], profiles[rt][rc], value_candidate)
+        if score < min_score:
+            continue
+        pair_key = tuple(sorted((lt, rt)))
+        current = best_edges.get(pair_key)
+        if current is None or score > current["score"]:
+            best_edges[pair_key] = {
+                "left_table": lt,
+                "left_col": lc,
+                "right_table": rt,
+                "right_col": rc,
+                "score": score,
+            }
+
+    edges = sorted(best_edges.values(), key=lambda e: e["score"], reverse=True)
+    return {
+        "edges": edges,
+        "join_rules": _spanning_join_order(tables, best_edges, root),
+    }
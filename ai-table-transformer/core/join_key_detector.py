@@ -1,44 +1,79 @@
-from utils.similarity import name_similarity
-from core.type_detector import detect_column_type
+from utils.similarity import name_similarity, similarity_matrix
+from core.column_sketch import (
+    build_value_index,
+    estimate_containment,
+    profile_table_sketches,
+    query_value_index,
+)
 import pandas as pd
+from utils.instrumentation import instrumented
 
 
+def score_column_pair(
+    lc: str,
+    rc: str,
+    left_profile: dict,
+    right_profile: dict,
+    value_candidate: bool,
+    ns: float | None = None,
+) -> float:
+    """
+    Join-key score for one column pair from precomputed column profiles.
+    Value overlap is only estimated for pairs whose sketches share a value.
+    ns is the precomputed name similarity, if available.
+    """
+    # type compatibility
+    type_score = 1.0 if left_profile["type"] == right_profile["type"] else 0.6
+
+    # name similarity
+    if ns is None:
+        ns = name_similarity(lc, rc)
+
+    # value overlap (share of left values found in right)
+    overlap_ratio = estimate_containment(left_profile, right_profile) if value_candidate else 0.0
+
+    return 0.5 * ns + 0.2 * type_score + 0.3 * overlap_ratio
+
+
+@instrumented(
+    "join_suggest",
+    rows_in=lambda a: len(a["df_left"]) + len(a["df_right"]),
+    rows_out=len,
+)
 def suggest_join_keys_for_pair(
     df_left: pd.DataFrame,
     left_name: str,
     df_right: pd.DataFrame,
     right_name: str,
     max_suggestions: int = 5,
+    left_profiles: dict | None = None,
+    right_profiles: dict | None = None,
 ):
     """
     Suggest possible join key pairs between df_left and df_right,
     based on column name similarity + heuristic type similarity + value overlap.
+    Each column is profiled once (type, cardinality, bottom-k sketch of its
+    value hashes); value-overlap candidates are right columns whose sketch
+    shares a value, scored by estimated containment of the left column. Pass left_profiles / right_profiles to reuse profiles.
     Returns a list of dicts: {left_col, right_col, score}.
     """
-    suggestions = []
-
-    for lc in df_left.columns:
-        left_type = detect_column_type(df_left[lc], lc)
-        left_values = set(df_left[lc].dropna().astype(str).head(200))
-
-        for rc in df_right.columns:
-            right_type = detect_column_type(df_right[rc], rc)
-            right_values = set(df_right[rc].dropna().astype(str).head(200))
+    if left_profiles is None:
+        left_profiles = profile_table_sketches(df_left, table_name=left_name)
+    if right_profiles is None:
+        right_profiles = profile_table_sketches(df_right, table_name=right_name)
 
-            # type compatibility
-            type_score = 1.0 if left_type == right_type else 0.6
+    right_index = build_value_index({rc: p["sketch"] for rc, p in right_profiles.items()})
+    name_scores = similarity_matrix(list(df_left.columns), list(df_right.columns))
 
-            # name similarity
-            ns = name_similarity(lc, rc)
-
-            # value overlap
-            if left_values and right_values:
-                inter = left_values & right_values
-                overlap_ratio = len(inter) / max(len(left_values), 1)
-            else:
-                overlap_ratio = 0.0
+    suggestions = []
+    for i, lc in enumerate(df_left.columns):
+        left_profile = left_profiles[lc]
+        value_candidates = query_value_index(right_index, left_profile["sketch"])
 
-            score = 0.5 * ns + 0.2 * type_score + 0.3 * overlap_ratio
+        for j, rc in enumerate(df_right.columns):
+            score = score_column_pair(
+                lc, rc, left_profile, right_profiles[rc], rc in value_candidates, ns=name_scores[i, j]
+            )
             if score > 0.3:  # threshold
                 suggestions.append(
                     {
@@ -50,4 +85,3 @@ def suggest_join_keys_for_pair(
 
     suggestions.sort(key=lambda x: x["score"], reverse=True)
     return suggestions[:max_suggestions]
-
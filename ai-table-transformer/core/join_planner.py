@@ -0,0 +1,243 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Tuple
+
+from core.merger import simulate_merge_columns
+
+
+# A join whose estimated output has more than this many rows per input row
+# is reported as a fan-out (many-to-many) warning.
+FANOUT_WARN_RATIO = 1.5
+
+
+class JoinTooLargeError(RuntimeError):
+    """Raised before a merge whose estimated output exceeds the row budget."""
+
+
+def _is_numeric(s: pd.Series) -> bool:
+    return pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s)
+
+
+def _is_textual(s: pd.Series) -> bool:
+    return (
+        pd.api.types.is_object_dtype(s)
+        or pd.api.types.is_string_dtype(s)
+        or isinstance(s.dtype, pd.CategoricalDtype)
+    )
+
+
+def _is_integral(s: pd.Series) -> bool:
+    """Float values that are all whole numbers within the int64 range."""
+    values = s.dropna()
+    return bool((values == np.floor(values)).all() and (values.abs() < 2.0 ** 63).all())
+
+
+def _numeric_to_text(s: pd.Series) -> pd.Series:
+    # 1.0 -> "1" so float keys (ints with NaN) match text ids
+    if pd.api.types.is_float_dtype(s) and _is_integral(s):
+        s = s.astype("Int64")
+    return s.astype("string").astype(object).where(s.notna(), None)
+
+
+def _parse_lossless(text: pd.Series) -> Optional[pd.Series]:
+    """
+    text parsed as numbers when every value prints back exactly as written
+    ("10" but not "010", "1.0" or " 1"), else None.
+    """
+    parsed = pd.to_numeric(text, errors="coerce")
+    if parsed.notna().sum() != text.notna().sum():
+        return None
+    if pd.api.types.is_float_dtype(parsed) and _is_integral(parsed):
+        parsed = parsed.astype("Int64")
+    present = text.notna()
+    if not (_numeric_to_text(parsed)[present] == text[present].astype(str)).all():
+        return None
+    return parsed
+
+
+def align_key_dtypes(left: pd.Series, right: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """
+    Cast a pair of join keys to one compact common dtype.
+    Returns the inputs unchanged (same objects) when nothing needs casting.
+      - int / int of different widths -> the smaller common int dtype
+      - int / float -> Int64 when the float side is integral, else float64
+      - text / categorical -> categorical with the union of categories
+      - numeric / text -> numeric if the text side parses losslessly (no
+        leading zeros, no reformatting), else text
+    The results are join operands only: merge_tables_with_rules keeps the
+    original key columns in its output.
+    """
+    if left.dtype == right.dtype and not isinstance(left.dtype, pd.CategoricalDtype):
+        return left, right
+
+    if _is_numeric(left) and _is_numeric(right):
+        if pd.api.types.is_integer_dtype(left) and pd.api.types.is_integer_dtype(right):
+            target = np.promote_types(left.dtype, right.dtype)
+        elif all(pd.api.types.is_integer_dtype(s) or _is_integral(s) for s in (left, right)):
+            # float64 would round ints above 2**53
+            target = pd.Int64Dtype()
+        else:
+            target = np.dtype("float64")
+        return (
+            left if left.dtype == target else left.astype(target),
+            right if right.dtype == target else right.astype(target),
+        )
+
+    if _is_textual(left) and _is_textual(right):
+        if not isinstance(left.dtype, pd.CategoricalDtype) and not isinstance(right.dtype, pd.CategoricalDtype):
+            return left, right
+        categories = pd.Index(pd.unique(pd.concat([left.astype(object), right.astype(object)]).dropna()))
+        target = pd.CategoricalDtype(categories)
+        return left.astype(target), right.astype(target)
+
+    if _is_numeric(left) != _is_numeric(right):
+        num, text = (left, right) if _is_numeric(left) else (right, left)
+        parsed = _parse_lossless(text)
+        if parsed is not None:
+            num, text = align_key_dtypes(num, parsed)
+        else:
+            num, text = _numeric_to_text(num), text.astype(object)
+        return (num, text) if _is_numeric(left) else (text, num)
+
+    return left, right
+
+
+def estimate_join(left_key: pd.Series, right_key: pd.Series, how: str) -> dict:
+    """
+    Exact output size of joining left_key with right_key, computed from value
+    counts only (no rows are materialized). NaN keys match each other, like
+    in pandas.merge.
+    """
+    lvc = left_key.value_counts(dropna=False)
+    rvc = right_key.value_counts(dropna=False)
+    common = lvc.index.intersection(rvc.index)
+    matched = int((lvc.loc[common].to_numpy(dtype="int64") * rvc.loc[common].to_numpy(dtype="int64")).sum())
+    left_unmatched = int(lvc.drop(common).sum())
+    right_unmatched = int(rvc.drop(common).sum())
+
+    rows = matched
+    if how in ("left", "outer"):
+        rows += left_unmatched
+    if how in ("right", "outer"):
+        rows += right_unmatched
+    return {
+        "left_rows": len(left_key),
+        "right_rows": len(right_key),
+        "matched_rows": matched,
+        "right_unmatched": right_unmatched,
+        "output_rows": rows,
+        "right_unique": bool(rvc.max() <= 1) if len(rvc) else True,
+    }
+
+
+def _reorder_leading_joins(
+    steps: List[dict],
+    base_table: str,
+    table_columns: Dict[str, List[str]],
+) -> List[dict]:
+    """
+    Reorder the leading run of joins that commute: left/inner joins on a base
+    table key against a unique right key (so each preserves left row order),
+    whose right tables share no column names outside the base table.
+    Inner joins with the lowest keep ratio run first so later joins see
+    fewer rows.
+    """
+    run = []
+    base_cols = set(table_columns[base_table])
+    seen_cols = set()
+    for step in steps:
+        jr = step["rule"]
+        movable = (
+            jr.get("how", "left") in ("left", "inner")
+            and step["left_origin"][0] == base_table
+            and step["stats"]["right_unique"]
+        )
+        # columns that also exist in the base table get the same suffix in
+        # any order; only clashes between the reordered right tables matter
+        right_cols = set(table_columns[jr["right_table"]]) - base_cols
+        if not movable or right_cols & seen_cols:
+            break
+        seen_cols |= right_cols
+        run.append(step)
+
+    def sort_key(step):
+        stats = step["stats"]
+        keep = stats["output_rows"] / max(stats["left_rows"], 1)
+        return (0 if step["rule"].get("how", "left") == "inner" else 1, keep)
+
+    return sorted(run, key=sort_key) + steps[len(run):]
+
+
+def plan_joins(
+    tables: Dict[str, pd.DataFrame],
+    join_rules: List[dict],
+    max_output_rows: Optional[int] = None,
+    reorder: bool = True,
+) -> dict:
+    """
+    Build a join plan for merge_tables_with_rules.
+    Each step's output size is estimated from key value counts of the table
+    the left key comes from, scaled by the fan-out of earlier steps.
+    Returns {"rules", "columns", "steps", "estimated_rows", "warnings"}.
+    Raises JoinTooLargeError if a step is estimated above max_output_rows.
+    """
+    table_columns = {name: list(df.columns) for name, df in tables.items()}
+    applied, origins = simulate_merge_columns(table_columns, join_rules)
+    base = join_rules[0]["left_table"]
+
+    steps = []
+    warnings = []
+    current_rows = len(tables[base])
+    # merged column names as they exist when the next rule runs
+    names = {c: (base, c) for c in table_columns[base]}
+    for i, jr in enumerate(applied):
+        left_origin = names[jr["left_key"]]
+        how = jr.get("how", "left")
+        left_key, right_key = align_key_dtypes(
+            tables[left_origin[0]][left_origin[1]],
+            tables[jr["right_table"]][jr["right_key"]],
+        )
+        stats = estimate_join(left_key, right_key, how)
+
+        # rows added independently of the left side (unmatched right rows)
+        extra = stats["right_unmatched"] if how in ("right", "outer") else 0
+        ratio = (stats["output_rows"] - extra) / max(stats["left_rows"], 1)
+        est = int(round(current_rows * ratio)) + extra
+
+        label = f"{jr['left_table']}.{jr['left_key']} {how.upper()} JOIN {jr['right_table']}.{jr['right_key']}"
+        if ratio > FANOUT_WARN_RATIO:
+            warnings.append(
+                f"{label}: many-to-many keys multiply rows by ~{ratio:.1f}x "
+                f"({current_rows:,} -> ~{est:,} rows)."
+            )
+        if max_output_rows is not None and est > max_output_rows:
+            raise JoinTooLargeError(
+                f"{label} would produce ~{est:,} rows (limit {max_output_rows:,}). "
+                "Check the join keys or use an inner join."
+            )
+        steps.append({"rule": jr, "left_origin": left_origin, "stats": stats, "ratio": ratio, "extra": extra})
+        current_rows = est
+        _, names = simulate_merge_columns(table_columns, applied[:i + 1])
+
+    ordered = _reorder_leading_joins(steps, base, table_columns) if reorder else steps
+
+    # re-accumulate the estimates in execution order
+    current_rows = len(tables[base])
+    planned_steps = []
+    for step in ordered:
+        current_rows = int(round(current_rows * step["ratio"])) + step["extra"]
+        planned_steps.append(
+            {
+                "rule": step["rule"],
+                "estimated_rows": current_rows,
+                "right_unique": step["stats"]["right_unique"],
+            }
+        )
+
+    return {
+        "rules": [s["rule"] for s in ordered],
+        "columns": list(origins),
+        "steps": planned_steps,
+        "estimated_rows": current_rows,
+        "warnings": warnings,
+    }
@@ -0,0 +1,68 @@
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Optional
+
+
+LLM_CACHE_ROOT = os.path.join(os.path.dirname(os.path.dirname(__file__)), "cache", "llm")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace so formatting-only differences share a cache entry."""
+    return re.sub(r"\s+", " ", prompt).strip()
+
+
+def prompt_key(model_name: str, prompt: str) -> str:
+    h = hashlib.blake2b(digest_size=20)
+    h.update(model_name.encode("utf-8"))
+    h.update(b"\0")
+    h.update(normalize_prompt(prompt).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _path(key: str) -> str:
+    return os.path.join(LLM_CACHE_ROOT, key + ".json")
+
+
+def get_cached_response(model_name: str, prompt: str) -> Optional[str]:
+    """Cached model output for (model, normalized prompt), or None."""
+    path = _path(prompt_key(model_name, prompt))
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)["response"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def put_cached_response(model_name: str, prompt: str, response: str):
+    os.makedirs(LLM_CACHE_ROOT, exist_ok=True)
+    entry = {
+        "model": model_name,
+        "prompt": prompt,
+        "response": response,
+        "created_at": time.time(),
+    }
+    path = _path(prompt_key(model_name, prompt))
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entry, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def llm_cache_info() -> dict:
+    if not os.path.isdir(LLM_CACHE_ROOT):
+        return {"entries": 0, "bytes": 0}
+    files = [os.path.join(LLM_CACHE_ROOT, n) for n in os.listdir(LLM_CACHE_ROOT) if n.endswith(".json")]
+    return {"entries": len(files), "bytes": sum(os.path.getsize(p) for p in files)}
+
+
+def clear_llm_cache():
+    if not os.path.isdir(LLM_CACHE_ROOT):
+        return
+    for name in os.listdir(LLM_CACHE_ROOT):
+        if name.endswith(".json"):
+            os.remove(os.path.join(LLM_CACHE_ROOT, name))
@@ -1,7 +1,91 @@
 import subprocess
 import textwrap
+import threading
+import time
 import pandas as pd
+from typing import Callable, Optional, Tuple
+from core.llm_cache import get_cached_response, put_cached_response
+from core.ollama_client import OllamaUnavailable, pooled_client
+from utils.column_refs import mapping_columns
 from utils.data_preview import df_to_sample_csv
+from utils.instrumentation import stage
+
+
+# Rough size budget for the two CSV samples in the prompt (~4 chars/token).
+SAMPLE_TOKEN_BUDGET = 1500
+CHARS_PER_TOKEN = 4
+MAX_CELL_CHARS = 40
+
+
+_ROW_INSTRUCTIONS = """Now write Python code that:
+
+- Imports pandas as pd.
+- Defines a function: def transform(row):
+- 'row' is a pandas Series with all merged columns available by name.
+- The function returns a dict where:
+    * Keys are exactly the target table D column names.
+    * Values are computed from 'row' according to the mapping hints and the target sample.
+- Do not read or write any files.
+- Do not print anything.
+- Output ONLY complete Python code, including imports and the transform function.
+"""
+
+_DF_INSTRUCTIONS = """Now write Python code that:
+
+- Imports pandas as pd.
+- Defines a function: def transform_df(df):
+- 'df' is the whole merged table as a pandas DataFrame.
+- Use column operations (e.g. df["a"].str.strip(), pd.to_datetime(df["d"]), df["x"] * 2);
+  do not loop over rows and do not use df.apply(..., axis=1) or iterrows().
+- The expressions in the mapping hints are written per row (row["col"]); translate them
+  to the equivalent column operations on df["col"].
+- The function returns a new pandas DataFrame where:
+    * Columns are exactly the target table D column names, in order.
+    * There is one output row per input row, in the same order.
+- Do not read or write any files.
+- Do not print anything.
+- Output ONLY complete Python code, including imports and the transform_df function.
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _trim_cells(df: pd.DataFrame, max_chars: int) -> pd.DataFrame:
+    def _trim(v):
+        if isinstance(v, str) and len(v) > max_chars:
+            return v[: max_chars - 3] + "..."
+        return v
+
+    return df.apply(lambda s: s.map(_trim)) if not df.empty else df
+
+
+def build_prompt_samples(
+    merged_df: pd.DataFrame,
+    target_df: pd.DataFrame,
+    mapping_df: pd.DataFrame,
+    n_rows: int = 10,
+    token_budget: int = SAMPLE_TOKEN_BUDGET,
+) -> Tuple[str, str]:
+    """
+    CSV samples for the prompt: only the merged columns the mapping uses
+    (source columns and row["..."] references; all columns if none are
+    mapped), long cells shortened, and rows dropped until both samples fit
+    token_budget. Returns (merged_sample_csv, target_sample_csv).
+    """
+    cols = mapping_columns(mapping_df, available=merged_df.columns)
+    merged = merged_df[cols] if cols else merged_df
+    merged = _trim_cells(merged.head(n_rows), MAX_CELL_CHARS)
+    target = _trim_cells(target_df.head(n_rows), MAX_CELL_CHARS)
+
+    rows = n_rows
+    while True:
+        merged_csv = df_to_sample_csv(merged, n_rows=rows)
+        target_csv = df_to_sample_csv(target, n_rows=rows)
+        if rows <= 1 or estimate_tokens(merged_csv) + estimate_tokens(target_csv) <= token_budget:
+            return merged_csv, target_csv
+        rows -= 1
 
 
 def _clean_llm_code(raw: str) -> str:
@@ -15,15 +99,16 @@ def _clean_llm_code(raw: str) -> str:
     return content
 
 
-def generate_transform_code_with_llm(
+def build_transform_prompt(
     merged_sample_csv: str,
     target_sample_csv: str,
     mapping_df: pd.DataFrame,
-    model_name: str = "deepseek-coder:1.3b",
+    vectorized: bool = False,
 ) -> str:
     """
-    Use local deepseek-coder via Ollama to generate Python transform(row) code.
-    mapping_df has columns: target_column, source_column, expression.
+    Prompt asking for transform(row) code, or for transform_df(df) code using
+    column operations when vectorized=True.
+    mapping_df: target_column, source_column, expression.
     """
     mapping_text_lines = []
     for _, row in mapping_df.iterrows():
@@ -38,7 +123,14 @@ def generate_transform_code_with_llm(
         "You will generate a Python function transform(row) that converts a row of "
         "the merged table into a row of the final target table D."
     )
+    if vectorized:
+        system_prompt = (
+            "You are an expert Python data engineer. "
+            "You will generate a Python function transform_df(df) that converts the whole "
+            "merged table into the final target table D using vectorized pandas column operations."
+        )
 
+    instructions = _DF_INSTRUCTIONS if vectorized else _ROW_INSTRUCTIONS
     user_prompt = f"""
 Here is a CSV sample of the merged source table:
 
@@ -59,31 +151,96 @@ Below are user-provided mapping hints between columns:
 - If an expression is provided (expr=...), you may implement that using the 'row' (pandas Series).
 - You may also add simple type conversions, date formatting (using pandas.to_datetime), and numeric calculations.
 
-Now write Python code that:
+{instructions}"""
 
-- Imports pandas as pd.
-- Defines a function: def transform(row):
-- 'row' is a pandas Series with all merged columns available by name.
-- The function returns a dict where:
-    * Keys are exactly the target table D column names.
-    * Values are computed from 'row' according to the mapping hints and the target sample.
-- Do not read or write any files.
-- Do not print anything.
-- Output ONLY complete Python code, including imports and the transform function.
-"""
+    return f"{system_prompt}\n\n{user_prompt}"
 
-    prompt = f"{system_prompt}\n\n{user_prompt}"
 
-    result = subprocess.run(
-        ["ollama", "run", model_name],
-        input=prompt,
-        text=True,
-        capture_output=True,
-    )
+def run_llm(
+    prompt: str,
+    model_name: str = "deepseek-coder:1.3b",
+    use_cache: bool = True,
+    on_token: Optional[Callable[[str], None]] = None,
+    cancel_event: Optional[threading.Event] = None,
+    options: Optional[dict] = None,
+) -> str:
+    """
+    Raw model output for prompt. Uses a pooled persistent HTTP client (streaming
+    pieces to on_token) and falls back to the `ollama run` CLI when no server
+    is listening. Responses are cached on disk per (model, normalized prompt);
+    options (e.g. temperature) disable the cache because answers vary.
+    Each call is recorded as an "llm" stage with its latency and time to
+    first token.
+    """
+    use_cache = use_cache and not options
+    with stage("llm", model=model_name, prompt_tokens=estimate_tokens(prompt)) as record:
+        raw_output: Optional[str] = get_cached_response(model_name, prompt) if use_cache else None
+        record["cached"] = raw_output is not None
+        if raw_output is not None:
+            if on_token is not None:
+                on_token(raw_output)
+            return raw_output
+
+        started = time.perf_counter()
+
+        def _on_token(piece):
+            record.setdefault("first_token_seconds", time.perf_counter() - started)
+            if on_token is not None:
+                on_token(piece)
+
+        try:
+            with pooled_client() as client:
+                raw_output = client.generate(
+                    model_name, prompt, options=options, on_token=_on_token, cancel_event=cancel_event
+                )
+        except OllamaUnavailable:
+            record["backend"] = "cli"
+            result = subprocess.run(
+                ["ollama", "run", model_name],
+                input=prompt,
+                text=True,
+                capture_output=True,
+            )
+
+            if result.returncode != 0:
+                raise RuntimeError(f"Ollama/deepseek-coder failed: {result.stderr}")
+
+            raw_output = result.stdout
+            _on_token(raw_output)
+
+        record["response_tokens"] = estimate_tokens(raw_output)
+        if use_cache and raw_output.strip():
+            put_cached_response(model_name, prompt, raw_output)
+        return raw_output
 
-    if result.returncode != 0:
-        raise RuntimeError(f"Ollama/deepseek-coder failed: {result.stderr}")
 
-    raw_output = result.stdout
+def generate_transform_code_with_llm(
+    merged_sample_csv: str,
+    target_sample_csv: str,
+    mapping_df: pd.DataFrame,
+    model_name: str = "deepseek-coder:1.3b",
+    use_cache: bool = True,
+    on_token: Optional[Callable[[str], None]] = None,
+    cancel_event: Optional[threading.Event] = None,
+    options: Optional[dict] = None,
+    vectorized: bool = False,
+) -> str:
+    """
+    Use local deepseek-coder via Ollama to generate Python transform(row) code
+    (or transform_df(df) code with vectorized=True).
+    mapping_df has columns: target_column, source_column, expression.
+    Output is streamed to on_token as it arrives; identical requests are
+    answered from the response cache unless use_cache=False. options are
+    passed to the model (e.g. {"temperature": 0.8, "seed": 1}).
+    """
+    prompt = build_transform_prompt(merged_sample_csv, target_sample_csv, mapping_df, vectorized=vectorized)
+    raw_output = run_llm(
+        prompt,
+        model_name=model_name,
+        use_cache=use_cache,
+        on_token=on_token,
+        cancel_event=cancel_event,
+        options=options,
+    )
     code = _clean_llm_code(raw_output)
     return textwrap.dedent(code).strip()
@@ -0,0 +1,303 @@
+import ast
+import numpy as np
+import pandas as pd
+from typing import Callable, List, Optional, Tuple
+
+from utils.instrumentation import frame_rows, instrumented
+
+
+class _Uncompilable(Exception):
+    """Raised when an expression cannot be turned into column operations."""
+
+
+# Python str methods that have a same-named pandas .str accessor method
+# and only take constant arguments.
+_STR_METHODS = {
+    "strip",
+    "lstrip",
+    "rstrip",
+    "lower",
+    "upper",
+    "title",
+    "capitalize",
+    "zfill",
+    "startswith",
+    "endswith",
+}
+
+_DT_ATTRS = {"year", "month", "day", "hour", "minute", "second", "dayofweek"}
+
+_BIN_OPS = {
+    ast.Add: lambda a, b: a + b,
+    ast.Sub: lambda a, b: a - b,
+    ast.Mult: lambda a, b: a * b,
+    ast.Div: lambda a, b: a / b,
+    ast.FloorDiv: lambda a, b: a // b,
+    ast.Mod: lambda a, b: a % b,
+}
+
+# Names available to expressions that fall back to per-row evaluation.
+_EXPR_GLOBALS = {"pd": pd, "np": np}
+
+
+def _const(node: ast.AST):
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub) and isinstance(node.operand, ast.Constant):
+        return -node.operand.value
+    raise _Uncompilable(ast.dump(node))
+
+
+def _const_args(node: ast.Call) -> Tuple[list, dict]:
+    args = [_const(a) for a in node.args]
+    kwargs = {}
+    for kw in node.keywords:
+        if kw.arg is None:
+            raise _Uncompilable("**kwargs")
+        kwargs[kw.arg] = _const(kw.value)
+    return args, kwargs
+
+
+def _compile_node(node: ast.AST) -> Tuple[str, Callable]:
+    """
+    Compile one expression node into (kind, fn(df)).
+    kind is one of: 'series', 'list' (Series of lists, e.g. after split),
+    'datetime' (datetime64 Series) or 'scalar'.
+    """
+    # row["col"]
+    if (
+        isinstance(node, ast.Subscript)
+        and isinstance(node.value, ast.Name)
+        and node.value.id == "row"
+    ):
+        col = _const(node.slice)
+        return "series", lambda df: df[col]
+
+    if isinstance(node, ast.Constant):
+        value = node.value
+        return "scalar", lambda df: value
+
+    # x[0], x[-1], x[1:3]
+    if isinstance(node, ast.Subscript):
+        kind, inner = _compile_node(node.value)
+        if kind not in ("series", "list"):
+            raise _Uncompilable("subscript on non-column value")
+        if isinstance(node.slice, ast.Slice):
+            start = _const(node.slice.lower) if node.slice.lower else None
+            stop = _const(node.slice.upper) if node.slice.upper else None
+            step = _const(node.slice.step) if node.slice.step else None
+            return kind, lambda df: inner(df).str[start:stop:step]
+        idx = _const(node.slice)
+        if not isinstance(idx, int):
+            raise _Uncompilable("non-integer index")
+        return "series", lambda df: inner(df).str[idx]
+
+    # x.year, x.month on datetimes
+    if isinstance(node, ast.Attribute):
+        kind, inner = _compile_node(node.value)
+        if kind == "datetime" and node.attr in _DT_ATTRS:
+            attr = node.attr
+            return "series", lambda df: getattr(inner(df).dt, attr)
+        raise _Uncompilable(f"attribute {node.attr}")
+
+    if isinstance(node, ast.Call):
+        return _compile_call(node)
+
+    if isinstance(node, ast.BinOp) and type(node.op) in _BIN_OPS:
+        lkind, lfn = _compile_node(node.left)
+        rkind, rfn = _compile_node(node.right)
+        if "list" in (lkind, rkind):
+            raise _Uncompilable("arithmetic on split result")
+        op = _BIN_OPS[type(node.op)]
+        kind = "scalar" if lkind == rkind == "scalar" else "series"
+        return kind, lambda df: op(lfn(df), rfn(df))
+
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        kind, inner = _compile_node(node.operand)
+        if kind == "list":
+            raise _Uncompilable("negation of split result")
+        return kind, lambda df: -inner(df)
+
+    raise _Uncompilable(type(node).__name__)
+
+
+def _compile_call(node: ast.Call) -> Tuple[str, Callable]:
+    func = node.func
+
+    # builtins: str(x), int(x), float(x), len(x)
+    if isinstance(func, ast.Name) and func.id in ("str", "int", "float", "len"):
+        if len(node.args) != 1 or node.keywords:
+            raise _Uncompilable(func.id)
+        kind, inner = _compile_node(node.args[0])
+        if kind == "scalar":
+            raise _Uncompilable("builtin on constant")
+        if func.id == "len":
+            return "series", lambda df: inner(df).str.len()
+        if func.id == "str":
+            return "series", lambda df: inner(df).astype(str)
+        if func.id == "float":
+            return "series", lambda df: pd.to_numeric(inner(df), errors="raise").astype("float64")
+        return "series", lambda df: _to_int(inner(df))
+
+    # pd.to_datetime(x, ...), pd.to_numeric(x, ...)
+    if (
+        isinstance(func, ast.Attribute)
+        and isinstance(func.value, ast.Name)
+        and func.value.id == "pd"
+        and func.attr in ("to_datetime", "to_numeric")
+    ):
+        if not node.args:
+            raise _Uncompilable(func.attr)
+        kind, inner = _compile_node(node.args[0])
+        if kind not in ("series", "datetime"):
+            raise _Uncompilable(func.attr)
+        extra = ast.Call(func=func, args=node.args[1:], keywords=node.keywords)
+        args, kwargs = _const_args(extra)
+        caster = getattr(pd, func.attr)
+        out_kind = "datetime" if func.attr == "to_datetime" else "series"
+        return out_kind, lambda df: caster(inner(df), *args, **kwargs)
+
+    if not isinstance(func, ast.Attribute):
+        raise _Uncompilable("call")
+
+    kind, inner = _compile_node(func.value)
+    method = func.attr
+    args, kwargs = _const_args(node)
+
+    if kind == "datetime":
+        if method == "strftime" and len(args) == 1 and not kwargs:
+            fmt = args[0]
+            return "series", lambda df: inner(df).dt.strftime(fmt)
+        if method == "date" and not args and not kwargs:
+            return "series", lambda df: inner(df).dt.date
+        raise _Uncompilable(f"datetime.{method}")
+
+    if kind != "series":
+        raise _Uncompilable(f"{method} on {kind}")
+
+    if method == "split":
+        if kwargs or len(args) > 2:
+            raise _Uncompilable("split signature")
+        sep = args[0] if args else None
+        maxsplit = args[1] if len(args) > 1 else -1
+        return "list", lambda df: inner(df).str.split(sep, n=maxsplit, regex=False)
+
+    if method == "replace":
+        if kwargs or len(args) not in (2, 3):
+            raise _Uncompilable("replace signature")
+        count = args[2] if len(args) == 3 else -1
+        return "series", lambda df: inner(df).str.replace(args[0], args[1], n=count, regex=False)
+
+    if method in _STR_METHODS:
+        return "series", lambda df: getattr(inner(df).str, method)(*args, **kwargs)
+
+    raise _Uncompilable(f"method {method}")
+
+
+def _to_int(s: pd.Series) -> pd.Series:
+    num = pd.to_numeric(s, errors="raise")
+    if num.isna().any() or not (num == np.floor(num)).all():
+        # int() would fail or truncate on some rows; let row mode decide.
+        raise _Uncompilable("int() on non-integral values")
+    return num.astype("int64")
+
+
+def compile_mapping(mapping_df: pd.DataFrame) -> List[dict]:
+    """
+    Turn mapping_df (target_column, source_column, expression) into a list of
+    column plans: {target_column, mode, source_column, expression, fn, code}.
+    mode is 'copy', 'vector' (column-level ops), 'row' (per-row eval fallback)
+    or 'empty'. Raises SyntaxError for expressions that are not valid Python.
+    """
+    plans = []
+    for _, row in mapping_df.iterrows():
+        target = row["target_column"]
+        source = row.get("source_column")
+        expr = row.get("expression")
+        source = None if pd.isna(source) or source == "" else source
+        expr = None if pd.isna(expr) or not str(expr).strip() else str(expr).strip()
+
+        plan = {
+            "target_column": target,
+            "mode": "empty",
+            "source_column": source,
+            "expression": expr,
+            "fn": None,
+            "code": None,
+        }
+        if expr is not None:
+            tree = ast.parse(expr, mode="eval")
+            plan["code"] = compile(tree, f"<expr {target}>", "eval")
+            try:
+                kind, fn = _compile_node(tree.body)
+                plan["mode"] = "vector"
+                plan["fn"] = fn
+                plan["kind"] = kind
+            except _Uncompilable:
+                plan["mode"] = "row"
+        elif source is not None:
+            plan["mode"] = "copy"
+        plans.append(plan)
+    return plans
+
+
+def _eval_rowwise(code, df: pd.DataFrame) -> pd.Series:
+    if df.empty:
+        return pd.Series([], index=df.index, dtype=object)
+    return df.apply(lambda r: eval(code, _EXPR_GLOBALS, {"row": r}), axis=1)
+
+
+def _run_plan(plan: dict, df: pd.DataFrame):
+    mode = plan["mode"]
+    if mode == "copy":
+        return df[plan["source_column"]]
+    if mode == "empty":
+        return None
+    if mode == "vector":
+        try:
+            out = plan["fn"](df)
+        except Exception:
+            # Column ops failed on this data (e.g. a non-string value);
+            # re-run row by row so errors match transform(row) semantics.
+            return _eval_rowwise(plan["code"], df)
+        if plan.get("kind") == "scalar":
+            return pd.Series([out] * len(df), index=df.index)
+        return out
+    return _eval_rowwise(plan["code"], df)
+
+
+@instrumented("transform_mapping", rows_in=lambda a: len(a["merged_df"]), rows_out=frame_rows)
+def apply_mapping_vectorized(
+    mapping_df: pd.DataFrame,
+    merged_df: pd.DataFrame,
+    compiled: Optional[List[dict]] = None,
+) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+    """
+    Build table D directly from mapping_df using column-level pandas operations.
+    Direct copies, str methods (split/strip/...), casts and pd.to_datetime are
+    executed once per column; other expressions fall back to per-row eval.
+    Returns (result_df, error_message), like apply_transform_code.
+    Note: missing split parts become NaN instead of raising IndexError.
+    """
+    if compiled is None:
+        try:
+            compiled = compile_mapping(mapping_df)
+        except SyntaxError as e:
+            return None, f"Invalid expression: {e}"
+
+    out = {}
+    for plan in compiled:
+        target = plan["target_column"]
+        if plan["mode"] == "copy" and plan["source_column"] not in merged_df.columns:
+            return None, f"Source column '{plan['source_column']}' for '{target}' not found in merged table."
+        try:
+            values = _run_plan(plan, merged_df)
+        except Exception as e:
+            return None, f"Error computing column '{target}': {e}"
+        out[target] = values.reset_index(drop=True) if values is not None else None
+
+    try:
+        result_df = pd.DataFrame(out, index=pd.RangeIndex(len(merged_df)))
+    except Exception as e:
+        return None, f"Error building result DataFrame: {e}"
+    return result_df, None
@@ -0,0 +1,95 @@
+import math
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+
+MAPPING_FIELDS = ("target_column", "source_column", "expression")
+
+# Row filters offered by the editor.
+MAPPING_FILTERS = ("All", "Edited", "Unmapped")
+
+
+def _value(v) -> Optional[str]:
+    if v is None:
+        return None
+    try:
+        if pd.isna(v):
+            return None
+    except (TypeError, ValueError):
+        pass
+    v = str(v)
+    return v if v.strip() else None
+
+
+def base_row(base_df: pd.DataFrame, target: str) -> dict:
+    match = base_df.index[base_df["target_column"] == target]
+    if len(match) == 0:
+        return {"source_column": None, "expression": None}
+    row = base_df.loc[match[0]]
+    return {"source_column": _value(row.get("source_column")), "expression": _value(row.get("expression"))}
+
+
+def record_mapping_edit(
+    base_df: pd.DataFrame,
+    edits: Dict[str, dict],
+    target: str,
+    source_column: Optional[str],
+    expression: Optional[str],
+) -> Dict[str, dict]:
+    """
+    Update edits ({target_column: {source_column, expression}}) in place for
+    one row; an edit that restores the base row is dropped.
+    """
+    edit = {"source_column": _value(source_column), "expression": _value(expression)}
+    if edit == base_row(base_df, target):
+        edits.pop(target, None)
+    else:
+        edits[target] = edit
+    return edits
+
+
+def apply_mapping_edits(base_df: pd.DataFrame, edits: Dict[str, dict]) -> pd.DataFrame:
+    """The base mapping with every edited row replaced."""
+    rows = []
+    for _, row in base_df.iterrows():
+        target = row["target_column"]
+        edit = edits.get(target)
+        if edit is None:
+            edit = {"source_column": _value(row.get("source_column")), "expression": _value(row.get("expression"))}
+        rows.append({"target_column": target, **edit})
+    return pd.DataFrame(rows, columns=list(MAPPING_FIELDS), dtype=object)
+
+
+def filter_mapping_rows(
+    mapping_df: pd.DataFrame,
+    query: str = "",
+    row_filter: str = "All",
+    edits: Optional[Dict[str, dict]] = None,
+) -> List[int]:
+    """
+    Positions of the mapping rows whose target (or source) column contains
+    query, case-insensitively, narrowed by row_filter (see MAPPING_FILTERS).
+    """
+    query = query.strip().lower()
+    edits = edits or {}
+    positions = []
+    for pos, row in enumerate(mapping_df.itertuples(index=False)):
+        target = str(row.target_column)
+        source = _value(row.source_column)
+        if query and query not in target.lower() and query not in (source or "").lower():
+            continue
+        if row_filter == "Edited" and target not in edits:
+            continue
+        if row_filter == "Unmapped" and (source or _value(row.expression)):
+            continue
+        positions.append(pos)
+    return positions
+
+
+def page_bounds(n_rows: int, page: int, page_size: int) -> Tuple[int, int, int]:
+    """(start, stop, n_pages) for a 1-based page, clamped to the valid range."""
+    n_pages = max(1, math.ceil(n_rows / page_size))
+    page = min(max(page, 1), n_pages)
+    start = (page - 1) * page_size
+    return start, min(start + page_size, n_rows), n_pages
@@ -1,29 +1,120 @@
+import numpy as np
 import pandas as pd
-from typing import Dict, List
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
 
+from utils.fingerprint import dataframe_fingerprint, estimate_memory_bytes
+from utils.instrumentation import frame_rows, instrumented
+from utils.logger import log
 
-def merge_tables_with_rules(
-    tables: Dict[str, pd.DataFrame],
+
+# Memo of intermediate merge results, keyed on
+# (content hashes of the tables used so far, rule prefix, key alignment).
+# Bounded by MERGE_MEMO_MAX_BYTES with least-recently-used eviction.
+MERGE_MEMO_MAX_BYTES = 1024 ** 3
+_MERGE_MEMO = OrderedDict()  # key -> (DataFrame, size_bytes)
+_merge_memo_stats = {"bytes": 0, "hits": 0, "misses": 0}
+
+
+def simulate_merge_columns(
+    table_columns: Dict[str, List[str]],
     join_rules: List[dict],
-) -> pd.DataFrame | None:
+) -> Tuple[List[dict], Dict[str, Tuple[str, str]]]:
     """
-    Sequentially apply join rules.
-    join_rules: list of dict with keys:
-      left_table, right_table, left_key, right_key, how
-    We always start from the first rule's left_table as base,
-    then apply each rule's join in listed order.
+    Replay merge_tables_with_rules on column names only.
+    Returns (applied_rules, origins) where applied_rules are the rules that
+    would not be skipped and origins maps each merged column name, in output
+    order, to the (table, column) it comes from.
     """
-    if not join_rules:
-        return None
+    if not join_rules or join_rules[0]["left_table"] not in table_columns:
+        return [], {}
 
     first_left = join_rules[0]["left_table"]
-    if first_left not in tables:
-        return None
+    origins = {c: (first_left, c) for c in table_columns[first_left]}
+    applied = []
+
+    for jr in join_rules:
+        rt, lk, rk = jr["right_table"], jr["left_key"], jr["right_key"]
+        if rt not in table_columns or lk not in origins:
+            continue
+        applied.append(jr)
+        right_cols = list(table_columns[rt])
+        # pandas keeps a single key column when both key names are equal
+        shared_key = rk if lk == rk else None
+        overlap = (set(origins) & set(right_cols)) - {shared_key}
+        for c in right_cols:
+            if c == shared_key:
+                continue
+            name = f"{c}_{rt}" if c in overlap else c
+            origins[name] = (rt, c)
+    return applied, origins
+
+
+def _project_tables(tables: Dict[str, pd.DataFrame], columns: Dict[str, List[str]]) -> Dict[str, pd.DataFrame]:
+    projected = {}
+    for name, df in tables.items():
+        keep = set(columns.get(name, df.columns))
+        cols = [c for c in df.columns if c in keep]
+        projected[name] = df if len(cols) == df.shape[1] else df[cols]
+    return projected
 
-    merged = tables[first_left].copy()
 
+# Temporary columns holding aligned join operands during one merge.
+_LEFT_KEY, _RIGHT_KEY, _RIGHT_KEY_VALUE, _SIDE = "__left_key", "__right_key", "__right_key_value", "__side"
+
+
+def _merge_aligned(
+    merged: pd.DataFrame,
+    right_df: pd.DataFrame,
+    lk: str,
+    rk: str,
+    how: str,
+    rt: str,
+    left_key: pd.Series,
+    right_key: pd.Series,
+) -> pd.DataFrame:
+    """
+    merged.merge(right_df) joined on the aligned key operands, with the same
+    columns, values and dtypes as merging on lk / rk directly: the aligned
+    keys live in temporary columns that are dropped afterwards.
+    """
+    left = merged.assign(**{_LEFT_KEY: left_key})
+    right = right_df.assign(**{_RIGHT_KEY: right_key})
+    shared = lk == rk
+    if shared:
+        # pandas keeps one column for equal-named keys, filled from the
+        # right side for right-only rows
+        right = right.rename(columns={rk: _RIGHT_KEY_VALUE})
+    out = left.merge(
+        right,
+        left_on=_LEFT_KEY,
+        right_on=_RIGHT_KEY,
+        how=how,
+        suffixes=("", f"_{rt}"),
+        sort=False,
+        indicator=_SIDE if shared and how in ("right", "outer") else False,
+    )
+    if shared:
+        if how in ("right", "outer"):
+            right_only = (out[_SIDE] == "right_only").to_numpy()
+            values = np.where(right_only, out[_RIGHT_KEY_VALUE].astype(object), out[lk].astype(object))
+            out[lk] = pd.Series(values, index=out.index, dtype=object).infer_objects()
+        out = out.drop(columns=[_RIGHT_KEY_VALUE] + ([_SIDE] if how in ("right", "outer") else []))
+    return out.drop(columns=[_LEFT_KEY, _RIGHT_KEY])
+
+
+def _execute_rules(
+    merged: pd.DataFrame,
+    tables: Dict[str, pd.DataFrame],
+    join_rules: List[dict],
+    align_keys: bool = False,
+) -> Tuple[pd.DataFrame, int]:
+    """Apply rules in order. Returns (merged, number_of_rules_applied)."""
+    if align_keys:
+        from core.join_planner import align_key_dtypes
+
+    applied = 0
     for jr in join_rules:
-        lt = jr["left_table"]
         rt = jr["right_table"]
         lk = jr["left_key"]
         rk = jr["right_key"]
@@ -40,12 +131,174 @@ def merge_tables_with_rules(
             # user might have misconfigured; we skip this rule
             continue
 
+        if align_keys:
+            left_col, right_col = merged[lk], right_df[rk]
+            left_key, right_key = align_key_dtypes(left_col, right_col)
+            if left_key is not left_col or right_key is not right_col:
+                merged = _merge_aligned(merged, right_df, lk, rk, how, rt, left_key, right_key)
+                applied += 1
+                continue
+
         merged = merged.merge(
             right_df,
             left_on=lk,
             right_on=rk,
             how=how,
             suffixes=("", f"_{rt}"),
+            sort=False,
         )
+        applied += 1
+    return merged, applied
+
+
+def _rule_key(jr: dict) -> tuple:
+    return (jr["left_table"], jr["right_table"], jr["left_key"], jr["right_key"], jr.get("how", "left"))
+
+
+def _memo_put(key: tuple, df: pd.DataFrame):
+    size = estimate_memory_bytes(df)
+    if size > MERGE_MEMO_MAX_BYTES:
+        return
+    if key in _MERGE_MEMO:
+        _merge_memo_stats["bytes"] -= _MERGE_MEMO.pop(key)[1]
+    _MERGE_MEMO[key] = (df, size)
+    _merge_memo_stats["bytes"] += size
+    while _merge_memo_stats["bytes"] > MERGE_MEMO_MAX_BYTES:
+        _, (_, evicted) = _MERGE_MEMO.popitem(last=False)
+        _merge_memo_stats["bytes"] -= evicted
+
+
+def clear_merge_memo():
+    _MERGE_MEMO.clear()
+    _merge_memo_stats.update({"bytes": 0, "hits": 0, "misses": 0})
+
+
+def merge_memo_info() -> dict:
+    return {"entries": len(_MERGE_MEMO), **_merge_memo_stats, "max_bytes": MERGE_MEMO_MAX_BYTES}
+
+
+def _execute_rules_memoized(
+    tables: Dict[str, pd.DataFrame],
+    join_rules: List[dict],
+    align_keys: bool,
+) -> Tuple[pd.DataFrame, int]:
+    """
+    Like _execute_rules, but every intermediate result is memoized on
+    (table content hashes, rule prefix). Appending a rule resumes from the
+    cached prefix; re-uploading a table only invalidates the joins from its
+    first use onwards.
+    """
+    first_left = join_rules[0]["left_table"]
+    table_columns = {name: list(df.columns) for name, df in tables.items()}
+    applied, _ = simulate_merge_columns(table_columns, join_rules)
+
+    hashes = [dataframe_fingerprint(tables[first_left])]
+    keys = []
+    for i, jr in enumerate(applied):
+        hashes.append(dataframe_fingerprint(tables[jr["right_table"]]))
+        keys.append((tuple(hashes), tuple(_rule_key(r) for r in applied[: i + 1]), align_keys))
+
+    merged, start = tables[first_left], 0
+    for i in range(len(keys) - 1, -1, -1):
+        if keys[i] in _MERGE_MEMO:
+            _MERGE_MEMO.move_to_end(keys[i])
+            merged, start = _MERGE_MEMO[keys[i]][0], i + 1
+            _merge_memo_stats["hits"] += 1
+            break
+    else:
+        if keys:
+            _merge_memo_stats["misses"] += 1
+
+    for i in range(start, len(applied)):
+        merged, _ = _execute_rules(merged, tables, [applied[i]], align_keys=align_keys)
+        _memo_put(keys[i], merged)
+    return merged, len(applied)
+
+
+@instrumented(
+    "merge",
+    rows_in=lambda a: sum(len(df) for df in a["tables"].values()),
+    rows_out=frame_rows,
+)
+def merge_tables_with_rules(
+    tables: Dict[str, pd.DataFrame],
+    join_rules: List[dict],
+    optimize: bool = False,
+    max_output_rows: Optional[int] = None,
+    report: Optional[dict] = None,
+    engine: str = "pandas",
+    use_memo: bool = False,
+    columns: Optional[Dict[str, List[str]]] = None,
+) -> pd.DataFrame | None:
+    """
+    Sequentially apply join rules.
+    join_rules: list of dict with keys:
+      left_table, right_table, left_key, right_key, how
+    We always start from the first rule's left_table as base,
+    then apply each rule's join in listed order.
+
+    With optimize=True a join plan is built first (see core.join_planner):
+    output sizes are estimated from key statistics, leading many-to-one
+    joins are reordered so row-reducing inner joins run first, mismatched
+    key dtypes are aligned for the join (the key columns in the output keep
+    their original values and dtypes), and JoinTooLargeError is raised
+    before any merge whose estimated output exceeds max_output_rows. The
+    result has the same columns, in the same order, as the unoptimized path.
+    If a report dict is passed it receives the plan.
+
+    engine="duckdb" runs all rules as one SQL query in an embedded DuckDB
+    database (see core.sql_merger), which joins in parallel and can spill to
+    disk; the plan is still used for estimates, warnings and the row limit.
+
+    With use_memo=True (pandas engine) intermediate results are memoized so
+    that appending a rule or re-uploading one table only recomputes the
+    joins downstream of the change. Memoized results are shared: treat the
+    returned DataFrame as read-only.
+
+    columns ({table: columns to keep}, see core.projection) prunes tables
+    before any join, so unused columns are never carried through the merge.
+    """
+    if not join_rules:
+        return None
+
+    first_left = join_rules[0]["left_table"]
+    if first_left not in tables:
+        return None
+
+    if columns:
+        tables = _project_tables(tables, columns)
+
+    rules = join_rules
+    column_order = None
+    if optimize:
+        from core.join_planner import plan_joins
+
+        plan = plan_joins(tables, join_rules, max_output_rows=max_output_rows)
+        for warning in plan["warnings"]:
+            log(f"[merge plan] {warning}")
+        if report is not None:
+            report.update(plan)
+        rules = plan["rules"]
+        column_order = plan["columns"]
+
+    if engine == "duckdb":
+        from core.sql_merger import merge_tables_with_sql
+
+        merged = merge_tables_with_sql(tables, rules, align_keys=optimize)
+        if merged is not None and column_order is not None and list(merged.columns) != column_order:
+            merged = merged[column_order]
+        return merged
+    if engine != "pandas":
+        raise ValueError(f"Unknown merge engine: {engine}")
+
+    # merge() returns a new frame, so the base table is not copied up front.
+    if use_memo:
+        merged, applied = _execute_rules_memoized(tables, rules, align_keys=optimize)
+    else:
+        merged, applied = _execute_rules(tables[first_left], tables, rules, align_keys=optimize)
+    if not applied:
+        return merged.copy()
 
+    if column_order is not None and list(merged.columns) != column_order:
+        merged = merged[column_order]
     return merged
@@ -0,0 +1,194 @@
+import http.client
+import json
+import os
+import socket
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+
+DEFAULT_OLLAMA_HOST = "127.0.0.1:11434"
+
+# How long the server keeps the model loaded after a request.
+DEFAULT_KEEP_ALIVE = "30m"
+DEFAULT_TIMEOUT = 120.0
+
+# Idle clients (open connections) kept per host by pooled_client.
+MAX_IDLE_CLIENTS = 8
+
+
+class OllamaError(RuntimeError):
+    """The Ollama server could not be reached or returned an error."""
+
+
+class OllamaUnavailable(OllamaError):
+    """No Ollama server is listening at the configured host."""
+
+
+class GenerationCancelled(OllamaError):
+    """Generation was stopped through the cancel_event."""
+
+
+def _parse_host(host: Optional[str]) -> Tuple[str, int]:
+    host = host or os.environ.get("OLLAMA_HOST") or DEFAULT_OLLAMA_HOST
+    if "://" not in host:
+        host = "http://" + host
+    parts = urlsplit(host)
+    return parts.hostname or "127.0.0.1", parts.port or 11434
+
+
+class OllamaClient:
+    """
+    Minimal client for the local Ollama HTTP API that keeps one persistent
+    connection. Not thread-safe: check one out per call with pooled_client.
+    """
+
+    def __init__(
+        self,
+        host: Optional[str] = None,
+        timeout: float = DEFAULT_TIMEOUT,
+        keep_alive: str = DEFAULT_KEEP_ALIVE,
+    ):
+        self.host, self.port = _parse_host(host)
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self._conn: Optional[http.client.HTTPConnection] = None
+
+    def _connection(self) -> http.client.HTTPConnection:
+        if self._conn is None:
+            self._conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _request(self, method: str, path: str, body: Optional[dict] = None) -> http.client.HTTPResponse:
+        payload = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+        # A kept-alive connection may have been closed by the server: retry once.
+        retried = False
+        while True:
+            conn = self._connection()
+            try:
+                conn.request(method, path, body=payload, headers=headers)
+                return conn.getresponse()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError) as e:
+                self.close()
+                if retried:
+                    raise OllamaError(f"Ollama server at {self.host}:{self.port} closed the connection.") from e
+                retried = True
+            except ConnectionRefusedError as e:
+                self.close()
+                raise OllamaUnavailable(f"No Ollama server at {self.host}:{self.port}.") from e
+            except (socket.timeout, OSError) as e:
+                self.close()
+                raise OllamaError(f"Cannot reach Ollama server at {self.host}:{self.port}: {e}") from e
+
+    def is_available(self) -> bool:
+        """True if the server answers /api/tags."""
+        try:
+            resp = self._request("GET", "/api/tags")
+            resp.read()
+            return resp.status == 200
+        except OllamaError:
+            return False
+
+    def generate_stream(
+        self,
+        model: str,
+        prompt: str,
+        options: Optional[dict] = None,
+        cancel_event: Optional[threading.Event] = None,
+    ) -> Iterator[str]:
+        """
+        Yield response text pieces from /api/generate as they arrive
+        (NDJSON stream). Setting cancel_event stops generation and raises
+        GenerationCancelled; the connection is dropped so the server stops too.
+        """
+        body = {"model": model, "prompt": prompt, "stream": True, "keep_alive": self.keep_alive}
+        if options:
+            body["options"] = options
+        resp = self._request("POST", "/api/generate", body)
+        if resp.status != 200:
+            detail = resp.read().decode("utf-8", "replace")
+            raise OllamaError(f"Ollama returned HTTP {resp.status}: {detail}")
+
+        finished = False
+        try:
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise GenerationCancelled("Generation cancelled.")
+                try:
+                    line = resp.readline()
+                except socket.timeout as e:
+                    raise OllamaError(f"Ollama did not respond within {self.timeout}s.") from e
+                if not line:
+                    break
+                line = line.strip()
+                if not line:
+                    continue
+                msg = json.loads(line)
+                if "error" in msg:
+                    raise OllamaError(msg["error"])
+                if msg.get("response"):
+                    yield msg["response"]
+                if msg.get("done"):
+                    break
+            resp.read()
+            finished = True
+        finally:
+            if not finished:
+                # Response left half-read (cancel, error, or caller stopped
+                # iterating): the connection cannot be reused.
+                self.close()
+
+    def generate(
+        self,
+        model: str,
+        prompt: str,
+        options: Optional[dict] = None,
+        on_token: Optional[Callable[[str], None]] = None,
+        cancel_event: Optional[threading.Event] = None,
+    ) -> str:
+        """Full generated text; on_token(piece) is called for every streamed piece."""
+        pieces = []
+        for piece in self.generate_stream(model, prompt, options=options, cancel_event=cancel_event):
+            pieces.append(piece)
+            if on_token is not None:
+                on_token(piece)
+        return "".join(pieces)
+
+
+# Process-wide: (host, port) -> idle clients, shared by every thread and session.
+_POOL: Dict[Tuple[str, int], List[OllamaClient]] = {}
+_POOL_LOCK = threading.Lock()
+
+
+@contextmanager
+def pooled_client(host: Optional[str] = None) -> Iterator[OllamaClient]:
+    """
+    Check a client out of the process-wide pool for host (a new one when
+    none is idle) and return it when the block ends, so connections are
+    reused across reruns, threads and sessions. At most MAX_IDLE_CLIENTS
+    idle clients are kept per host; extra ones are closed.
+    """
+    key = _parse_host(host)
+    with _POOL_LOCK:
+        idle = _POOL.get(key)
+        client = idle.pop() if idle else None
+    if client is None:
+        client = OllamaClient(host)
+    try:
+        yield client
+    finally:
+        with _POOL_LOCK:
+            idle = _POOL.setdefault(key, [])
+            if len(idle) < MAX_IDLE_CLIENTS:
+                idle.append(client)
+                client = None
+        if client is not None:
+            client.close()
+
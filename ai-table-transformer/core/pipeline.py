@@ -0,0 +1,160 @@
+import marshal
+import time
+import types
+from collections import OrderedDict
+from typing import Callable, Dict, List
+
+import pandas as pd
+
+from core.table_cache import content_hash
+from utils.fingerprint import dataframe_fingerprint, estimate_memory_bytes
+
+
+# The app's stages and the stages whose outputs feed them.
+STAGES = ("upload", "profile", "join_suggest", "merge", "mapping", "transform")
+STAGE_UPSTREAM = {
+    "upload": (),
+    "profile": ("upload",),
+    "join_suggest": ("upload", "profile"),
+    "merge": ("upload",),
+    "mapping": ("merge",),
+    "transform": ("merge", "mapping"),
+}
+
+_SCALARS = (type(None), bool, int, float, str)
+
+# Results kept per stage (least recently used are dropped first), bounded by
+# count and by the estimated size of the DataFrames they hold. The latest
+# result of a stage is always kept.
+STAGE_CACHE_ENTRIES = 4
+STAGE_CACHE_MAX_BYTES = 512 * 1024 ** 2
+
+
+def _result_bytes(value) -> int:
+    """Estimated size of the DataFrames in a stage result (nested in tuples, lists, dicts)."""
+    if isinstance(value, pd.DataFrame):
+        return estimate_memory_bytes(value)
+    if isinstance(value, (list, tuple)):
+        return sum(_result_bytes(v) for v in value)
+    if isinstance(value, dict):
+        return sum(_result_bytes(v) for v in value.values())
+    return 0
+
+
+class Pipeline:
+    """
+    Memoizes stage calls on a content hash of their inputs, so a rerun only
+    recomputes stages whose inputs changed. An output of one stage passed
+    into another is identified by the hash of the inputs that produced it
+    (it is not re-hashed), which is how a change propagates downstream.
+    Outputs are shared between hits and identified by object identity, so
+    they must never be mutated in place: an edited output would still hit
+    the entries computed from its old content. Build a new object instead.
+    Callables are keyed by module and qualified name, so closures must be
+    passed next to the inputs they were built from.
+    """
+
+    def __init__(self, max_entries: int = STAGE_CACHE_ENTRIES, max_bytes: int = STAGE_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._results = {stage: OrderedDict() for stage in STAGES}
+        self._bytes = {stage: {} for stage in STAGES}
+        # id(output) -> (output, token) for outputs still held in _results
+        self._lineage = {}
+        self._counters = {stage: {"hits": 0, "misses": 0, "seconds": 0.0} for stage in STAGES}
+
+    def _token(self, value) -> str:
+        known = self._lineage.get(id(value))
+        if known is not None and known[0] is value:
+            return known[1]
+        if isinstance(value, pd.DataFrame):
+            return "df:" + dataframe_fingerprint(value)
+        if isinstance(value, pd.Series):
+            return "s:" + dataframe_fingerprint(value.to_frame())
+        if isinstance(value, dict):
+            return "{" + ",".join(f"{self._token(k)}:{self._token(v)}" for k, v in value.items()) + "}"
+        if isinstance(value, (list, tuple)):
+            return "[" + ",".join(self._token(v) for v in value) + "]"
+        if isinstance(value, (bytes, bytearray)):
+            return "b:" + content_hash(bytes(value))
+        if hasattr(value, "getvalue") and hasattr(value, "name"):
+            # Streamlit UploadedFile: its file_id changes with every new upload.
+            file_id = getattr(value, "file_id", None)
+            if file_id is not None:
+                return f"file:{value.name}:{file_id}"
+            return f"file:{value.name}:" + content_hash(value.getvalue())
+        if isinstance(value, types.CodeType):
+            return "code:" + content_hash(marshal.dumps(value))
+        if callable(value):
+            return f"fn:{getattr(value, '__module__', '')}.{getattr(value, '__qualname__', repr(value))}"
+        return repr(value)
+
+    def _remember(self, value, token: str):
+        parts = [(value, token)]
+        if isinstance(value, tuple):
+            parts += [(part, f"{token}[{i}]") for i, part in enumerate(value)]
+        for part, part_token in parts:
+            # Scalars (None, error strings, ...) are shared and keyed by value.
+            if not isinstance(part, _SCALARS):
+                self._lineage[id(part)] = (part, part_token)
+
+    def _forget(self, value):
+        parts = [value] + (list(value) if isinstance(value, tuple) else [])
+        for part in parts:
+            known = self._lineage.get(id(part))
+            if known is not None and known[0] is part:
+                del self._lineage[id(part)]
+
+    def run(self, stage: str, fn: Callable, *args, **kwargs):
+        """
+        fn(*args, **kwargs), or its cached result when stage has already run
+        fn on inputs with the same content. Exceptions are not cached.
+        """
+        results = self._results[stage]
+        counters = self._counters[stage]
+        key = content_hash(
+            self._token((fn, args, sorted(kwargs.items()))).encode("utf-8")
+        )
+        if key in results:
+            results.move_to_end(key)
+            counters["hits"] += 1
+            return results[key]
+
+        counters["misses"] += 1
+        started = time.perf_counter()
+        result = fn(*args, **kwargs)
+        counters["seconds"] += time.perf_counter() - started
+
+        results[key] = result
+        sizes = self._bytes[stage]
+        sizes[key] = _result_bytes(result)
+        self._remember(result, f"{stage}:{key}")
+        # Older results (e.g. merged frames pinned in the table store) go
+        # once the stage holds too many or too much.
+        while len(results) > self.max_entries or (len(results) > 1 and sum(sizes.values()) > self.max_bytes):
+            old_key, evicted = results.popitem(last=False)
+            del sizes[old_key]
+            self._forget(evicted)
+        return result
+
+    def stats(self) -> List[Dict[str, object]]:
+        """Per-stage {stage, upstream, hits, misses, seconds, cached, cached_mb}, in DAG order."""
+        return [
+            {
+                "stage": stage,
+                "upstream": ", ".join(STAGE_UPSTREAM[stage]),
+                **self._counters[stage],
+                "cached": len(self._results[stage]),
+                "cached_mb": sum(self._bytes[stage].values()) / 1e6,
+            }
+            for stage in STAGES
+        ]
+
+    def clear(self, stage: str = None):
+        """Drop cached results (and counters) of one stage, or of all."""
+        for name in [stage] if stage else STAGES:
+            for value in self._results[name].values():
+                self._forget(value)
+            self._results[name].clear()
+            self._bytes[name].clear()
+            self._counters[name] = {"hits": 0, "misses": 0, "seconds": 0.0}
@@ -0,0 +1,112 @@
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from core.merger import simulate_merge_columns
+from utils.column_refs import code_column_refs, expression_column_refs
+
+
+def merged_columns_used(
+    mapping_df: Optional[pd.DataFrame] = None,
+    transform_code: str = "",
+    func_name: str = "transform",
+) -> Optional[List[str]]:
+    """
+    Merged-table columns a run reads: mapping source columns, row["..."]
+    accesses in mapping expressions and in func_name's code. None when any
+    of them reads columns dynamically (then nothing can be pruned).
+    """
+    used = []
+
+    def _extend(cols):
+        for c in cols:
+            if c not in used:
+                used.append(c)
+
+    if mapping_df is not None:
+        for _, row in mapping_df.iterrows():
+            source = row.get("source_column")
+            if isinstance(source, str) and source:
+                _extend([source])
+            expr = row.get("expression")
+            refs = expression_column_refs(expr if isinstance(expr, str) and expr.strip() else None)
+            if refs is None:
+                return None
+            _extend(refs)
+
+    if transform_code and transform_code.strip():
+        refs = code_column_refs(transform_code, func_name=func_name)
+        if refs is None:
+            return None
+        _extend(refs)
+    return used
+
+
+def _single_table_origins(table_columns: Dict[str, List[str]], used: List[str]) -> dict:
+    for table, cols in table_columns.items():
+        if set(used) <= set(cols):
+            return {c: (table, c) for c in cols}
+    return {}
+
+
+def required_columns(
+    table_columns: Dict[str, List[str]],
+    join_rules: List[dict],
+    used: List[str],
+) -> Optional[Dict[str, List[str]]]:
+    """
+    Source columns per table needed to produce the merged columns in `used`
+    with the same names: join keys, the origin of every used column, and
+    the collision partner of every used column whose merged name carries a
+    `_<table>` suffix (drop the partner and the suffix would disappear).
+    Columns are returned in source order. None if a used column cannot be
+    traced to a source table.
+    """
+    if join_rules:
+        applied, origins = simulate_merge_columns(table_columns, join_rules)
+    else:
+        applied, origins = [], _single_table_origins(table_columns, used)
+
+    keep = {t: set() for t in table_columns}
+    for rule in applied:
+        keep[origins[rule["left_key"]][0]].add(origins[rule["left_key"]][1])
+        keep[rule["right_table"]].add(rule["right_key"])
+
+    pending = list(used)
+    while pending:
+        name = pending.pop()
+        if name not in origins:
+            return None
+        table, col = origins[name]
+        if col in keep[table]:
+            continue
+        keep[table].add(col)
+        if name != col and col in origins:
+            # `name` is `col_<table>`: keep whatever owns the plain name.
+            pending.append(col)
+
+    projected = {t: [c for c in cols if c in keep[t]] for t, cols in table_columns.items() if keep[t]}
+
+    # Safety net: the pruned merge must name every used column the same way.
+    if join_rules:
+        _, projected_origins = simulate_merge_columns(projected, join_rules)
+        if any(projected_origins.get(name) != origins[name] for name in used):
+            return None
+    return projected
+
+
+def plan_projection(
+    table_columns: Dict[str, List[str]],
+    join_rules: List[dict],
+    mapping_df: Optional[pd.DataFrame] = None,
+    transform_code: str = "",
+    func_name: str = "transform",
+) -> Optional[Dict[str, List[str]]]:
+    """
+    {table: columns to load} for a run over tables with these columns, or
+    None when every column must be kept.
+    """
+    used = merged_columns_used(mapping_df, transform_code, func_name=func_name)
+    if used is None:
+        return None
+    return required_columns(table_columns, join_rules, used)
@@ -0,0 +1,251 @@
+import os
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Tuple
+
+from core.merger import simulate_merge_columns
+
+
+SPILL_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "cache", "duckdb_spill")
+
+_JOIN_SQL = {
+    "left": "LEFT JOIN",
+    "inner": "INNER JOIN",
+    "right": "RIGHT JOIN",
+    "outer": "FULL OUTER JOIN",
+}
+
+_ROW_ID = "__row_id"
+
+
+def _quote(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def build_merge_sql(
+    table_columns: Dict[str, List[str]],
+    join_rules: List[dict],
+    view_names: Dict[str, str],
+    preserve_order: bool = False,
+    join_operands: Optional[Dict[int, Tuple[str, str]]] = None,
+) -> Optional[str]:
+    """
+    Translate join_rules into one SELECT ... JOIN ... query whose output
+    columns (names and order) match merge_tables_with_rules: the first
+    rule's left table is the base, rules whose right table or left key is
+    missing are skipped, overlapping right columns get a `_<table>` suffix
+    and equal-named keys collapse into one column.
+    NaN/NULL keys match each other, as in pandas.merge.
+    join_operands ({applied rule index: (left column, right column)}) names
+    extra columns of the views to join on instead of the keys themselves
+    (aligned keys, see merge_tables_with_sql); the left one lives in the
+    table the left key comes from.
+    Returns None when the base table is missing.
+    """
+    if not join_rules or join_rules[0]["left_table"] not in table_columns:
+        return None
+
+    base = join_rules[0]["left_table"]
+    # merged column name -> SQL expression, in output order
+    exprs = {c: f"j0.{_quote(c)}" for c in table_columns[base]}
+    # merged column name -> alias of the view it is read from (plain columns only)
+    aliases = {c: "j0" for c in table_columns[base]}
+    from_sql = f"{_quote(view_names[base])} AS j0"
+    order_by = [f"j0.{_quote(_ROW_ID)}"]
+
+    alias_no = 0
+    for jr in join_rules:
+        rt, lk, rk = jr["right_table"], jr["left_key"], jr["right_key"]
+        how = jr.get("how", "left")
+        if rt not in table_columns or lk not in exprs:
+            continue
+        alias_no += 1
+        alias = f"j{alias_no}"
+        left_expr = exprs[lk]
+        right_expr = f"{alias}.{_quote(rk)}"
+        on_left, on_right = left_expr, right_expr
+        operands = (join_operands or {}).get(alias_no - 1)
+        if operands is not None and lk in aliases:
+            on_left = f"{aliases[lk]}.{_quote(operands[0])}"
+            on_right = f"{alias}.{_quote(operands[1])}"
+        from_sql += (
+            f" {_JOIN_SQL[how]} {_quote(view_names[rt])} AS {alias}"
+            f" ON {on_left} IS NOT DISTINCT FROM {on_right}"
+        )
+        order_by.append(f"{alias}.{_quote(_ROW_ID)}")
+
+        right_cols = list(table_columns[rt])
+        shared_key = rk if lk == rk else None
+        if shared_key is not None:
+            if how in ("right", "outer"):
+                aliases.pop(lk, None)
+            exprs[lk] = {
+                "left": left_expr,
+                "inner": left_expr,
+                "right": right_expr,
+                "outer": f"COALESCE({left_expr}, {right_expr})",
+            }[how]
+        overlap = (set(exprs) & set(right_cols)) - {shared_key}
+        for c in right_cols:
+            if c == shared_key:
+                continue
+            name = f"{c}_{rt}" if c in overlap else c
+            exprs[name] = f"{alias}.{_quote(c)}"
+            aliases[name] = alias
+
+    select_sql = ", ".join(f"{expr} AS {_quote(name)}" for name, expr in exprs.items())
+    sql = f"SELECT {select_sql} FROM {from_sql}"
+    if preserve_order:
+        sql += " ORDER BY " + ", ".join(f"{o} NULLS LAST" for o in order_by)
+    return sql
+
+
+def _align_operands(
+    tables: Dict[str, pd.DataFrame],
+    join_rules: List[dict],
+) -> Tuple[Dict[str, pd.DataFrame], Dict[int, Tuple[str, str]]]:
+    """
+    Aligned join operands (align_key_dtypes) added to the tables as extra
+    columns, as the pandas engine does with optimize=True.
+    Returns (tables, {applied rule index: (left column, right column)}).
+    """
+    from core.join_planner import align_key_dtypes
+
+    tables = dict(tables)
+    table_columns = {t: list(df.columns) for t, df in tables.items()}
+    applied, _ = simulate_merge_columns(table_columns, join_rules)
+    operands = {}
+    # merged column names as they exist when the next rule runs
+    names = {c: (applied[0]["left_table"], c) for c in table_columns[applied[0]["left_table"]]} if applied else {}
+    for i, jr in enumerate(applied):
+        lt, lc = names[jr["left_key"]]
+        rt, rk = jr["right_table"], jr["right_key"]
+        _, names = simulate_merge_columns(table_columns, applied[: i + 1])
+        left_col, right_col = tables[lt][lc], tables[rt][rk]
+        left_key, right_key = align_key_dtypes(left_col, right_col)
+        if left_key is left_col and right_key is right_col:
+            continue
+        operands[i] = (f"__key{i}_left", f"__key{i}_right")
+        tables[lt] = tables[lt].assign(**{operands[i][0]: left_key.to_numpy()})
+        tables[rt] = tables[rt].assign(**{operands[i][1]: right_key.to_numpy()})
+    return tables, operands
+
+
+def _pandas_dtypes(result: pd.DataFrame, sources: Dict[str, pd.Series]) -> pd.DataFrame:
+    """
+    DuckDB hands back nullable Int64 / boolean columns and ordered
+    categoricals; give each column the dtype pandas.merge would: the source
+    dtype, or float64 (ints) / object (bools and the rest) when the join left
+    it with missing values.
+    """
+    out = {}
+    for col in result.columns:
+        s = result[col]
+        source = sources.get(col)
+        if source is None or s.dtype == source.dtype or isinstance(s.dtype, pd.DatetimeTZDtype):
+            continue
+        if isinstance(source.dtype, pd.api.extensions.ExtensionDtype) or not s.isna().any():
+            # str / categorical / nullable sources hold missing values themselves
+            # (DuckDB also turns categoricals into ordered enums)
+            out[col] = s.astype(source.dtype)
+        elif pd.api.types.is_numeric_dtype(source) and not pd.api.types.is_bool_dtype(source):
+            out[col] = s.astype("float64")
+        else:
+            out[col] = s.astype(object).where(s.notna(), np.nan)
+    return result.assign(**out) if out else result
+
+
+def merge_tables_with_sql(
+    tables: Dict[str, pd.DataFrame],
+    join_rules: List[dict],
+    preserve_order: bool = False,
+    threads: Optional[int] = None,
+    memory_limit: Optional[str] = None,
+    align_keys: bool = False,
+) -> pd.DataFrame | None:
+    """
+    Run join_rules as a single query in an in-process DuckDB database.
+    DuckDB joins in parallel and spills to SPILL_DIR when memory_limit
+    (e.g. "4GB") is reached. Columns and dtypes match merge_tables_with_rules
+    (align_keys=True joins on aligned key dtypes like optimize=True); with
+    preserve_order=True rows also come back in pandas order for left/inner
+    chains (this adds a row-id column to each table, which costs a copy).
+    Requires the optional `duckdb` package. DuckDB errors (e.g. out of
+    memory, incompatible key types) are raised as RuntimeError.
+    """
+    try:
+        import duckdb
+    except ImportError as e:
+        raise RuntimeError("The DuckDB merge engine requires duckdb (pip install duckdb).") from e
+
+    used = [jr["left_table"] for jr in join_rules[:1]] + [jr["right_table"] for jr in join_rules]
+    used = [t for t in dict.fromkeys(used) if t in tables]
+    view_names = {t: f"t{i}" for i, t in enumerate(used)}
+    table_columns = {t: list(tables[t].columns) for t in used}
+    applied, origins = simulate_merge_columns(table_columns, join_rules)
+    sources = {name: tables[t][c] for name, (t, c) in origins.items()}
+    for jr in applied:
+        if jr["left_key"] == jr["right_key"] and jr.get("how", "left") in ("right", "outer"):
+            sources.pop(jr["left_key"], None)  # combined from both sides
+    frames, operands = _align_operands({t: tables[t] for t in used}, join_rules) if align_keys else (tables, {})
+
+    sql = build_merge_sql(table_columns, join_rules, view_names, preserve_order=preserve_order, join_operands=operands)
+    if sql is None:
+        return None
+
+    os.makedirs(SPILL_DIR, exist_ok=True)
+    con = duckdb.connect(database=":memory:")
+    try:
+        con.execute(f"SET temp_directory = '{SPILL_DIR}'")
+        if threads:
+            con.execute(f"SET threads = {int(threads)}")
+        if memory_limit:
+            con.execute(f"SET memory_limit = '{memory_limit}'")
+        if not preserve_order:
+            con.execute("SET preserve_insertion_order = false")
+        for t, view in view_names.items():
+            df = frames[t]
+            if preserve_order:
+                df = df.assign(**{_ROW_ID: np.arange(len(df))})
+            con.register(view, df)
+        return _pandas_dtypes(con.execute(sql).df(), sources)
+    except duckdb.Error as e:
+        raise RuntimeError(f"DuckDB merge failed: {e}") from e
+    finally:
+        con.close()
+
+
+def check_merge_engine_parity(
+    tables: Dict[str, pd.DataFrame],
+    join_rules: List[dict],
+    optimize: bool = True,
+) -> Tuple[bool, str]:
+    """
+    Merge with the pandas and the DuckDB engine and compare the results:
+    same columns in the same order, same dtypes and the same rows (DuckDB
+    does not keep row order, so rows are compared sorted). Missing values
+    compare equal whatever their spelling (None / NaN / NaT).
+    Returns (equivalent, message).
+    """
+    from core.merger import merge_tables_with_rules
+
+    expected = merge_tables_with_rules(tables, join_rules, optimize=optimize)
+    got = merge_tables_with_rules(tables, join_rules, optimize=optimize, engine="duckdb")
+    if expected is None or got is None:
+        return expected is None and got is None, "No merge result." if expected is None else "DuckDB returned no result."
+    if list(expected.columns) != list(got.columns):
+        return False, f"Column mismatch: pandas gives {list(expected.columns)}, duckdb gives {list(got.columns)}."
+    bad = [c for c in expected.columns if expected[c].dtype != got[c].dtype]
+    if bad:
+        return False, "Dtype mismatch: " + ", ".join(f"{c} ({expected[c].dtype} vs {got[c].dtype})" for c in bad)
+    if len(expected) != len(got):
+        return False, f"Row count mismatch: pandas gives {len(expected)}, duckdb gives {len(got)}."
+
+    def _rows(df: pd.DataFrame) -> List[tuple]:
+        text = df.astype(object).where(df.notna(), None).map(lambda v: None if v is None else repr(v))
+        return sorted(text.itertuples(index=False, name=None), key=lambda r: tuple((v is None, v or "") for v in r))
+
+    for i, (a, b) in enumerate(zip(_rows(expected), _rows(got))):
+        if a != b:
+            return False, f"Rows differ (sorted row {i}): pandas {a}, duckdb {b}."
+    return True, f"Engines agree on {len(expected)} rows."
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import pandas as pd
+from typing import Optional, Tuple
+
+
+CACHE_ROOT = os.path.join(os.path.dirname(os.path.dirname(__file__)), "cache", "tables")
+
+# Total on-disk size kept before least-recently-used entries are evicted.
+TABLE_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+
+def _ensure_cache_root():
+    os.makedirs(CACHE_ROOT, exist_ok=True)
+
+
+def content_hash(data: bytes) -> str:
+    """Stable hash of raw file contents (used as the cache key)."""
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+def _paths(key: str) -> Tuple[str, str, str]:
+    base = os.path.join(CACHE_ROOT, key)
+    return base + ".feather", base + ".pkl", base + ".json"
+
+
+def get_cached_table(key: str) -> Tuple[Optional[pd.DataFrame], Optional[dict]]:
+    """
+    Return (df, stats) for key, or (None, None) on a miss.
+    Feather files are memory-mapped, so numeric columns load without a copy.
+    """
+    feather_path, pickle_path, meta_path = _paths(key)
+    df = None
+    try:
+        if os.path.exists(feather_path):
+            import pyarrow.feather as feather
+
+            table = feather.read_table(feather_path, memory_map=True)
+            df = table.to_pandas(split_blocks=True)
+            os.utime(feather_path)
+        elif os.path.exists(pickle_path):
+            df = pd.read_pickle(pickle_path)
+            os.utime(pickle_path)
+    except Exception:
+        # Corrupt or unreadable entry: drop it and treat as a miss.
+        remove_cached_table(key)
+        return None, None
+
+    if df is None:
+        return None, None
+
+    stats = None
+    if os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            stats = json.load(f)
+    return df, stats
+
+
+def put_cached_table(key: str, df: pd.DataFrame, stats: Optional[dict] = None):
+    """
+    Store df under key as uncompressed Feather (Arrow IPC) so it can be
+    memory-mapped on reload. Falls back to pickle when pyarrow is missing or
+    the frame is not Feather-compatible (e.g. non-string column names).
+    """
+    _ensure_cache_root()
+    feather_path, pickle_path, meta_path = _paths(key)
+    try:
+        import pyarrow.feather as feather
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False)
+        feather.write_feather(table, feather_path, compression="uncompressed")
+    except Exception:
+        if os.path.exists(feather_path):
+            os.remove(feather_path)
+        df.to_pickle(pickle_path)
+
+    if stats is not None:
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(stats, f)
+
+    evict_table_cache()
+
+
+def remove_cached_table(key: str):
+    for path in _paths(key):
+        try:
+            os.remove(path)
+        except OSError:
+            # missing, or still memory-mapped by a live DataFrame (Windows)
+            pass
+
+
+def _entries():
+    """List (key, size_bytes, last_used) for every cached table."""
+    if not os.path.isdir(CACHE_ROOT):
+        return []
+    entries = {}
+    for entry in os.listdir(CACHE_ROOT):
+        key, ext = os.path.splitext(entry)
+        path = os.path.join(CACHE_ROOT, entry)
+        size, used = entries.get(key, (0, 0.0))
+        st = os.stat(path)
+        if ext in (".feather", ".pkl"):
+            used = st.st_mtime
+        entries[key] = (size + st.st_size, used)
+    return [(k, size, used) for k, (size, used) in entries.items()]
+
+
+def table_cache_info() -> dict:
+    entries = _entries()
+    return {
+        "entries": len(entries),
+        "bytes": sum(size for _, size, _ in entries),
+        "max_bytes": TABLE_CACHE_MAX_BYTES,
+    }
+
+
+def evict_table_cache(max_bytes: Optional[int] = None):
+    """Remove least-recently-used entries until the cache fits max_bytes."""
+    max_bytes = TABLE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = sorted(_entries(), key=lambda e: e[2])
+    total = sum(size for _, size, _ in entries)
+    for key, size, _ in entries:
+        if total <= max_bytes:
+            break
+        remove_cached_table(key)
+        total -= size
+
+
+def clear_table_cache():
+    for key, _, _ in _entries():
+        remove_cached_table(key)
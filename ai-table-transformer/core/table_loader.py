@@ -1,18 +1,262 @@
+import hashlib
 import os
 import pandas as pd
+from typing import Dict, List, Optional, Tuple
 
+from core.table_cache import content_hash, get_cached_table, put_cached_table
+from core.table_store import get_table, put_table
+from utils.instrumentation import stage
 
-def load_uploaded_tables(uploaded_files):
+
+# A string column whose sample has at most this share of distinct values
+# is stored as `category` (SKUs, statuses, country codes, ...).
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+
+def _arrow_string_dtype():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return None
+    return "string[pyarrow]"
+
+
+def infer_compact_dtypes(sample: pd.DataFrame) -> Dict[str, str]:
+    """
+    Decide a storage plan per column from a sample:
+    'int' / 'float' (downcast), 'category', 'string' (Arrow-backed) or 'keep'.
+    """
+    plan = {}
+    for col in sample.columns:
+        s = sample[col]
+        if pd.api.types.is_bool_dtype(s):
+            plan[col] = "keep"
+        elif pd.api.types.is_integer_dtype(s):
+            plan[col] = "int"
+        elif pd.api.types.is_float_dtype(s):
+            plan[col] = "float"
+        elif pd.api.types.is_object_dtype(s) or pd.api.types.is_string_dtype(s):
+            non_null = s.dropna()
+            if non_null.empty or not non_null.map(lambda v: isinstance(v, str)).all():
+                plan[col] = "keep"
+            elif non_null.nunique() <= max(1, len(non_null) * CATEGORY_MAX_UNIQUE_RATIO):
+                plan[col] = "category"
+            else:
+                plan[col] = "string"
+        else:
+            plan[col] = "keep"
+    return plan
+
+
+def _downcast_float(s: pd.Series) -> pd.Series:
+    # Only use float32 when it round-trips exactly (never lose cents).
+    s32 = s.astype("float32")
+    same = (s32.astype("float64") == s) | (s.isna() & s32.isna())
+    return s32 if bool(same.all()) else s
+
+
+def compact_dataframe(df: pd.DataFrame, plan: Optional[Dict[str, str]] = None) -> pd.DataFrame:
+    """Apply a storage plan (see infer_compact_dtypes) to df."""
+    if plan is None:
+        plan = infer_compact_dtypes(df)
+    string_dtype = _arrow_string_dtype()
+    out = {}
+    for col in df.columns:
+        s = df[col]
+        kind = plan.get(col, "keep")
+        if kind == "int" and pd.api.types.is_integer_dtype(s):
+            s = pd.to_numeric(s, downcast="integer")
+        elif kind in ("int", "float") and pd.api.types.is_float_dtype(s):
+            # an int column in the sample may contain NaN further down
+            s = _downcast_float(s)
+        elif kind == "category":
+            s = s.astype("category")
+        elif kind == "string" and string_dtype is not None:
+            s = s.astype(string_dtype)
+        out[col] = s
+    return pd.DataFrame(out, index=df.index)
+
+
+def _concat_chunks(chunks: List[pd.DataFrame]) -> pd.DataFrame:
+    if len(chunks) == 1:
+        return chunks[0]
+    # concat turns categoricals with different categories into object,
+    # so union the categories column by column first.
+    cat_cols = [c for c in chunks[0].columns if isinstance(chunks[0][c].dtype, pd.CategoricalDtype)]
+    merged = pd.concat(chunks, ignore_index=True)
+    for col in cat_cols:
+        if not isinstance(merged[col].dtype, pd.CategoricalDtype):
+            categories = pd.api.types.union_categoricals([c[col] for c in chunks]).categories
+            merged[col] = pd.Categorical(merged[col], categories=categories)
+    return merged
+
+
+def read_table_compact(
+    f,
+    is_excel: bool,
+    sample_rows: int = 10_000,
+    chunksize: Optional[int] = None,
+    usecols=None,
+) -> tuple:
+    """
+    Read one CSV/Excel file with a compact storage plan inferred from the
+    first sample_rows rows. CSVs can be read in chunks of chunksize rows,
+    each compacted before the next is parsed.
+    Returns (df, bytes_before, bytes_after).
+    """
+    if is_excel:
+        raw = pd.read_excel(f, usecols=usecols)
+        before = int(raw.memory_usage(deep=True).sum())
+        df = compact_dataframe(raw, infer_compact_dtypes(raw.head(sample_rows)))
+        return df, before, int(df.memory_usage(deep=True).sum())
+
+    sample = pd.read_csv(f, nrows=sample_rows, usecols=usecols)
+    f.seek(0)
+    plan = infer_compact_dtypes(sample)
+
+    if chunksize:
+        reader = pd.read_csv(f, chunksize=chunksize, usecols=usecols)
+    else:
+        reader = [pd.read_csv(f, usecols=usecols)]
+
+    before = 0
+    chunks = []
+    for chunk in reader:
+        before += int(chunk.memory_usage(deep=True).sum())
+        chunks.append(compact_dataframe(chunk, plan))
+    df = _concat_chunks(chunks) if chunks else sample.iloc[0:0]
+    return df, before, int(df.memory_usage(deep=True).sum())
+
+
+# Bytes read per step when hashing an uploaded file.
+HASH_CHUNK_BYTES = 1 << 20
+
+
+def _file_hash(f) -> str:
+    """content_hash of the whole file, read in chunks from the handle (left at the start)."""
+    h = hashlib.blake2b(digest_size=20)
+    f.seek(0)
+    for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+        h.update(chunk)
+    f.seek(0)
+    return h.hexdigest()
+
+
+def _load_table(
+    f,
+    is_excel: bool,
+    compact: bool,
+    chunksize: Optional[int],
+    use_cache: bool,
+    want_stats: bool,
+    usecols: Optional[List[str]] = None,
+) -> Tuple[pd.DataFrame, Optional[dict]]:
+    """
+    Parse one file (through the table cache when use_cache), keeping only
+    the usecols columns when given. Returns (df, stats); stats is None when
+    neither wanted nor cached.
+    """
+    cols_filter = None
+    if usecols is not None:
+        wanted = set(usecols)
+        cols_filter = lambda c: c in wanted  # noqa: E731  (missing columns are not an error)
+
+    cache_key = None
+    if use_cache:
+        cache_key = f"{_file_hash(f)}-{'compact' if compact else 'raw'}"
+        if usecols is not None:
+            cache_key += "-" + content_hash("\0".join(sorted(usecols)).encode("utf-8"))[:12]
+        df, cached_stats = get_table(cache_key)
+        if df is not None:
+            return df, cached_stats
+        df, cached_stats = get_cached_table(cache_key)
+        if df is not None:
+            return put_table(cache_key, df, cached_stats, on_disk=True), cached_stats
+
+    if compact:
+        df, before, after = read_table_compact(f, is_excel, chunksize=chunksize, usecols=cols_filter)
+    else:
+        df = pd.read_excel(f, usecols=cols_filter) if is_excel else pd.read_csv(f, usecols=cols_filter)
+        if not (want_stats or cache_key):
+            return df, None
+        before = after = int(df.memory_usage(deep=True).sum())
+    table_stats = {
+        "rows": len(df),
+        "bytes_before": before,
+        "bytes_after": after,
+        "bytes_saved": before - after,
+    }
+    if cache_key is not None:
+        put_cached_table(cache_key, df, table_stats)
+        df = put_table(cache_key, df, table_stats, on_disk=True)
+    return df, table_stats
+
+
+def load_uploaded_tables(
+    uploaded_files,
+    compact: bool = False,
+    chunksize: Optional[int] = None,
+    stats: Optional[dict] = None,
+    use_cache: bool = False,
+    usecols: Optional[Dict[str, List[str]]] = None,
+):
     """
     Turn a list of uploaded files into a dict: {table_name: DataFrame}.
     Table name is derived from file name without extension.
+    With compact=True, dtypes are inferred from a sample, numerics are
+    downcast and repetitive strings are stored as category / Arrow strings;
+    CSVs are parsed in chunks of chunksize rows when given.
+    If a stats dict is passed it is filled with
+    {table_name: {rows, bytes_before, bytes_after, bytes_saved}}.
+    With use_cache=True, parsed tables are stored in the on-disk table cache
+    keyed by file content hash and reloaded from there on later calls; they
+    are also shared in memory through the process-wide table store, so
+    sessions loading the same file get the same (read-only) table.
+    usecols ({table_name: columns}) restricts the columns parsed per table;
+    tables not listed are read in full.
     """
     tables = {}
     for f in uploaded_files:
-        name = os.path.splitext(f.name)[0]
-        if f.name.endswith((".xlsx", ".xls")):
-            df = pd.read_excel(f)
-        else:
-            df = pd.read_csv(f)
+        name = table_name_for_path(f.name)
+        is_excel = f.name.lower().endswith((".xlsx", ".xls"))
+        with stage("load", table=name) as record:
+            df, table_stats = _load_table(
+                f, is_excel, compact, chunksize, use_cache, stats is not None, (usecols or {}).get(name)
+            )
+            record["rows_out"] = len(df)
         tables[name] = df
+        if stats is not None and table_stats is not None:
+            stats[name] = table_stats
+    return tables
+
+
+def load_table_files(
+    paths: List[str],
+    compact: bool = False,
+    chunksize: Optional[int] = None,
+    stats: Optional[dict] = None,
+    use_cache: bool = False,
+    usecols: Optional[Dict[str, List[str]]] = None,
+):
+    """Like load_uploaded_tables, for CSV / Excel files on disk."""
+    tables = {}
+    for path in paths:
+        with open(path, "rb") as f:
+            tables.update(load_uploaded_tables([f], compact, chunksize, stats, use_cache, usecols))
     return tables
+
+
+def table_name_for_path(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def read_table_columns(paths: List[str]) -> Dict[str, List[str]]:
+    """{table_name: column names} from each file's header only."""
+    columns = {}
+    for path in paths:
+        if path.lower().endswith((".xlsx", ".xls")):
+            header = pd.read_excel(path, nrows=0)
+        else:
+            header = pd.read_csv(path, nrows=0)
+        columns[table_name_for_path(path)] = list(header.columns)
+    return columns
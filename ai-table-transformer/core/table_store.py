@@ -0,0 +1,170 @@
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import pandas as pd
+
+from core.table_cache import get_cached_table, put_cached_table
+from utils.fingerprint import dataframe_fingerprint, estimate_memory_bytes
+from utils.logger import log
+
+
+# Memory budget for resident tables. Above it, the least recently used
+# tables no session holds a handle to are spilled to the on-disk table cache.
+TABLE_STORE_MAX_BYTES = 4 * 1024 ** 3
+
+# Process-wide, shared by every session of the app:
+# key -> {"df": DataFrame or None when spilled, "bytes", "stats", "refs", "on_disk", "spilling"}
+_STORE = OrderedDict()
+_LOCK = threading.RLock()
+
+
+def _enable_copy_on_write() -> bool:
+    """
+    Handles are shallow copies, which only isolate sessions under pandas
+    Copy-on-Write: always on from pandas 3, switched on here for 1.5 / 2.x.
+    """
+    if int(pd.__version__.split(".")[0]) >= 3:
+        return True
+    try:
+        pd.set_option("mode.copy_on_write", True)
+    except (KeyError, AttributeError):  # OptionError on pandas without the option
+        log("Table store: pandas has no Copy-on-Write; sessions get private copies")
+        return False
+    return True
+
+
+_COPY_ON_WRITE = _enable_copy_on_write()
+
+
+def _release(entry: dict):
+    with _LOCK:
+        entry["refs"] -= 1
+
+
+def _handle(entry: dict) -> pd.DataFrame:
+    """
+    A shallow copy of the stored frame: it shares the column buffers, and
+    Copy-on-Write keeps writes to it from reaching the stored frame (without
+    CoW support it is a deep copy). The entry counts one reference until the
+    handle is garbage collected.
+    """
+    view = entry["df"].copy(deep=not _COPY_ON_WRITE)
+    entry["refs"] += 1
+    weakref.finalize(view, _release, entry)
+    return view
+
+
+def _evict(max_bytes: int) -> list:
+    """
+    Drop unreferenced tables (least recently used first) until the store
+    fits max_bytes. Call with _LOCK held. Tables that still need writing to
+    disk stay resident and are returned as [(key, entry, df)] for _spill,
+    which must run after the lock is released.
+    """
+    resident = sum(e["bytes"] for e in _STORE.values() if e["df"] is not None)
+    to_write = []
+    for key, entry in _STORE.items():
+        if resident <= max_bytes:
+            break
+        if entry["df"] is None or entry["refs"] > 0 or entry["spilling"]:
+            continue
+        if entry["on_disk"]:
+            entry["df"] = None
+            log(f"Table store: dropped {key} ({entry['bytes'] / 1e6:,.1f} MB); it is in the table cache")
+        else:
+            entry["spilling"] = True
+            to_write.append((key, entry, entry["df"]))
+        resident -= entry["bytes"]
+    return to_write
+
+
+def _spill(to_write: list):
+    """Write tables picked by _evict to the table cache, outside the lock, then drop them from memory."""
+    for key, entry, df in to_write:
+        try:
+            put_cached_table(key, df, entry["stats"])
+            written = True
+        except Exception as e:
+            log(f"Table store: could not spill {key}: {e}")
+            written = False
+        with _LOCK:
+            entry["spilling"] = False
+            entry["on_disk"] = entry["on_disk"] or written
+            # A session may have taken a handle while the file was written.
+            if written and entry["refs"] == 0 and entry["df"] is df and _STORE.get(key) is entry:
+                entry["df"] = None
+                log(f"Table store: spilled {key} ({entry['bytes'] / 1e6:,.1f} MB) to disk")
+
+
+def get_table(key: str) -> Tuple[Optional[pd.DataFrame], Optional[dict]]:
+    """
+    (read-only handle, stats) for key, reloading a spilled table from the
+    table cache (memory-mapped Feather). (None, None) when unknown or when
+    the spilled copy has since been evicted from disk.
+    """
+    with _LOCK:
+        entry = _STORE.get(key)
+        if entry is None:
+            return None, None
+        if entry["df"] is None:
+            df, stats = get_cached_table(key)
+            if df is None:
+                del _STORE[key]
+                return None, None
+            entry["df"] = df
+            entry["stats"] = entry["stats"] or stats
+        _STORE.move_to_end(key)
+        handle = _handle(entry)
+        stats = entry["stats"]
+        to_write = _evict(TABLE_STORE_MAX_BYTES)
+    _spill(to_write)
+    return handle, stats
+
+
+def put_table(key: str, df: pd.DataFrame, stats: Optional[dict] = None, on_disk: bool = False) -> pd.DataFrame:
+    """
+    Store df under key (a content hash) and return a read-only handle to the
+    shared copy. If key is already resident, df is dropped in favour of the
+    stored frame. on_disk=True says the table cache already holds df under
+    key, so evicting it needs no write.
+    """
+    with _LOCK:
+        entry = _STORE.get(key)
+        if entry is not None and entry["df"] is not None:
+            _STORE.move_to_end(key)
+            return _handle(entry)
+        if entry is None:
+            entry = _STORE[key] = {"refs": 0, "stats": stats, "on_disk": on_disk, "spilling": False}
+        entry["df"] = df
+        entry["bytes"] = estimate_memory_bytes(df)
+        entry["on_disk"] = entry["on_disk"] or on_disk
+        _STORE.move_to_end(key)
+        handle = _handle(entry)
+        to_write = _evict(TABLE_STORE_MAX_BYTES)
+    _spill(to_write)
+    return handle
+
+
+def share_table(df: pd.DataFrame) -> pd.DataFrame:
+    """put_table keyed by df's content fingerprint (for frames built in memory, e.g. merges)."""
+    return put_table("df-" + dataframe_fingerprint(df), df)
+
+
+def table_store_info() -> dict:
+    with _LOCK:
+        resident = [e for e in _STORE.values() if e["df"] is not None]
+        return {
+            "entries": len(_STORE),
+            "resident": len(resident),
+            "bytes": sum(e["bytes"] for e in resident),
+            "max_bytes": TABLE_STORE_MAX_BYTES,
+            "refs": sum(e["refs"] for e in _STORE.values()),
+        }
+
+
+def clear_table_store():
+    """Forget every table; handles already given out stay valid."""
+    with _LOCK:
+        _STORE.clear()
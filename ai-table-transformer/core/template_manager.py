@@ -1,24 +1,182 @@
 import os
 import json
+import hashlib
+import time
 import pandas as pd
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
+
+from core.merger import simulate_merge_columns
+from core.projection import plan_projection
+from core.transformer_runner import code_hash
+from core.type_detector import profile_table
+from utils.column_refs import mapping_columns, referenced_columns
 
 
 TEMPLATE_ROOT = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
 
+# Single-file templates: templates/<name>.tpl.json. Older templates are
+# directories (join_rules.csv, column_mapping.csv, ...) and stay loadable.
+TEMPLATE_SUFFIX = ".tpl.json"
+TEMPLATE_FORMAT = 2
+INDEX_FILE = "index.json"
+
+_RULE_FIELDS = ("left_table", "right_table", "left_key", "right_key", "how")
+_MAPPING_FIELDS = ("target_column", "source_column", "expression")
+
+# In-memory index, refreshed only when the template directory changes.
+_INDEX = {"dir_mtime": None, "entries": {}}
+# Parsed single-file templates: path -> (mtime_ns, template dict)
+_LOADED = {}
+
 
 def _ensure_template_root():
     os.makedirs(TEMPLATE_ROOT, exist_ok=True)
 
 
-def list_templates() -> List[str]:
+def _template_path(name: str) -> str:
+    return os.path.join(TEMPLATE_ROOT, name + TEMPLATE_SUFFIX)
+
+
+def _write_json(path: str, obj):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _clean(value) -> Optional[str]:
+    """NaN / empty -> None; everything else as str."""
+    if value is None:
+        return None
+    try:
+        if pd.isna(value):
+            return None
+    except (TypeError, ValueError):
+        pass
+    value = str(value)
+    return value if value.strip() else None
+
+
+def schema_fingerprint(table_columns: Dict[str, List[str]]) -> str:
+    """Order-insensitive hash of {table: columns}."""
+    canonical = sorted((str(t), sorted(str(c) for c in cols)) for t, cols in table_columns.items())
+    return hashlib.blake2b(json.dumps(canonical).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def required_source_columns(
+    table_columns: Dict[str, List[str]],
+    join_rules: List[dict],
+    mapping_df: pd.DataFrame,
+    transform_code: str = "",
+) -> Dict[str, List[str]]:
+    """
+    Source columns per table a template needs: join keys, plus the source
+    tables/columns behind every merged column the mapping or the transform
+    code reads (traced through the merge's suffixing; see core.projection).
+    """
+    projected = plan_projection(table_columns, join_rules, mapping_df, transform_code)
+    if projected is not None:
+        return projected
+
+    # Columns read dynamically: fall back to the statically visible references.
+    needed = {}
+
+    def _add(table, col):
+        cols = needed.setdefault(table, [])
+        if col not in cols:
+            cols.append(col)
+
+    if join_rules:
+        applied, origins = simulate_merge_columns(table_columns, join_rules)
+        for rule in applied:
+            _add(*origins[rule["left_key"]])
+            _add(rule["right_table"], rule["right_key"])
+    else:
+        origins = {}
+        used = set(mapping_columns(mapping_df)) | set(referenced_columns(transform_code))
+        for table, cols in table_columns.items():
+            if used <= set(cols):
+                origins = {c: (table, c) for c in cols}
+                break
+
+    used = mapping_columns(mapping_df) + referenced_columns(transform_code)
+    for col in used:
+        if col in origins:
+            _add(*origins[col])
+    return needed
+
+
+def _index_entry(name: str, path: str, template: dict) -> dict:
+    schema = template.get("schema") or {}
+    return {
+        "name": name,
+        "file": os.path.basename(path),
+        "mtime_ns": os.stat(path).st_mtime_ns,
+        "saved_at": template.get("saved_at"),
+        "code_hash": template.get("code_hash"),
+        "schema_fingerprint": schema.get("fingerprint"),
+        "tables": schema.get("tables", {}),
+        "column_types": schema.get("column_types", {}),
+        "required_columns": schema.get("required_columns", {}),
+        "target_columns": [m["target_column"] for m in template.get("mapping", [])],
+    }
+
+
+def _refresh_index() -> Dict[str, dict]:
+    """
+    Return the template index. The directory is only rescanned when its
+    mtime changes (every save goes through an atomic rename, which bumps it);
+    unchanged single-file templates keep their index entries from index.json.
+    """
     _ensure_template_root()
-    names = []
+    dir_mtime = os.stat(TEMPLATE_ROOT).st_mtime_ns
+    if _INDEX["dir_mtime"] == dir_mtime:
+        return _INDEX["entries"]
+
+    index_path = os.path.join(TEMPLATE_ROOT, INDEX_FILE)
+    stored = {}
+    if os.path.exists(index_path):
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                stored = json.load(f).get("templates", {})
+        except (OSError, ValueError):
+            stored = {}
+
+    entries = {}
+    changed = False
     for entry in os.listdir(TEMPLATE_ROOT):
         path = os.path.join(TEMPLATE_ROOT, entry)
-        if os.path.isdir(path):
-            names.append(entry)
-    return sorted(names)
+        if entry.endswith(TEMPLATE_SUFFIX):
+            name = entry[: -len(TEMPLATE_SUFFIX)]
+            cached = stored.get(name)
+            if cached is not None and cached.get("mtime_ns") == os.stat(path).st_mtime_ns:
+                entries[name] = cached
+                continue
+            try:
+                entries[name] = _index_entry(name, path, _read_template_file(path))
+            except (OSError, ValueError):
+                continue
+            changed = True
+        elif os.path.isdir(path) and os.path.exists(os.path.join(path, "join_rules.csv")):
+            if entry not in entries:
+                entries[entry] = {"name": entry, "legacy": True}
+
+    if changed or set(entries) != set(stored):
+        _write_json(index_path, {"format": TEMPLATE_FORMAT, "templates": entries})
+        dir_mtime = os.stat(TEMPLATE_ROOT).st_mtime_ns
+
+    _INDEX["dir_mtime"] = dir_mtime
+    _INDEX["entries"] = entries
+    return entries
+
+
+def template_index() -> Dict[str, dict]:
+    """{name: index entry} for every template (cheap; no template is parsed)."""
+    return _refresh_index()
+
+
+def list_templates() -> List[str]:
+    return sorted(_refresh_index())
 
 
 def save_template(
@@ -27,37 +185,66 @@ def save_template(
     mapping_df: pd.DataFrame,
     transform_code: str,
     metadata: dict | None = None,
+    tables: Optional[Dict[str, object]] = None,
 ):
+    """
+    Save a template as templates/<name>.tpl.json with typed join rules and
+    mapping, the transform code and its hash, and (when the source tables
+    are passed as {table: DataFrame or column list}) a schema fingerprint of
+    the expected source columns and their detected types.
+    """
     _ensure_template_root()
-    tpl_dir = os.path.join(TEMPLATE_ROOT, name)
-    os.makedirs(tpl_dir, exist_ok=True)
+    meta = dict(metadata or {})
+    meta["template_name"] = name
 
-    # save join_rules.csv
-    jr_df = pd.DataFrame(join_rules)
-    jr_df.to_csv(os.path.join(tpl_dir, "join_rules.csv"), index=False)
+    rules = [{k: _clean(r.get(k)) for k in _RULE_FIELDS} for r in join_rules]
+    for r in rules:
+        r["how"] = r["how"] or "left"
+    mapping = [{k: _clean(row.get(k)) for k in _MAPPING_FIELDS} for _, row in mapping_df.iterrows()]
 
-    # save column_mapping.csv
-    mapping_df.to_csv(os.path.join(tpl_dir, "column_mapping.csv"), index=False)
+    schema = None
+    if tables:
+        table_columns = {t: [str(c) for c in getattr(v, "columns", v)] for t, v in tables.items()}
+        column_types = {
+            t: {str(c): p["type"] for c, p in profile_table(v, t).items()}
+            for t, v in tables.items()
+            if isinstance(v, pd.DataFrame)
+        }
+        schema = {
+            "tables": table_columns,
+            "column_types": column_types,
+            "fingerprint": schema_fingerprint(table_columns),
+            "required_columns": required_source_columns(
+                table_columns, rules, pd.DataFrame(mapping, columns=list(_MAPPING_FIELDS)), transform_code
+            ),
+        }
 
-    # save transform_code.py
-    with open(os.path.join(tpl_dir, "transform_code.py"), "w", encoding="utf-8") as f:
-        f.write(transform_code)
+    template = {
+        "format": TEMPLATE_FORMAT,
+        "name": name,
+        "saved_at": time.time(),
+        "join_rules": rules,
+        "mapping": mapping,
+        "transform_code": transform_code,
+        "code_hash": code_hash(transform_code),
+        "schema": schema,
+        "metadata": meta,
+    }
+    _write_json(_template_path(name), template)
 
-    # save metadata.json
-    meta = metadata or {}
-    meta["template_name"] = name
-    with open(os.path.join(tpl_dir, "metadata.json"), "w", encoding="utf-8") as f:
-        json.dump(meta, f, ensure_ascii=False, indent=2)
 
+def _read_template_file(path: str) -> dict:
+    mtime = os.stat(path).st_mtime_ns
+    cached = _LOADED.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with open(path, "r", encoding="utf-8") as f:
+        template = json.load(f)
+    _LOADED[path] = (mtime, template)
+    return template
 
-def load_template(
-    name: str,
-) -> Tuple[List[dict], pd.DataFrame, str, dict]:
-    _ensure_template_root()
-    tpl_dir = os.path.join(TEMPLATE_ROOT, name)
-    if not os.path.isdir(tpl_dir):
-        raise FileNotFoundError(f"Template '{name}' not found.")
 
+def _load_legacy_template(tpl_dir: str) -> Tuple[List[dict], pd.DataFrame, str, dict]:
     # join_rules
     jr_path = os.path.join(tpl_dir, "join_rules.csv")
     jr_df = pd.read_csv(jr_path)
@@ -65,7 +252,8 @@ def load_template(
 
     # column_mapping
     mapping_path = os.path.join(tpl_dir, "column_mapping.csv")
-    mapping_df = pd.read_csv(mapping_path)
+    mapping_df = pd.read_csv(mapping_path, dtype=object)
+    mapping_df = mapping_df.where(mapping_df.notna(), None)
 
     # transform code
     code_path = os.path.join(tpl_dir, "transform_code.py")
@@ -81,3 +269,59 @@ def load_template(
         metadata = {}
 
     return join_rules, mapping_df, transform_code, metadata
+
+
+def load_template(
+    name: str,
+) -> Tuple[List[dict], pd.DataFrame, str, dict]:
+    """
+    Returns (join_rules, mapping_df, transform_code, metadata). For
+    single-file templates metadata also carries code_hash and schema.
+    """
+    _ensure_template_root()
+    path = _template_path(name)
+    if os.path.exists(path):
+        template = _read_template_file(path)
+        mapping_df = pd.DataFrame(
+            [dict(m) for m in template.get("mapping", [])], columns=list(_MAPPING_FIELDS), dtype=object
+        )
+        metadata = dict(template.get("metadata") or {})
+        metadata["code_hash"] = template.get("code_hash")
+        metadata["schema"] = template.get("schema")
+        join_rules = [dict(r) for r in template.get("join_rules", [])]
+        return join_rules, mapping_df, template.get("transform_code", ""), metadata
+
+    tpl_dir = os.path.join(TEMPLATE_ROOT, name)
+    if not os.path.isdir(tpl_dir):
+        raise FileNotFoundError(f"Template '{name}' not found.")
+    return _load_legacy_template(tpl_dir)
+
+
+def check_template_compatibility(name: str, tables: Dict[str, object]) -> dict:
+    """
+    Check a template against source tables ({table: DataFrame or column list})
+    using only its index entry. Returns {compatible, exact, missing_tables,
+    missing_columns {table: [cols]}, checked}; checked is False for legacy
+    templates or templates saved without a schema.
+    """
+    entry = _refresh_index().get(name)
+    if entry is None:
+        raise FileNotFoundError(f"Template '{name}' not found.")
+    result = {"compatible": True, "exact": False, "missing_tables": [], "missing_columns": {}, "checked": False}
+    if entry.get("legacy") or not entry.get("tables"):
+        return result
+
+    table_columns = {t: [str(c) for c in getattr(v, "columns", v)] for t, v in tables.items()}
+    result["checked"] = True
+    result["exact"] = schema_fingerprint(
+        {t: table_columns[t] for t in entry["tables"] if t in table_columns}
+    ) == entry["schema_fingerprint"]
+    for table, cols in entry.get("required_columns", {}).items():
+        if table not in table_columns:
+            result["missing_tables"].append(table)
+            continue
+        missing = [c for c in cols if c not in set(table_columns[table])]
+        if missing:
+            result["missing_columns"][table] = missing
+    result["compatible"] = not result["missing_tables"] and not result["missing_columns"]
+    return result
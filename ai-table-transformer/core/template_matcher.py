@@ -0,0 +1,120 @@
+import re
+from collections import defaultdict
+from typing import Dict, List
+
+import pandas as pd
+
+from core.template_manager import check_template_compatibility, template_index
+from core.type_detector import profile_table
+
+
+# Weights of the ranking score.
+REQUIRED_WEIGHT = 0.6
+COLUMN_WEIGHT = 0.3
+TYPE_WEIGHT = 0.1
+
+# Inverted index built from one template_index() snapshot:
+# {"entries": <index dict>, "postings": {token: [(template, kind)]}, "totals": {template: {...}}}
+_MATCH_INDEX = {"entries": None, "postings": {}, "totals": {}}
+
+
+def _col_token(col: str) -> str:
+    return "c:" + re.sub(r"[^a-z0-9]", "", str(col).lower())
+
+
+def _typed_token(col: str, col_type: str) -> str:
+    return f"{_col_token(col)}:{col_type}"
+
+
+def _build_match_index(entries: Dict[str, dict]):
+    postings = defaultdict(list)
+    totals = {}
+    for name, entry in entries.items():
+        if entry.get("legacy") or not entry.get("tables"):
+            continue
+        columns = {_col_token(c) for cols in entry["tables"].values() for c in cols}
+        required = {_col_token(c) for cols in entry.get("required_columns", {}).values() for c in cols}
+        typed = {
+            _typed_token(c, t)
+            for types in entry.get("column_types", {}).values()
+            for c, t in types.items()
+        }
+        for tok in columns:
+            postings[tok].append((name, "column"))
+        for tok in required:
+            postings[tok].append((name, "required"))
+        for tok in typed:
+            postings[tok].append((name, "typed"))
+        totals[name] = {"column": len(columns), "required": len(required), "typed": len(typed)}
+
+    _MATCH_INDEX["entries"] = entries
+    _MATCH_INDEX["postings"] = dict(postings)
+    _MATCH_INDEX["totals"] = totals
+
+
+def _match_index():
+    entries = template_index()
+    if _MATCH_INDEX["entries"] is not entries:
+        _build_match_index(entries)
+    return _MATCH_INDEX
+
+
+def rank_templates(
+    tables: Dict[str, pd.DataFrame],
+    top_k: int = 5,
+    min_score: float = 0.2,
+) -> List[dict]:
+    """
+    Rank saved templates by how well they fit the uploaded tables, using an
+    inverted index from normalized column-name (and column-name + type)
+    tokens to templates, so no template file is opened.
+    Score = 0.6 * share of the template's required columns present
+          + 0.3 * share of its expected columns present
+          + 0.1 * share of its typed columns present with the same type.
+    Returns up to top_k dicts {name, score, required_coverage,
+    column_coverage, type_agreement, compatible}, best first.
+    """
+    index = _match_index()
+    postings, totals = index["postings"], index["totals"]
+    if not totals:
+        return []
+
+    tokens = set()
+    for table_name, df in tables.items():
+        profiles = profile_table(df, table_name)
+        for col in df.columns:
+            tokens.add(_col_token(col))
+            tokens.add(_typed_token(col, profiles[col]["type"]))
+
+    hits = defaultdict(lambda: {"column": 0, "required": 0, "typed": 0})
+    for tok in tokens:
+        for name, kind in postings.get(tok, ()):
+            hits[name][kind] += 1
+
+    ranked = []
+    for name, h in hits.items():
+        t = totals[name]
+        required_coverage = h["required"] / t["required"] if t["required"] else 1.0
+        column_coverage = h["column"] / t["column"] if t["column"] else 0.0
+        type_agreement = h["typed"] / t["typed"] if t["typed"] else column_coverage
+        score = (
+            REQUIRED_WEIGHT * required_coverage
+            + COLUMN_WEIGHT * column_coverage
+            + TYPE_WEIGHT * type_agreement
+        )
+        if score >= min_score:
+            ranked.append(
+                {
+                    "name": name,
+                    "score": score,
+                    "required_coverage": required_coverage,
+                    "column_coverage": column_coverage,
+                    "type_agreement": type_agreement,
+                }
+            )
+
+    ranked.sort(key=lambda r: (-r["score"], r["name"]))
+    ranked = ranked[:top_k]
+    for r in ranked:
+        r["compatible"] = check_template_compatibility(r["name"], tables)["compatible"]
+    return ranked
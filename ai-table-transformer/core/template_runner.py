@@ -0,0 +1,214 @@
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, List, Optional, Tuple
+
+import pandas as pd
+
+from core.chunked_runner import run_transform_chunked
+from core.mapping_compiler import apply_mapping_vectorized
+from core.merger import merge_tables_with_rules
+from core.projection import plan_projection
+from core.table_loader import load_table_files, read_table_columns
+from core.template_manager import check_template_compatibility, load_template
+from core.transformer_runner import apply_transform_df_code
+
+
+TABLE_EXTENSIONS = (".csv", ".xlsx", ".xls")
+RUN_MODES = ("auto", "row", "df", "mapping")
+
+
+def output_format(path: str) -> str:
+    return "parquet" if path.lower().endswith((".parquet", ".pq")) else "csv"
+
+
+def _write_table(df: pd.DataFrame, path: str):
+    if output_format(path) == "parquet":
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+def resolve_mode(mode: str, template: dict) -> str:
+    """auto: verified transform_df(df) code, else transform(row) code, else the mapping."""
+    if mode != "auto":
+        return mode
+    metadata = template["metadata"]
+    if metadata.get("transform_df_code") and metadata.get("transform_df_verified"):
+        return "df"
+    if template["transform_code"].strip():
+        return "row"
+    return "mapping"
+
+
+def load_template_bundle(name: str) -> dict:
+    join_rules, mapping_df, transform_code, metadata = load_template(name)
+    return {
+        "name": name,
+        "join_rules": join_rules,
+        "mapping_df": mapping_df,
+        "transform_code": transform_code,
+        "metadata": metadata,
+    }
+
+
+def run_template(
+    template: dict,
+    input_paths: List[str],
+    output_path: str,
+    mode: str = "auto",
+    engine: str = "pandas",
+    n_workers: Optional[int] = None,
+    chunk_size: int = 50_000,
+    compact: bool = True,
+    use_cache: bool = False,
+    progress_callback: Optional[Callable[[int, Optional[int], float], None]] = None,
+    project: bool = True,
+) -> Tuple[Optional[dict], Optional[str]]:
+    """
+    Load input_paths, merge them with the template's join rules and write
+    the transformed table to output_path (.csv or .parquet).
+    mode: 'row' (transform(row), chunked and streamed to disk over n_workers
+    processes), 'df' (transform_df(df) from the template metadata),
+    'mapping' (vectorized column mapping) or 'auto'.
+    With project=True only the columns the chosen transform reads (plus join
+    keys) are parsed from the inputs and carried through the merge.
+    Returns (stats, error_message).
+    """
+    started = time.perf_counter()
+    mode = resolve_mode(mode, template)
+    if mode not in RUN_MODES:
+        return None, f"Unknown mode: {mode}"
+
+    join_rules = template["join_rules"]
+    usecols = None
+    try:
+        # Headers only: the check runs on the full input columns, not the
+        # projected ones (the template's required columns cover every mode).
+        input_columns = read_table_columns(input_paths)
+    except Exception as e:
+        return None, f"Error loading input files: {e}"
+
+    compat = check_template_compatibility(template["name"], input_columns)
+    if not compat["compatible"]:
+        problems = [f"table '{t}' missing" for t in compat["missing_tables"]]
+        problems += [f"{t}: missing columns {cols}" for t, cols in compat["missing_columns"].items()]
+        return None, "Inputs do not match the template: " + "; ".join(problems)
+
+    try:
+        if project:
+            if mode == "mapping":
+                usecols = plan_projection(input_columns, join_rules, template["mapping_df"])
+            else:
+                code = template["transform_code"] if mode == "row" else template["metadata"].get("transform_df_code") or ""
+                func_name = "transform" if mode == "row" else "transform_df"
+                usecols = plan_projection(input_columns, join_rules, None, code, func_name)
+        tables = load_table_files(input_paths, compact=compact, use_cache=use_cache, usecols=usecols)
+    except Exception as e:
+        return None, f"Error loading input files: {e}"
+
+    if join_rules:
+        needed = {r["left_table"] for r in join_rules} | {r["right_table"] for r in join_rules}
+        missing = sorted(needed - set(tables))
+        if missing:
+            return None, f"Input tables missing for this template: {', '.join(missing)}"
+        try:
+            merged = merge_tables_with_rules(tables, join_rules, optimize=True, engine=engine)
+        except Exception as e:
+            return None, f"Error merging tables: {e}"
+    elif len(tables) == 1:
+        merged = next(iter(tables.values()))
+    else:
+        return None, "Template has no join rules; pass exactly one input table."
+    del tables
+
+    stats = {
+        "mode": mode,
+        "rows_in": len(merged),
+        "columns_in": merged.shape[1],
+        "projected": usecols is not None,
+        "output_path": output_path,
+    }
+    if mode == "row":
+        run_stats, error = run_transform_chunked(
+            template["transform_code"],
+            merged,
+            output_path,
+            fmt=output_format(output_path),
+            chunk_size=chunk_size,
+            n_workers=n_workers,
+            progress_callback=progress_callback,
+        )
+        if error:
+            return None, error
+        stats["rows_out"] = run_stats["rows_out"]
+    else:
+        if mode == "df":
+            code = template["metadata"].get("transform_df_code") or ""
+            result_df, error = apply_transform_df_code(code, merged)
+        else:
+            result_df, error = apply_mapping_vectorized(template["mapping_df"], merged)
+        if error:
+            return None, error
+        try:
+            _write_table(result_df, output_path)
+        except Exception as e:
+            return None, f"Error writing output: {e}"
+        stats["rows_out"] = len(result_df)
+
+    stats["seconds"] = time.perf_counter() - started
+    return stats, None
+
+
+def batch_inputs(batch_dir: str) -> List[str]:
+    """Table files directly inside one batch directory."""
+    return sorted(
+        os.path.join(batch_dir, n)
+        for n in os.listdir(batch_dir)
+        if n.lower().endswith(TABLE_EXTENSIONS)
+    )
+
+
+def _run_batch(template: dict, batch_dir: str, output_path: str, kwargs: dict):
+    stats, error = run_template(template, batch_inputs(batch_dir), output_path, n_workers=1, **kwargs)
+    return batch_dir, stats, error
+
+
+def run_template_batches(
+    template: dict,
+    batch_glob: str,
+    output_dir: str,
+    fmt: str = "csv",
+    n_workers: Optional[int] = None,
+    on_batch_done: Optional[Callable[[str, Optional[dict], Optional[str]], None]] = None,
+    **kwargs,
+) -> List[Tuple[str, Optional[dict], Optional[str]]]:
+    """
+    Run the template once per directory matching batch_glob, one batch per
+    worker process (each batch runs its transform in-process), writing
+    <output_dir>/<batch name>.<fmt>. Returns [(batch_dir, stats, error)].
+    """
+    batch_dirs = sorted(d for d in glob.glob(batch_glob) if os.path.isdir(d))
+    os.makedirs(output_dir, exist_ok=True)
+    results = []
+    with ProcessPoolExecutor(max_workers=n_workers or os.cpu_count() or 1) as pool:
+        futures = {
+            pool.submit(
+                _run_batch,
+                template,
+                d,
+                os.path.join(output_dir, f"{os.path.basename(os.path.normpath(d))}.{fmt}"),
+                kwargs,
+            ): d
+            for d in batch_dirs
+        }
+        for fut in as_completed(futures):
+            try:
+                result = fut.result()
+            except Exception as e:  # worker crashed
+                result = (futures[fut], None, f"Batch worker failed: {e}")
+            results.append(result)
+            if on_batch_done is not None:
+                on_batch_done(*result)
+    return sorted(results, key=lambda r: r[0])
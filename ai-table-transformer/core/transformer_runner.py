@@ -1,33 +1,161 @@
+import hashlib
 import pandas as pd
-from typing import Tuple, Optional
+from collections import OrderedDict
+from typing import Callable, List, Tuple, Optional
 
+from utils.fingerprint import dataframe_fingerprint
+from utils.instrumentation import frame_rows, instrumented
 
-def apply_transform_code(
+
+# Rows used for the dry run before a full-table run.
+DRY_RUN_ROWS = 20
+
+# (code hash, function name) -> (code object, callable, error); shared by
+# reruns, sessions and template loads in this process. LRU-bounded.
+COMPILE_CACHE_MAX_ENTRIES = 128
+_COMPILE_CACHE = OrderedDict()
+
+# (code hash, function name, sample fingerprint) -> (sample result, error)
+_DRY_RUN_CACHE = OrderedDict()
+
+_SIGNATURES = {"transform": "transform(row)", "transform_df": "transform_df(df)"}
+
+
+def code_hash(code: str) -> str:
+    return hashlib.blake2b(code.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _cache_put(cache: OrderedDict, key, value):
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > COMPILE_CACHE_MAX_ENTRIES:
+        cache.popitem(last=False)
+
+
+def _compile_transform(code: str, func_name: str):
+    try:
+        code_obj = compile(code, "<transform>", "exec")
+    except SyntaxError as e:
+        return None, None, f"Error executing code: {e}"
+
+    namespace = {}
+    try:
+        exec(code_obj, namespace)
+    except Exception as e:
+        return code_obj, None, f"Error executing code: {e}"
+
+    fn = namespace.get(func_name)
+    if not callable(fn):
+        signature = _SIGNATURES.get(func_name, f"{func_name}()")
+        return code_obj, None, f"{signature} function not found in code."
+    return code_obj, fn, None
+
+
+def load_transform(
     code: str,
-    merged_df: pd.DataFrame,
-) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+    func_name: str = "transform",
+    use_cache: bool = True,
+) -> Tuple[Optional[Callable], Optional[str]]:
     """
-    Execute given Python code to obtain transform(row), then apply it to merged_df.
-    Returns (result_df, error_message).
+    Execute given Python code and return (transform, error_message).
+    The code runs in a single namespace so that module-level imports
+    (e.g. `import pandas as pd`) are visible inside transform().
+    Compiled results are cached by code hash, so identical code is exec'd
+    once per process; module-level state in the code is shared between runs.
     WARNING: This uses exec() and is intended for local/internal use only.
     """
-    local_vars = {}
-    try:
-        exec(code, {}, local_vars)
-    except Exception as e:
-        return None, f"Error executing code: {e}"
+    key = (code_hash(code), func_name)
+    entry = _COMPILE_CACHE.get(key) if use_cache else None
+    if entry is None:
+        entry = _compile_transform(code, func_name)
+        if use_cache:
+            _cache_put(_COMPILE_CACHE, key, entry)
+    else:
+        _COMPILE_CACHE.move_to_end(key)
+    _, fn, error = entry
+    return fn, error
 
-    transform = local_vars.get("transform")
-    if not callable(transform):
-        return None, "transform(row) function not found in code."
 
+def transform_rows(
+    transform: Callable,
+    df: pd.DataFrame,
+) -> Tuple[Optional[List[dict]], Optional[str]]:
+    """Call transform(row) for every row of df. Returns (out_rows, error_message)."""
     out_rows = []
-    for _, row in merged_df.iterrows():
+    for _, row in df.iterrows():
         try:
             out = transform(row)
         except Exception as e:
             return None, f"Error applying transform to a row: {e}"
         out_rows.append(out)
+    return out_rows, None
+
+
+def dry_run_transform(
+    code: str,
+    merged_df: pd.DataFrame,
+    sample_rows: int = DRY_RUN_ROWS,
+    func_name: str = "transform",
+) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+    """
+    Run the transform on the first sample_rows rows of merged_df.
+    Results are cached by (code hash, sample content), so repeated runs of
+    the same code on the same table validate instantly.
+    Returns (sample_result_df, error_message).
+    """
+    transform, error = load_transform(code, func_name=func_name)
+    if error:
+        return None, error
+
+    sample = merged_df.head(sample_rows)
+    key = (code_hash(code), func_name, dataframe_fingerprint(sample))
+    cached = _DRY_RUN_CACHE.get(key)
+    if cached is not None:
+        _DRY_RUN_CACHE.move_to_end(key)
+        return cached
+
+    out_rows, error = transform_rows(transform, sample)
+    if error:
+        result = (None, error)
+    else:
+        try:
+            result = (pd.DataFrame(out_rows), None)
+        except Exception as e:
+            result = (None, f"Error building result DataFrame: {e}")
+    _cache_put(_DRY_RUN_CACHE, key, result)
+    return result
+
+
+def clear_transform_cache():
+    _COMPILE_CACHE.clear()
+    _DRY_RUN_CACHE.clear()
+
+
+@instrumented("transform", rows_in=lambda a: len(a["merged_df"]), rows_out=frame_rows)
+def apply_transform_code(
+    code: str,
+    merged_df: pd.DataFrame,
+    validate: bool = True,
+) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+    """
+    Execute given Python code to obtain transform(row), then apply it to merged_df.
+    With validate=True the code is first dry-run on a small sample, so broken
+    code fails fast instead of part-way through a large table.
+    Returns (result_df, error_message).
+    WARNING: This uses exec() and is intended for local/internal use only.
+    """
+    transform, error = load_transform(code)
+    if error:
+        return None, error
+
+    if validate and len(merged_df) > DRY_RUN_ROWS:
+        _, error = dry_run_transform(code, merged_df)
+        if error:
+            return None, f"Dry run on the first {DRY_RUN_ROWS} rows failed: {error}"
+
+    out_rows, error = transform_rows(transform, merged_df)
+    if error:
+        return None, error
 
     try:
         result_df = pd.DataFrame(out_rows)
@@ -35,3 +163,72 @@ def apply_transform_code(
         return None, f"Error building result DataFrame: {e}"
 
     return result_df, None
+
+
+@instrumented("transform_df", rows_in=lambda a: len(a["merged_df"]), rows_out=frame_rows)
+def apply_transform_df_code(
+    code: str,
+    merged_df: pd.DataFrame,
+) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+    """
+    Execute given Python code to obtain transform_df(df) (column operations
+    over the whole table) and apply it to merged_df once; merged_df itself
+    is left untouched.
+    Returns (result_df, error_message), like apply_transform_code.
+    """
+    transform_df, error = load_transform(code, func_name="transform_df")
+    if error:
+        return None, error
+
+    try:
+        # A shallow copy, so columns the code adds never land on the caller's
+        # (possibly shared, fingerprinted) frame.
+        result_df = transform_df(merged_df.copy(deep=False))
+    except Exception as e:
+        return None, f"Error applying transform_df: {e}"
+    if not isinstance(result_df, pd.DataFrame):
+        return None, f"transform_df returned {type(result_df).__name__}, expected a DataFrame."
+    if len(result_df) != len(merged_df):
+        return None, f"transform_df returned {len(result_df)} rows for {len(merged_df)} input rows."
+    return result_df.reset_index(drop=True), None
+
+
+def _comparable(df: pd.DataFrame) -> pd.DataFrame:
+    """Text form with missing values unified, so int/float/str spellings of equal data match."""
+    out = df.reset_index(drop=True).astype(object)
+    out = out.where(out.notna(), None)
+    return out.map(lambda v: None if v is None else str(v).removesuffix(".0"))
+
+
+def check_transform_equivalence(
+    row_code: str,
+    df_code: str,
+    merged_df: pd.DataFrame,
+    sample_rows: int = 200,
+) -> Tuple[bool, str]:
+    """
+    Run transform(row) and transform_df(df) on the first sample_rows rows of
+    merged_df and compare the outputs (same columns, same values; numeric
+    and text spellings of the same value count as equal).
+    Returns (equivalent, message).
+    """
+    sample = merged_df.head(sample_rows).copy(deep=False)
+    row_df, error = dry_run_transform(row_code, merged_df, sample_rows=sample_rows)
+    if error:
+        return False, f"transform(row) failed on the sample: {error}"
+    vec_df, error = apply_transform_df_code(df_code, sample)
+    if error:
+        return False, f"transform_df(df) failed on the sample: {error}"
+
+    if list(row_df.columns) != list(vec_df.columns):
+        return False, (
+            f"Column mismatch: transform(row) gives {list(row_df.columns)}, "
+            f"transform_df(df) gives {list(vec_df.columns)}."
+        )
+    left, right = _comparable(row_df), _comparable(vec_df)
+    diff = (left != right) & ~(left.isna() & right.isna())
+    if diff.any().any():
+        bad = [c for c in diff.columns if diff[c].any()]
+        first = int(diff.any(axis=1).to_numpy().argmax())
+        return False, f"Values differ in column(s) {bad} (first at sample row {first})."
+    return True, f"Outputs match on {len(sample)} sample rows."
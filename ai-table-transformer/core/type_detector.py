@@ -1,13 +1,33 @@
 import pandas as pd
 import re
+from collections import OrderedDict
+from typing import Dict, Optional
 
+from utils.fingerprint import dataframe_fingerprint
+
+
+_NUMERIC_RE = re.compile(r"-?\d+(\.\d+)?")
+_MONEY_RE = re.compile(r"\$")
+_DATE_RE = re.compile(r"\d{4}-\d{1,2}-\d{1,2}|\d{1,2}/\d{1,2}/\d{2,4}")
+
+# Candidate formats tried (in order) when a column looks like dates.
+_DATE_FORMATS = [
+    "%Y-%m-%d",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y/%m/%d",
+    "%d/%m/%Y",
+    "%m/%d/%Y",
+    "%d/%m/%y",
+    "%m/%d/%y",
+]
+
+# (table, column, table content hash) -> profile; LRU-bounded.
+PROFILE_CACHE_MAX_ENTRIES = 20_000
+_PROFILE_CACHE = OrderedDict()
 
-def detect_column_type(series: pd.Series, col_name: str) -> str:
-    """
-    Very simple heuristic type detector for columns.
-    Returns one of: 'id', 'date', 'amount', 'name', 'text', 'unknown'
-    """
-    name_lower = col_name.lower()
+
+def _name_type(col_name: str) -> Optional[str]:
+    name_lower = str(col_name).lower()
 
     # name-based hints
     if any(k in name_lower for k in ["id", "code", "no", "number"]):
@@ -18,26 +38,103 @@ def detect_column_type(series: pd.Series, col_name: str) -> str:
         return "amount"
     if any(k in name_lower for k in ["name", "customer", "client", "person"]):
         return "name"
+    return None
+
+
+def _sample_values(series: pd.Series, sample_size: int) -> pd.Series:
+    """Random (seeded) sample of the non-null values, as strings."""
+    s = series.dropna()
+    if len(s) > sample_size:
+        s = s.sample(sample_size, random_state=0)
+    return s.astype(str)
+
 
-    # value-based hints
-    sample = series.dropna().astype(str).head(20)
-
-    # check numeric
-    numeric_count = 0
-    money_like = 0
-    date_like = 0
-    for v in sample:
-        if re.fullmatch(r"-?\d+(\.\d+)?", v):
-            numeric_count += 1
-        if re.search(r"\$", v):
-            money_like += 1
-        if re.search(r"\d{4}-\d{1,2}-\d{1,2}", v) or re.search(r"\d{1,2}/\d{1,2}/\d{2,4}", v):
-            date_like += 1
-
-    if date_like >= len(sample) * 0.5:
+def _value_type(sample: pd.Series) -> str:
+    if sample.empty:
+        return "unknown"
+
+    n = len(sample)
+    numeric_count = int(sample.str.fullmatch(_NUMERIC_RE).sum())
+    money_like = int(sample.str.contains(_MONEY_RE).sum())
+    date_like = int(sample.str.contains(_DATE_RE).sum())
+
+    if date_like >= n * 0.5:
         return "date"
-    if money_like >= len(sample) * 0.3 or numeric_count >= len(sample) * 0.8:
+    if money_like >= n * 0.3 or numeric_count >= n * 0.8:
         return "amount"
 
     # fallback
     return "text"
+
+
+def detect_column_type(series: pd.Series, col_name: str, sample_size: int = 200) -> str:
+    """
+    Very simple heuristic type detector for columns.
+    Returns one of: 'id', 'date', 'amount', 'name', 'text', 'unknown'
+    """
+    return _name_type(col_name) or _value_type(_sample_values(series, sample_size))
+
+
+def _detect_date_format(sample: pd.Series) -> Optional[str]:
+    best, best_hits = None, 0
+    for fmt in _DATE_FORMATS:
+        hits = int(pd.to_datetime(sample, format=fmt, errors="coerce").notna().sum())
+        if hits > best_hits:
+            best, best_hits = fmt, hits
+    return best if best_hits >= len(sample) * 0.8 else None
+
+
+def profile_column(series: pd.Series, col_name: str, sample_size: int = 1000) -> dict:
+    """
+    Richer column profile: type, null ratio, cardinality, min/max and, for
+    date-like columns, the detected strftime format.
+    """
+    n = len(series)
+    sample = _sample_values(series, sample_size)
+    col_type = _name_type(col_name) or _value_type(sample)
+
+    profile = {
+        "type": col_type,
+        "rows": n,
+        "null_ratio": float(series.isna().mean()) if n else 0.0,
+        "cardinality": int(series.nunique(dropna=True)),
+        "min": None,
+        "max": None,
+        "date_format": None,
+    }
+
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        if series.notna().any():
+            lo, hi = series.min(), series.max()
+            profile["min"] = lo.item() if hasattr(lo, "item") else lo
+            profile["max"] = hi.item() if hasattr(hi, "item") else hi
+    elif not sample.empty and (col_type == "date" or sample.str.contains(_DATE_RE).mean() >= 0.5):
+        fmt = _detect_date_format(sample)
+        profile["date_format"] = fmt
+        if fmt is not None:
+            parsed = pd.to_datetime(sample, format=fmt, errors="coerce").dropna()
+            profile["min"], profile["max"] = str(parsed.min()), str(parsed.max())
+    elif not sample.empty:
+        profile["min"], profile["max"] = sample.min(), sample.max()
+    return profile
+
+
+def profile_table(df: pd.DataFrame, table_name: Optional[str] = None, sample_size: int = 1000) -> Dict[str, dict]:
+    """
+    Profile every column of df, cached per (table, column, content hash), so
+    each column is profiled once per upload no matter how many callers ask.
+    """
+    content_hash = dataframe_fingerprint(df)
+    profiles = {}
+    for col in df.columns:
+        key = (table_name, col, content_hash, sample_size)
+        cached = _PROFILE_CACHE.get(key)
+        if cached is None:
+            cached = profile_column(df[col], str(col), sample_size=sample_size)
+            _PROFILE_CACHE[key] = cached
+            while len(_PROFILE_CACHE) > PROFILE_CACHE_MAX_ENTRIES:
+                _PROFILE_CACHE.popitem(last=False)
+        else:
+            _PROFILE_CACHE.move_to_end(key)
+        profiles[col] = cached
+    return profiles
@@ -0,0 +1,118 @@
+import ast
+import re
+from typing import Iterable, List, Optional
+
+import pandas as pd
+
+
+# row["col"] / row['col'] (the only way transform code and expressions read columns)
+_ROW_REF_RE = re.compile(r"""\brow\s*\[\s*(?:"((?:[^"\\]|\\.)*)"|'((?:[^'\\]|\\.)*)')\s*\]""")
+
+
+def referenced_columns(text: Optional[str]) -> List[str]:
+    """Column names read as row["..."] in an expression or code, in order of first use."""
+    if not text:
+        return []
+    seen = []
+    for double, single in _ROW_REF_RE.findall(text):
+        col = double or single
+        if col not in seen:
+            seen.append(col)
+    return seen
+
+
+def mapping_columns(mapping_df: pd.DataFrame, available: Optional[Iterable[str]] = None) -> List[str]:
+    """
+    Merged-table columns a mapping uses: source columns plus row["..."]
+    references in expressions. Restricted to `available` when given.
+    """
+    cols = []
+    for _, row in mapping_df.iterrows():
+        source = row.get("source_column")
+        if isinstance(source, str) and source and source not in cols:
+            cols.append(source)
+        expr = row.get("expression")
+        for col in referenced_columns(expr if isinstance(expr, str) else None):
+            if col not in cols:
+                cols.append(col)
+    if available is not None:
+        available = set(available)
+        cols = [c for c in cols if c in available]
+    return cols
+
+
+def _name_refs(tree: ast.AST, var: str, allowed_attrs: Iterable[str] = ()) -> Optional[List[str]]:
+    """
+    Constant column names read from `var` in tree (var["c"], var.get("c")),
+    or None if var is used any other way (passed on, iterated, var[x], ...),
+    since then the columns it reads cannot be known statically.
+    """
+    allowed_attrs = set(allowed_attrs)
+    parents = {}
+    for node in ast.walk(tree):
+        for child in ast.iter_child_nodes(node):
+            parents[child] = node
+
+    cols = []
+    for node in ast.walk(tree):
+        if not (isinstance(node, ast.Name) and node.id == var and isinstance(node.ctx, ast.Load)):
+            continue
+        parent = parents.get(node)
+        col = None
+        if isinstance(parent, ast.Subscript) and parent.value is node:
+            if isinstance(parent.slice, ast.Constant) and isinstance(parent.slice.value, str):
+                col = parent.slice.value
+        elif isinstance(parent, ast.Attribute) and parent.value is node:
+            call = parents.get(parent)
+            if (
+                parent.attr == "get"
+                and isinstance(call, ast.Call)
+                and call.func is parent
+                and call.args
+                and isinstance(call.args[0], ast.Constant)
+                and isinstance(call.args[0].value, str)
+            ):
+                col = call.args[0].value
+            elif parent.attr in allowed_attrs:
+                continue
+        elif (
+            isinstance(parent, ast.Call)
+            and isinstance(parent.func, ast.Name)
+            and parent.func.id == "len"
+            and "__len__" in allowed_attrs
+        ):
+            continue
+        if col is None:
+            return None
+        if col not in cols:
+            cols.append(col)
+    return cols
+
+
+def code_column_refs(code: str, func_name: str = "transform") -> Optional[List[str]]:
+    """
+    Columns func_name(row) / func_name(df) in code reads from its argument,
+    or None when that cannot be determined (syntax error, function missing,
+    dynamic access such as row[name] or passing the row to a helper).
+    DataFrame arguments may also use .index and len(df).
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef) and node.name == func_name and node.args.args:
+            var = node.args.args[0].arg
+            return _name_refs(node, var, allowed_attrs=("index", "__len__"))
+    return None
+
+
+def expression_column_refs(expr: Optional[str]) -> Optional[List[str]]:
+    """Like code_column_refs, for one mapping expression over `row`."""
+    if not expr:
+        return []
+    try:
+        tree = ast.parse(expr, mode="eval")
+    except SyntaxError:
+        return None
+    return _name_refs(tree, "row")
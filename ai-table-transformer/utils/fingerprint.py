@@ -0,0 +1,55 @@
+import hashlib
+import weakref
+import numpy as np
+import pandas as pd
+
+
+# id(df) -> (weakref to df, fingerprint). Frames are treated as read-only
+# once loaded, so a frame is hashed at most once while it is alive.
+_FINGERPRINTS = {}
+
+
+def _forget(key: int):
+    _FINGERPRINTS.pop(key, None)
+
+
+def dataframe_fingerprint(df: pd.DataFrame) -> str:
+    """
+    Content hash of a DataFrame (column names, dtypes and values).
+    Memoized per object; do not mutate a frame after fingerprinting it.
+    """
+    key = id(df)
+    entry = _FINGERPRINTS.get(key)
+    if entry is not None and entry[0]() is df:
+        return entry[1]
+
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr([str(c) for c in df.columns]).encode("utf-8"))
+    h.update(repr([str(t) for t in df.dtypes]).encode("utf-8"))
+    try:
+        values = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    except TypeError:
+        # unhashable cells (lists, dicts): hash their text form instead
+        values = pd.util.hash_pandas_object(df.astype(str), index=False).to_numpy()
+    h.update(values.tobytes())
+    fingerprint = h.hexdigest()
+
+    _FINGERPRINTS[key] = (weakref.ref(df, lambda _, k=key: _forget(k)), fingerprint)
+    return fingerprint
+
+
+def estimate_memory_bytes(df: pd.DataFrame, sample_rows: int = 1000) -> int:
+    """
+    Cheap estimate of df's memory footprint. Object columns are measured
+    deeply on a sample only, instead of walking every Python object.
+    """
+    total = 0
+    n = len(df)
+    for i in range(df.shape[1]):
+        s = df.iloc[:, i]
+        if s.dtype == object and n > sample_rows:
+            sample = s.iloc[np.linspace(0, n - 1, sample_rows).astype(int)]
+            total += int(sample.memory_usage(deep=True, index=False) / sample_rows * n)
+        else:
+            total += int(s.memory_usage(deep=True, index=False))
+    return total
@@ -0,0 +1,289 @@
+import functools
+import inspect
+import io
+import json
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+
+import pandas as pd
+
+
+# Records kept in memory across all runs (oldest dropped first).
+MAX_RECORDS = 20_000
+
+_RECORDS = deque(maxlen=MAX_RECORDS)
+_RECORDS_LOCK = threading.Lock()
+# Per thread: current run id and the stack of open stages.
+_LOCAL = threading.local()
+# Open stage frames of every thread: {thread id: [frame, ...]}. tracemalloc's
+# peak is process-wide, so a stage that overlaps one on another thread
+# cannot tell its own peak apart and records none.
+_OPEN = {}
+_OPEN_LOCK = threading.Lock()
+
+
+def _rss_fields() -> dict:
+    """{"rss_bytes": RSS now} with psutil, else {"peak_rss_bytes": process peak RSS}, else {}."""
+    try:
+        import psutil
+
+        return {"rss_bytes": int(psutil.Process().memory_info().rss)}
+    except ImportError:
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows without psutil
+        return {}
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {"peak_rss_bytes": int(peak if sys.platform == "darwin" else peak * 1024)}  # bytes on macOS, KiB on Linux
+
+
+def start_run(run_id: Optional[str] = None, trace_memory: Optional[bool] = None) -> str:
+    """
+    Make run_id (a new id when None) the current run of this thread; stages
+    recorded on this thread are tagged with it. trace_memory=True turns on
+    tracemalloc so stages record their Python-allocation peak, False turns
+    it off, None leaves it as is (it is process-wide and slow).
+    """
+    _LOCAL.run_id = run_id or uuid.uuid4().hex[:12]
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif trace_memory is False and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    return _LOCAL.run_id
+
+
+def current_run() -> Optional[str]:
+    return getattr(_LOCAL, "run_id", None)
+
+
+def bind_run(fn: Callable) -> Callable:
+    """
+    fn wrapped to run under the calling thread's current run, for handing to
+    worker threads (which start without one): stages it records are tagged
+    with that run instead of None.
+    """
+    run_id = current_run()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        previous = current_run()
+        _LOCAL.run_id = run_id
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _LOCAL.run_id = previous
+
+    return wrapper
+
+
+@contextmanager
+def stage(name: str, rows_in: Optional[int] = None, **fields):
+    """
+    Record one stage: wall time, RSS (or peak RSS) after it, rows_in and
+    any extra fields, plus the tracemalloc peak when tracing and no stage
+    was open on another thread meanwhile. Yields the record so the body can
+    add rows_out or other fields. Exceptions are recorded and re-raised.
+    """
+    stack = getattr(_LOCAL, "stack", None)
+    if stack is None:
+        stack = _LOCAL.stack = []
+    record = {"run_id": current_run(), "stage": name, "started_at": time.time(), "rows_in": rows_in, **fields}
+    tracing = tracemalloc.is_tracing()
+    frame = {"child_peak": 0, "concurrent": False}
+    with _OPEN_LOCK:
+        thread = threading.get_ident()
+        if any(frames for t, frames in _OPEN.items() if t != thread):
+            for frames in _OPEN.values():
+                for f in frames:
+                    f["concurrent"] = True
+            frame["concurrent"] = True
+        _OPEN[thread] = stack
+        stack.append(frame)
+    if tracing:
+        frame["start"] = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    started = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record["seconds"] = time.perf_counter() - started
+        with _OPEN_LOCK:
+            stack.pop()
+            if not stack:
+                _OPEN.pop(threading.get_ident(), None)
+        if tracing and tracemalloc.is_tracing():
+            # A nested stage resets the peak, so fold in what it saw.
+            peak = max(tracemalloc.get_traced_memory()[1], frame["child_peak"])
+            if not frame["concurrent"]:
+                record["tracemalloc_peak_bytes"] = peak - frame["start"]
+            if stack:
+                stack[-1]["child_peak"] = max(stack[-1]["child_peak"], peak)
+        record.update(_rss_fields())
+        with _RECORDS_LOCK:
+            _RECORDS.append(record)
+
+
+def instrumented(
+    name: str,
+    rows_in: Optional[Callable[[dict], Optional[int]]] = None,
+    rows_out: Optional[Callable[[object], Optional[int]]] = None,
+):
+    """
+    Decorator recording each call as a stage. rows_in gets the call's bound
+    arguments ({param: value}); rows_out gets the return value.
+    """
+
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            n_in = None
+            if rows_in is not None:
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                n_in = rows_in(bound.arguments)
+            with stage(name, rows_in=n_in) as record:
+                result = fn(*args, **kwargs)
+                if rows_out is not None:
+                    record["rows_out"] = rows_out(result)
+                return result
+
+        return wrapper
+
+    return decorator
+
+
+def frame_rows(value) -> Optional[int]:
+    """len() of a DataFrame, or of the DataFrame in a (df, ...) result tuple."""
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    return len(value) if isinstance(value, pd.DataFrame) else None
+
+
+def run_records(run_id: Optional[str] = None) -> List[dict]:
+    """Records of one run (all runs when None), oldest first."""
+    with _RECORDS_LOCK:
+        records = list(_RECORDS)
+    if run_id is None:
+        return records
+    return [r for r in records if r["run_id"] == run_id]
+
+
+def run_report(run_id: Optional[str] = None) -> pd.DataFrame:
+    """Per-stage summary: calls, errors, total / max seconds, rows, peak memory."""
+    records = run_records(run_id)
+    if not records:
+        return pd.DataFrame()
+    df = pd.DataFrame(records)
+    for col in ("rows_out", "tracemalloc_peak_bytes", "rss_bytes", "peak_rss_bytes", "error"):
+        if col not in df:
+            df[col] = None
+    grouped = df.groupby("stage", sort=False)
+    return pd.DataFrame(
+        {
+            "calls": grouped.size(),
+            "errors": grouped["error"].count(),
+            "seconds": grouped["seconds"].sum(),
+            "max_seconds": grouped["seconds"].max(),
+            "rows_in": grouped["rows_in"].sum(min_count=1),
+            "rows_out": grouped["rows_out"].sum(min_count=1),
+            "peak_traced_mb": grouped["tracemalloc_peak_bytes"].max() / 1e6,
+            "rss_mb": grouped["rss_bytes"].max() / 1e6,
+            "peak_rss_mb": grouped["peak_rss_bytes"].max() / 1e6,
+        }
+    )
+
+
+def records_jsonl(run_id: Optional[str] = None) -> str:
+    return "".join(json.dumps(r, default=str) + "\n" for r in run_records(run_id))
+
+
+def export_jsonl(path: str, run_id: Optional[str] = None) -> int:
+    """Append the run's records to path as JSON lines; returns how many."""
+    records = run_records(run_id)
+    with open(path, "a", encoding="utf-8") as f:
+        for r in records:
+            f.write(json.dumps(r, default=str) + "\n")
+    return len(records)
+
+
+def clear_records(run_id: Optional[str] = None):
+    with _RECORDS_LOCK:
+        kept = [] if run_id is None else [r for r in _RECORDS if r["run_id"] != run_id]
+        _RECORDS.clear()
+        _RECORDS.extend(kept)
+
+
+def start_profile(kind: str = "cprofile"):
+    """
+    Start profiling this thread: kind 'cprofile' (stdlib) or 'pyinstrument'
+    (pip install pyinstrument). Pass the returned handle to stop_profile.
+    """
+    if kind == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError as e:
+            raise RuntimeError("pyinstrument profiling requires `pip install pyinstrument`.") from e
+        profiler = Profiler()
+        profiler.start()
+        return kind, profiler
+    if kind != "cprofile":
+        raise ValueError(f"Unknown profiler: {kind}")
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return kind, profiler
+
+
+def stop_profile(handle, path: Optional[str] = None, top: int = 30) -> str:
+    """
+    Stop a profiler from start_profile and return a text report (cProfile:
+    the top functions by cumulative time). With path, the raw profile
+    (.prof for cProfile, .html for pyinstrument) is written there too.
+    """
+    kind, profiler = handle
+    if kind == "pyinstrument":
+        profiler.stop()
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(profiler.output_html())
+        return profiler.output_text()
+
+    import pstats
+
+    profiler.disable()
+    if path:
+        profiler.dump_stats(path)
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(top)
+    return out.getvalue()
+
+
+@contextmanager
+def profiled(kind: Optional[str] = "cprofile", path: Optional[str] = None, report: Optional[dict] = None):
+    """
+    Profile the body when kind is set (a no-op for kind=None); the text
+    report is stored in report["profile"] when a dict is passed.
+    """
+    if not kind:
+        yield
+        return
+    handle = start_profile(kind)
+    try:
+        yield
+    finally:
+        text = stop_profile(handle, path=path)
+        if report is not None:
+            report["profile"] = text
@@ -1,3 +1,8 @@
+import numpy as np
+from functools import lru_cache
+from typing import Dict, Sequence
+
+
 def levenshtein(a: str, b: str) -> int:
     """Simple Levenshtein distance."""
     a, b = a or "", b or ""
@@ -18,12 +23,94 @@ def levenshtein(a: str, b: str) -> int:
     return v0[len(b)]
 
 
+@lru_cache(maxsize=65536)
+def _normalize(name) -> str:
+    return str(name).lower() if name else ""
+
+
 def name_similarity(a: str, b: str) -> float:
     """Normalized similarity between two column names."""
     if not a and not b:
         return 1.0
-    a = (a or "").lower()
-    b = (b or "").lower()
+    a = _normalize(a)
+    b = _normalize(b)
     dist = levenshtein(a, b)
     max_len = max(len(a), len(b), 1)
     return 1.0 - dist / max_len
+
+
+def _myers_distances(pattern: str, codes: np.ndarray, lens: np.ndarray, char_ids: Dict[str, int]) -> np.ndarray:
+    """
+    Levenshtein distance from pattern (1..64 chars) to many texts at once,
+    using Myers' bit-parallel algorithm vectorized over the texts.
+    codes is a (n_texts, max_len) array of character ids, lens the lengths.
+    """
+    m = len(pattern)
+    mask = np.uint64((1 << m) - 1)
+    high = np.uint64(1 << (m - 1))
+    one = np.uint64(1)
+
+    # peq[c] has bit i set where pattern[i] == c; the padding id maps to 0
+    peq = np.zeros(len(char_ids) + 1, dtype=np.uint64)
+    for i, ch in enumerate(pattern):
+        peq[char_ids[ch]] |= np.uint64(1 << i)
+
+    n = codes.shape[0]
+    pv = np.full(n, mask, dtype=np.uint64)
+    mv = np.zeros(n, dtype=np.uint64)
+    score = np.full(n, m, dtype=np.int64)
+
+    for j in range(codes.shape[1]):
+        active = lens > j
+        eq = peq[codes[:, j]]
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
+        score += (active & ((ph & high) != 0)).astype(np.int64)
+        score -= (active & ((mh & high) != 0)).astype(np.int64)
+        ph = (ph << one) | one
+        mh = mh << one
+        pv = np.where(active, (mh | ~(xv | ph)) & mask, pv)
+        mv = np.where(active, (ph & xv) & mask, mv)
+    return score
+
+
+def similarity_matrix(names_a: Sequence[str], names_b: Sequence[str]) -> np.ndarray:
+    """
+    Matrix of name_similarity(a, b) for every a in names_a, b in names_b,
+    shape (len(names_a), len(names_b)). Distances are computed with a
+    bit-parallel Levenshtein vectorized over names_b, one row per distinct
+    normalized name in names_a; scores equal name_similarity's.
+    """
+    norm_a = [_normalize(a) for a in names_a]
+    norm_b = [_normalize(b) for b in names_b]
+    result = np.zeros((len(norm_a), len(norm_b)), dtype=np.float64)
+    if not norm_a or not norm_b:
+        return result
+
+    char_ids = {}
+    for s in list(norm_a) + norm_b:
+        for ch in s:
+            char_ids.setdefault(ch, len(char_ids))
+    pad = len(char_ids)
+
+    lens_b = np.array([len(b) for b in norm_b], dtype=np.int64)
+    codes = np.full((len(norm_b), max(int(lens_b.max()), 1)), pad, dtype=np.intp)
+    for i, b in enumerate(norm_b):
+        codes[i, : len(b)] = [char_ids[ch] for ch in b]
+
+    rows: Dict[str, np.ndarray] = {}
+    for a in dict.fromkeys(norm_a):
+        if not a:
+            dist = lens_b
+        elif len(a) <= 64:
+            dist = _myers_distances(a, codes, lens_b, char_ids)
+        else:
+            dist = np.array([levenshtein(a, b) for b in norm_b], dtype=np.int64)
+        max_len = np.maximum(np.maximum(lens_b, len(a)), 1)
+        rows[a] = 1.0 - dist / max_len
+
+    for i, a in enumerate(norm_a):
+        result[i] = rows[a]
+    return result